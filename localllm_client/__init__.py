@@ -1,2 +1,5 @@
 # Python client SDK for localLLM QA Inference API.
 __version__ = "0.1.0"
+
+from localllm_client.client import (AsyncLocalLLMClient,  # noqa: E402
+                                    LocalLLMClient)
@@ -1,15 +1,258 @@
 #!/usr/bin/env python3
 """
-Simple CLI client for the QA inference API.
+Python SDK and CLI client for the QA inference API.
 """
 import argparse
+import asyncio
 import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from localllm_client import __version__
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# statuses worth retrying: rate limited, or the server's admission control
+RETRY_STATUSES = (429, 503)
+
+
+def retry_delay(headers, attempt: int, backoff: float) -> float:
+    """Delay before retry ``attempt``: ``Retry-After`` if set, else exponential."""
+    retry_after = headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+    return backoff * 2**attempt
+
+
+def chunked(items: List[str], size: int) -> List[List[str]]:
+    return [items[i : i + size] for i in range(0, len(items), size)] or [[]]
+
+
+def _parse_sse(line: str) -> Optional[str]:
+    """Token carried by one SSE line, or None for blank, ``done`` and other lines."""
+    if not line or not line.startswith("data:"):
+        return None
+    event = json.loads(line[len("data:") :])
+    if "error" in event:
+        raise RuntimeError(event["error"])
+    return event.get("token")
+
+
+class LocalLLMClient:
+    """
+    Client for the inference API over one pooled ``requests.Session``.
+
+    Requests answered with 429/503 are retried up to ``max_retries`` times,
+    honoring ``Retry-After`` and otherwise backing off exponentially from
+    ``backoff`` seconds. ``predict_batch`` splits large inputs into
+    ``chunk_size`` questions and sends up to ``max_concurrency`` chunks at once.
+    """
+
+    def __init__(
+        self,
+        url: str = "http://localhost:8000",
+        api_key: Optional[str] = None,
+        timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        chunk_size: int = 32,
+        max_concurrency: int = 4,
+    ):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_concurrency, pool_maxsize=max_concurrency
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["X-API-Key"] = api_key
+
+    def post(self, path: str, payload: dict, timeout: Optional[float] = None, **kwargs):
+        """POST ``payload`` to ``path`` with retries; raises ``HTTPError`` on failure."""
+        for attempt in range(self.max_retries + 1):
+            resp = self.session.post(
+                f"{self.url}/{path.lstrip('/')}",
+                json=payload,
+                timeout=timeout or self.timeout,
+                **kwargs,
+            )
+            if resp.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+            resp.close()
+            time.sleep(retry_delay(resp.headers, attempt, self.backoff))
+        resp.raise_for_status()
+        return resp
+
+    def predict(
+        self, question: str, max_length: int = 512, timeout: Optional[float] = None
+    ) -> str:
+        payload = {"question": question, "max_length": max_length}
+        return self.post("/predict", payload, timeout).json()["answer"]
+
+    def predict_batch(
+        self,
+        questions: List[str],
+        max_length: int = 512,
+        timeout: Optional[float] = None,
+    ) -> List[str]:
+        """Answer ``questions`` in order, sending chunks concurrently."""
+
+        def run(chunk):
+            payload = {"questions": chunk, "max_length": max_length}
+            return self.post("/predict_batch", payload, timeout).json()["answers"]
+
+        chunks = chunked(questions, self.chunk_size)
+        if len(chunks) == 1:
+            return run(chunks[0])
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            results = list(pool.map(run, chunks))
+        return [answer for answers in results for answer in answers]
+
+    def stream(
+        self, question: str, max_length: int = 512, timeout: Optional[float] = None
+    ) -> Iterator[str]:
+        """Yield answer tokens from ``/predict_stream`` as they arrive."""
+        payload = {"question": question, "max_length": max_length}
+        resp = self.post("/predict_stream", payload, timeout, stream=True)
+        with resp:
+            for line in resp.iter_lines(decode_unicode=True):
+                token = _parse_sse(line)
+                if token is not None:
+                    yield token
+
+    def health(self, timeout: Optional[float] = None) -> dict:
+        resp = self.session.get(f"{self.url}/health", timeout=timeout or self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncLocalLLMClient:
+    """
+    asyncio counterpart of ``LocalLLMClient`` on a pooled ``httpx.AsyncClient``.
+
+    Retries raise ``httpx.HTTPStatusError`` once exhausted; ``predict_batch``
+    keeps at most ``max_concurrency`` chunk requests in flight. ``transport``
+    is passed through to httpx (e.g. a mock transport in tests).
+    """
+
+    def __init__(
+        self,
+        url: str = "http://localhost:8000",
+        api_key: Optional[str] = None,
+        timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        chunk_size: int = 32,
+        max_concurrency: int = 4,
+        transport=None,
+    ):
+        if httpx is None:
+            raise RuntimeError("AsyncLocalLLMClient requires httpx to be installed.")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        headers = {"X-API-Key": api_key} if api_key else {}
+        self.client = httpx.AsyncClient(
+            base_url=url.rstrip("/"),
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency),
+            transport=transport,
+        )
+
+    async def post(self, path: str, payload: dict, timeout: Optional[float] = None):
+        kwargs = {"timeout": timeout} if timeout else {}
+        for attempt in range(self.max_retries + 1):
+            resp = await self.client.post(path, json=payload, **kwargs)
+            if resp.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                break
+            await asyncio.sleep(retry_delay(resp.headers, attempt, self.backoff))
+        resp.raise_for_status()
+        return resp
+
+    async def predict(
+        self, question: str, max_length: int = 512, timeout: Optional[float] = None
+    ) -> str:
+        payload = {"question": question, "max_length": max_length}
+        return (await self.post("/predict", payload, timeout)).json()["answer"]
+
+    async def predict_batch(
+        self,
+        questions: List[str],
+        max_length: int = 512,
+        timeout: Optional[float] = None,
+    ) -> List[str]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(chunk):
+            async with semaphore:
+                payload = {"questions": chunk, "max_length": max_length}
+                resp = await self.post("/predict_batch", payload, timeout)
+                return resp.json()["answers"]
+
+        chunks = chunked(questions, self.chunk_size)
+        results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+        return [answer for answers in results for answer in answers]
+
+    async def health(self) -> dict:
+        resp = await self.client.get("/health")
+        resp.raise_for_status()
+        return resp.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+def stream_question(client: LocalLLMClient, question: str, max_length: int):
+    """
+    Print tokens from the /predict_stream SSE endpoint as they arrive.
+
+    Returns the client-side time to first token in milliseconds (None if no
+    token was received).
+    """
+    start = time.perf_counter()
+    ttft_ms = None
+    for token in client.stream(question, max_length):
+        if ttft_ms is None:
+            ttft_ms = (time.perf_counter() - start) * 1000
+        print(token, end="", flush=True)
+    print()
+    return ttft_ms
+
 
 def main():
     parser = argparse.ArgumentParser(description="Client for QA Inference API")
@@ -39,28 +282,64 @@ def main():
         default=512,
         help="Maximum generation length",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream tokens for --question as they are generated",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=60.0, help="Per-request timeout in seconds"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="Retries for requests answered with 429/503",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=32,
+        help="Questions per /predict_batch request for --batch-file",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Concurrent /predict_batch requests for --batch-file",
+    )
     args = parser.parse_args()
+    if args.stream and not args.question:
+        parser.error("--stream requires --question")
 
-    headers = {}
-    if args.api_key:
-        headers["X-API-Key"] = args.api_key
-
-    if args.question:
-        payload = {"question": args.question, "max_length": args.max_length}
-        endpoint = f"{args.url.rstrip('/')}/predict"
-    else:
+    client = LocalLLMClient(
+        args.url,
+        api_key=args.api_key,
+        timeout=args.timeout,
+        max_retries=args.retries,
+        chunk_size=args.chunk_size,
+        max_concurrency=args.concurrency,
+    )
+    with client:
+        if args.stream:
+            ttft_ms = stream_question(client, args.question, args.max_length)
+            if ttft_ms is not None:
+                print(f"Time to first token: {ttft_ms:.1f} ms", file=sys.stderr)
+            return
+        if args.question:
+            payload = {"question": args.question, "max_length": args.max_length}
+            resp = client.post("/predict", payload)
+            try:
+                data = resp.json()
+                print(json.dumps(data))
+            except ValueError:
+                print(resp.text)
+            return
         with open(args.batch_file, encoding="utf8") as f:
             payload = json.load(f)
-        payload.setdefault("max_length", args.max_length)
-        endpoint = f"{args.url.rstrip('/')}/predict_batch"
-
-    resp = requests.post(endpoint, json=payload, headers=headers)
-    resp.raise_for_status()
-    try:
-        data = resp.json()
-        print(json.dumps(data))
-    except ValueError:
-        print(resp.text)
+        max_length = payload.get("max_length", args.max_length)
+        answers = client.predict_batch(payload["questions"], max_length)
+        print(json.dumps({"answers": answers}))
 
 
 if __name__ == "__main__":
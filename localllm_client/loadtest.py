@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Load generator for the QA inference API.
+
+Drives /predict or /predict_batch either closed-loop (a fixed number of
+clients, each sending its next request as soon as the last one returns) or
+open-loop at a target request rate, and reports latency percentiles, error
+rates and achieved throughput.
+"""
+import argparse
+import itertools
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from localllm_client import __version__
+from localllm_client.client import LocalLLMClient
+
+
+def load_questions(path: str):
+    """
+    Read questions from a JSONL file of ``{"question": ...}`` records (such as
+    ``data/clean/combined.jsonl``) or a JSON file with ``{"questions": [...]}``
+    or ``{"prompts": [...]}``.
+    """
+    with open(path, encoding="utf8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line)["question"] for line in f if line.strip()]
+        data = json.load(f)
+    return data.get("questions") or data.get("prompts") or []
+
+
+def percentile(sorted_values, q: float):
+    """Linearly interpolated ``q``-th percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    pos = (len(sorted_values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+class LoadStats:
+    """Thread-safe record of request latencies and outcomes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.errors = Counter()
+        self.questions = 0
+        self.start = time.perf_counter()
+        self.end = None
+
+    def record(self, seconds: float, status, num_questions: int):
+        with self._lock:
+            if status == 200:
+                self.latencies.append(seconds)
+                self.questions += num_questions
+            else:
+                self.errors[str(status)] += 1
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    def summary(self) -> dict:
+        elapsed = (self.end or time.perf_counter()) - self.start
+        latencies = sorted(self.latencies)
+        total = len(latencies) + sum(self.errors.values())
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            "requests": total,
+            "succeeded": len(latencies),
+            "errors": dict(self.errors),
+            "error_rate": sum(self.errors.values()) / total if total else 0.0,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+            "questions_per_sec": self.questions / elapsed if elapsed else 0.0,
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p90_ms": ms(percentile(latencies, 90)),
+            "p99_ms": ms(percentile(latencies, 99)),
+            "max_ms": ms(latencies[-1] if latencies else None),
+        }
+
+
+class LoadGenerator:
+    """
+    Send requests built from ``questions`` to ``{url}/{endpoint}`` through
+    ``LocalLLMClient`` with retries disabled.
+
+    Questions are used in order and wrap around; ``/predict_batch`` requests
+    carry ``batch_size`` questions each.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        questions,
+        endpoint: str = "predict",
+        batch_size: int = 1,
+        max_length: int = 128,
+        api_key: str = None,
+        timeout: float = 60.0,
+    ):
+        if not questions:
+            raise ValueError("no questions to send")
+        self.url = url
+        self.path = f"/{endpoint}"
+        self.batch = endpoint == "predict_batch"
+        self.questions = questions
+        self.batch_size = batch_size if self.batch else 1
+        self.max_length = max_length
+        self.api_key = api_key
+        self.timeout = timeout
+        self._tickets = itertools.count()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _client(self) -> LocalLLMClient:
+        # one client per sending thread; retries would hide the errors we count
+        if not hasattr(self._local, "client"):
+            self._local.client = LocalLLMClient(
+                self.url, api_key=self.api_key, timeout=self.timeout, max_retries=0
+            )
+        return self._local.client
+
+    def _next_ticket(self) -> int:
+        with self._lock:
+            return next(self._tickets)
+
+    def _payload(self, ticket: int) -> dict:
+        start = ticket * self.batch_size
+        picked = [
+            self.questions[(start + i) % len(self.questions)]
+            for i in range(self.batch_size)
+        ]
+        if self.batch:
+            return {"questions": picked, "max_length": self.max_length}
+        return {"question": picked[0], "max_length": self.max_length}
+
+    def send(self, ticket: int, stats: LoadStats, scheduled: float = None):
+        """
+        Send one request and record it. Open-loop callers pass the time the
+        request was due, so queueing delay in the generator counts as latency.
+        """
+        start = scheduled if scheduled is not None else time.perf_counter()
+        try:
+            status = self._client().post(self.path, self._payload(ticket)).status_code
+        except requests.HTTPError as exc:
+            status = exc.response.status_code
+        except requests.RequestException as exc:
+            status = type(exc).__name__
+        stats.record(time.perf_counter() - start, status, self.batch_size)
+
+    def run_closed_loop(
+        self, concurrency: int, num_requests: int = None, duration: float = None
+    ) -> LoadStats:
+        """Keep ``concurrency`` requests in flight until the budget runs out."""
+        stats = LoadStats()
+        deadline = stats.start + duration if duration else None
+
+        def client():
+            while True:
+                ticket = self._next_ticket()
+                if num_requests is not None and ticket >= num_requests:
+                    return
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                self.send(ticket, stats)
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats.finish()
+        return stats
+
+    def run_open_loop(
+        self,
+        rate: float,
+        num_requests: int = None,
+        duration: float = None,
+        max_in_flight: int = 64,
+    ) -> LoadStats:
+        """Start ``rate`` requests per second, however fast they complete."""
+        stats = LoadStats()
+        interval = 1.0 / rate
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            for ticket in itertools.count():
+                scheduled = stats.start + ticket * interval
+                if num_requests is not None and ticket >= num_requests:
+                    break
+                if duration is not None and scheduled - stats.start >= duration:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send, ticket, stats, scheduled)
+        stats.finish()
+        return stats
+
+
+class StubTokenizer:
+    """Tokenizer stand-in for ``--stub``: one token per question."""
+
+    def __call__(self, questions, **kwargs):
+        ids = [[1] for _ in questions]
+        return argparse.Namespace(input_ids=ids, attention_mask=ids)
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "stub answer"
+
+
+class StubModel:
+    """Model stand-in for ``--stub`` whose ``generate`` just sleeps."""
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    def generate(self, input_ids, attention_mask=None, max_length=None):
+        time.sleep(self.latency_s)
+        return input_ids
+
+
+def start_stub_server(latency_ms: float = 20.0):
+    """
+    Serve the real inference app on a free local port with a stub model, to
+    measure the HTTP/serving overhead without a checkpoint. Needs the repo's
+    ``scripts`` package and uvicorn. Returns ``(server, base_url)``.
+    """
+    import uvicorn
+
+    from scripts import run_inference_api as api
+
+    api.tokenizer = StubTokenizer()
+    api.model = StubModel(latency_ms / 1000)
+    api.model_id = "stub"
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the QA Inference API")
+    parser.add_argument(
+        "--version",
+        action="version",
+        version=__version__,
+        help="Show client version and exit",
+    )
+    parser.add_argument(
+        "--url", default="http://localhost:8000", help="Base URL of the inference API"
+    )
+    parser.add_argument(
+        "--api-key",
+        default=os.environ.get("API_KEY"),
+        help="API key for authentication",
+    )
+    parser.add_argument(
+        "--endpoint",
+        choices=["predict", "predict_batch"],
+        default="predict",
+        help="Endpoint to drive",
+    )
+    parser.add_argument(
+        "--questions",
+        default="data/clean/combined.jsonl",
+        help="JSONL of {'question': ...} records, or JSON with {'questions': [...]}",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Questions per /predict_batch request",
+    )
+    parser.add_argument(
+        "--max-length", type=int, default=128, help="Maximum generation length"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Concurrent clients (closed loop) or max requests in flight (open loop)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Target requests/sec; switches to an open-loop schedule",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=None, help="Total requests to send"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=None, help="Seconds to run for"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=60.0, help="Per-request timeout in seconds"
+    )
+    parser.add_argument(
+        "--stub",
+        action="store_true",
+        help="Start a local server with a stub model and test it instead of --url",
+    )
+    parser.add_argument(
+        "--stub-latency-ms",
+        type=float,
+        default=20.0,
+        help="Simulated generate time of the --stub model",
+    )
+    parser.add_argument("--output", help="Write the JSON summary to this path")
+    args = parser.parse_args()
+    if args.requests is None and args.duration is None:
+        args.requests = 100
+
+    questions = load_questions(args.questions)
+    url = args.url
+    server = None
+    if args.stub:
+        server, url = start_stub_server(args.stub_latency_ms)
+    generator = LoadGenerator(
+        url,
+        questions,
+        endpoint=args.endpoint,
+        batch_size=args.batch_size,
+        max_length=args.max_length,
+        api_key=args.api_key,
+        timeout=args.timeout,
+    )
+    try:
+        if args.rate:
+            stats = generator.run_open_loop(
+                args.rate, args.requests, args.duration, args.concurrency
+            )
+        else:
+            stats = generator.run_closed_loop(
+                args.concurrency, args.requests, args.duration
+            )
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+    summary = stats.summary()
+    summary.update(
+        endpoint=args.endpoint,
+        mode="open" if args.rate else "closed",
+        concurrency=args.concurrency,
+        target_rps=args.rate,
+    )
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(summary, f, indent=2)
+    if summary["errors"]:
+        print(f"{sum(summary['errors'].values())} requests failed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Benchmark clean_data throughput (input records/sec) across worker counts,
+and validate the fast HTML stripper against bleach.
+"""
+import argparse
+import csv
+import html
+import os
+import re
+import tempfile
+import time
+
+from scripts.clean_data import (STRIPPERS, clean_dataset, extract_qa,
+                                iter_records)
+
+
+def count_records(input_path: str) -> int:
+    with open(input_path, "r", encoding="utf8") as src:
+        return sum(1 for _ in iter_records(src))
+
+
+def iter_texts(input_path: str):
+    """Yield every question and answer of the records in ``input_path``."""
+    with open(input_path, "r", encoding="utf8") as src:
+        for rec in iter_records(src):
+            qa = extract_qa(rec)
+            if qa:
+                yield from qa
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def compare_strippers(texts, max_examples: int = 5) -> dict:
+    """
+    Check that the fast stripper matches bleach on ``texts`` and time both.
+
+    Outputs are compared after whitespace collapsing (as ``clean_text``
+    does) and after decoding the entities bleach leaves escaped.
+    """
+    texts = list(texts)
+    outputs, secs = {}, {}
+    for name in ("bleach", "fast"):
+        strip = STRIPPERS[name]
+        start = time.perf_counter()
+        outputs[name] = [strip(text) for text in texts]
+        secs[name] = time.perf_counter() - start
+    mismatches = []
+    for text, expected, actual in zip(texts, outputs["bleach"], outputs["fast"]):
+        expected = _normalize(html.unescape(expected))
+        if expected != _normalize(actual):
+            mismatches.append(
+                {"input": text, "bleach": expected, "fast": _normalize(actual)}
+            )
+    total = len(texts)
+    return {
+        "texts": total,
+        "matches": total - len(mismatches),
+        "match_rate": (total - len(mismatches)) / total if total else 1.0,
+        "bleach_texts_per_sec": round(total / secs["bleach"], 1) if total else 0.0,
+        "fast_texts_per_sec": round(total / secs["fast"], 1) if total else 0.0,
+        "speedup": round(secs["bleach"] / secs["fast"], 1) if total else 0.0,
+        "examples": mismatches[:max_examples],
+    }
+
+
+def benchmark_clean(
+    input_path: str,
+    workers_list,
+    min_tokens: int = 10,
+    max_tokens: int = 512,
+    chunk_size: int = 500,
+    stripper: str = "bleach",
+):
+    """Run ``clean_dataset`` once per worker count and report records/sec."""
+    total = count_records(input_path)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in workers_list:
+            output = os.path.join(tmp, f"clean_{workers}.jsonl")
+            start = time.perf_counter()
+            kept = clean_dataset(
+                input_path,
+                output,
+                min_tokens,
+                max_tokens,
+                workers=workers,
+                chunk_size=chunk_size,
+                stripper=stripper,
+            )
+            secs = time.perf_counter() - start
+            results.append(
+                {
+                    "workers": workers,
+                    "records": total,
+                    "kept": kept,
+                    "seconds": round(secs, 3),
+                    "records_per_sec": round(total / secs, 1),
+                    "speedup": (
+                        round(results[0]["seconds"] / secs, 2) if results else 1.0
+                    ),
+                }
+            )
+            print(
+                f"workers={workers}: {results[-1]['records_per_sec']} records/sec "
+                f"({results[-1]['speedup']}x)"
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark clean_data records/sec across worker counts"
+    )
+    parser.add_argument("--input", required=True, help="Input JSON or JSONL file path")
+    parser.add_argument(
+        "--workers",
+        default=f"1,2,4,{os.cpu_count()}",
+        help="Comma-separated worker counts to compare",
+    )
+    parser.add_argument(
+        "--min-tokens", type=int, default=10, help="Minimum token count per QA"
+    )
+    parser.add_argument(
+        "--max-tokens", type=int, default=512, help="Maximum token count per QA"
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=500, help="Records per worker task"
+    )
+    parser.add_argument(
+        "--stripper",
+        choices=sorted(STRIPPERS),
+        default="bleach",
+        help="HTML stripping backend used for the worker sweep",
+    )
+    parser.add_argument(
+        "--compare-strippers",
+        action="store_true",
+        help="Validate the fast stripper against bleach and compare throughput",
+    )
+    parser.add_argument("--output-csv", help="Optional CSV output path")
+    args = parser.parse_args()
+
+    if args.compare_strippers:
+        report = compare_strippers(iter_texts(args.input))
+        print(
+            f"fast matches bleach on {report['matches']}/{report['texts']} texts "
+            f"({report['match_rate']:.2%}); bleach "
+            f"{report['bleach_texts_per_sec']} texts/sec, fast "
+            f"{report['fast_texts_per_sec']} texts/sec ({report['speedup']}x)"
+        )
+        for example in report["examples"]:
+            print(f"  mismatch: {example}")
+        return
+
+    workers_list = sorted({int(w) for w in args.workers.split(",") if w})
+    results = benchmark_clean(
+        args.input,
+        workers_list,
+        args.min_tokens,
+        args.max_tokens,
+        args.chunk_size,
+        args.stripper,
+    )
+    if args.output_csv:
+        os.makedirs(os.path.dirname(args.output_csv) or ".", exist_ok=True)
+        with open(args.output_csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"Wrote benchmark results to {args.output_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark FAQ extraction on large synthetic pages: the original per-heading
+sibling scan against the single-pass parser with each HTML backend.
+"""
+import argparse
+import csv
+import functools
+import os
+import random
+import time
+
+from bs4 import BeautifulSoup
+
+from scripts.scrape_faqs import lxml, parse_faq_html
+
+LAYOUTS = ("headings", "dl", "details")
+
+
+def parse_faq_html_siblings(html: str):
+    """The original extraction: ``find_next_siblings`` per heading (quadratic)."""
+    soup = BeautifulSoup(html, "html.parser")
+    faqs = []
+    for header in soup.find_all(["h2", "h3"]):
+        question = header.get_text(strip=True)
+        answer_parts = []
+        for sib in header.find_next_siblings():
+            if sib.name in ["h2", "h3"]:
+                break
+            if sib.name == "p":
+                answer_parts.append(sib.get_text(strip=True))
+        if answer_parts:
+            faqs.append({"question": question, "answer": " ".join(answer_parts)})
+    return faqs
+
+
+def synthetic_faq_page(num_items: int, layout: str = "headings", seed: int = 0):
+    """An HTML page with ``num_items`` Q&A pairs in the given ``layout``."""
+    rng = random.Random(seed)
+    words = "pod node deploy service cluster volume ingress secret image".split()
+
+    def sentence():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(8, 20))) + "."
+
+    parts = ["<html><body><h1>FAQ</h1>"]
+    if layout == "dl":
+        parts.append("<dl>")
+    for i in range(num_items):
+        question = f"Question {i}: how do I {rng.choice(words)}?"
+        answers = [sentence() for _ in range(rng.randint(1, 3))]
+        if layout == "headings":
+            tag = "h2" if i % 4 == 0 else "h3"
+            parts.append(f"<{tag}>{question}</{tag}>")
+            parts += [f"<p>{a}</p>" for a in answers]
+            parts.append("<div>See also the docs.</div>")
+        elif layout == "dl":
+            parts.append(f"<dt>{question}</dt>")
+            parts += [f"<dd>{a}</dd>" for a in answers]
+        else:
+            body = "".join(f"<p>{a}</p>" for a in answers)
+            parts.append(f"<details><summary>{question}</summary>{body}</details>")
+    if layout == "dl":
+        parts.append("</dl>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def benchmark_parsers(sizes, layouts=LAYOUTS, repeat: int = 3):
+    """
+    Time each extractor on synthetic pages of ``sizes`` items, keeping the
+    best of ``repeat`` runs. The sibling baseline only understands headings.
+    Each row records whether the extractor's output matches the expected
+    pairs.
+    """
+    backends = ["html.parser"] + (["lxml"] if lxml is not None else [])
+    extractors = {
+        f"single-pass/{backend}": functools.partial(parse_faq_html, parser=backend)
+        for backend in backends
+    }
+    results = []
+    for layout in layouts:
+        runs = dict(extractors)
+        if layout == "headings":
+            runs = {"siblings/html.parser": parse_faq_html_siblings, **runs}
+        for size in sizes:
+            html = synthetic_faq_page(size, layout)
+            expected = parse_faq_html(html, "html.parser")
+            for name, extract in runs.items():
+                best = float("inf")
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    faqs = extract(html)
+                    best = min(best, time.perf_counter() - start)
+                results.append(
+                    {
+                        "layout": layout,
+                        "items": size,
+                        "page_kb": round(len(html) / 1024, 1),
+                        "extractor": name,
+                        "seconds": round(best, 4),
+                        "items_per_sec": round(size / best, 1),
+                        "matches": faqs == expected and len(faqs) == size,
+                    }
+                )
+                print(
+                    f"{layout:8s} {size:6d} items  {name:24s} "
+                    f"{best * 1000:9.1f} ms  matches={results[-1]['matches']}"
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark FAQ extraction on synthetic pages"
+    )
+    parser.add_argument(
+        "--sizes",
+        default="100,1000,5000",
+        help="Comma-separated Q&A pairs per synthetic page",
+    )
+    parser.add_argument(
+        "--layouts",
+        default=",".join(LAYOUTS),
+        help="Comma-separated page layouts to benchmark",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per timing")
+    parser.add_argument("--output-csv", help="Optional CSV output path")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    layouts = [name for name in args.layouts.split(",") if name]
+    results = benchmark_parsers(sizes, layouts, args.repeat)
+    if args.output_csv:
+        os.makedirs(os.path.dirname(args.output_csv) or ".", exist_ok=True)
+        with open(args.output_csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"Wrote benchmark results to {args.output_csv}")
+
+
+if __name__ == "__main__":
+    main()
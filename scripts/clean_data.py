@@ -3,20 +3,84 @@
 Clean raw QA data: normalize text, strip HTML, filter by length, and dedupe.
 """
 import argparse
+import hashlib
+import html
 import json
 import os
 import re
+import struct
 import unicodedata
-from typing import Optional, Tuple
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 
 import bleach
+from bleach.html5lib_shim import HTML_TAGS_BLOCK_LEVEL
 
+# characters read per chunk when streaming a JSON array
+READ_CHUNK = 1 << 16
+# decode errors this close to the end of the buffer may be a value cut off
+DECODE_TAIL = 16
+# records per task when cleaning on a process pool
+WORKER_CHUNK = 500
+# fields a record is deduplicated on
+DEDUP_KEYS = ("answer", "question+answer")
+# header of a persisted DigestSet: magic, digest bits, entry count
+INDEX_HEADER = struct.Struct("<4sBxxxQ")
+INDEX_MAGIC = b"QADS"
+# sidecar of a hash index listing content digests of the inputs it holds
+INDEX_INPUTS_SUFFIX = ".inputs.json"
 
-def clean_text(text: str) -> str:
+
+# comments, doctype/CDATA/processing instructions, and start/end tags (quoted
+# attribute values may contain ">"); unterminated tags are left as text
+TAG_RE = re.compile(
+    r"<!--.*?(?:-->|\Z)|<[!?][^>]*>"
+    r"|<(/?)([A-Za-z][^\s/>]*)(?:[^>\"']|\"[^\"]*\"|'[^']*')*>",
+    re.S,
+)
+
+
+def strip_html_bleach(text: str) -> str:
+    return bleach.clean(text, tags=[], strip=True)
+
+
+def strip_html_fast(text: str) -> str:
+    """
+    Drop tags with a single regex pass instead of building an html5lib tree.
+
+    Like bleach, block-level start tags after the first tag become newlines
+    and tag contents (including ``<code>``/``<pre>`` and script text) are
+    kept. Entities are decoded after the tags are removed, so escaped markup
+    inside code blocks (``&lt;none&gt;``) survives as literal text rather than
+    staying escaped as it does with bleach.
+    """
+    first = True
+
+    def replace(match):
+        nonlocal first
+        name = match.group(2)
+        if name is None:
+            # comments and declarations do not count as a preceding tag
+            return ""
+        block = (
+            not first and not match.group(1) and name.lower() in HTML_TAGS_BLOCK_LEVEL
+        )
+        first = False
+        return "\n" if block else ""
+
+    return html.unescape(TAG_RE.sub(replace, text))
+
+
+STRIPPERS = {"bleach": strip_html_bleach, "fast": strip_html_fast}
+
+
+def clean_text(text: str, stripper: str = "bleach") -> str:
     # Unicode normalization
     text = unicodedata.normalize("NFKC", text)
     # Strip HTML tags
-    text = bleach.clean(text, tags=[], strip=True)
+    text = STRIPPERS[stripper](text)
     # Collapse whitespace
     text = re.sub(r"\s+", " ", text).strip()
     # Remove non-UTF8 characters
@@ -33,46 +97,377 @@ def extract_qa(record: dict) -> Optional[Tuple[str, str]]:
     return None
 
 
+def iter_json_array(f, chunk_size: int = READ_CHUNK) -> Iterator:
+    """
+    Yield the elements of a top-level JSON array from a text file object,
+    reading ``chunk_size`` characters at a time so only one element (plus a
+    read buffer) is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    eof = False
+
+    def fill():
+        # grow reads with the buffer so a huge element is not re-parsed often
+        nonlocal buf, eof
+        chunk = f.read(max(chunk_size, len(buf)))
+        eof = not chunk
+        buf += chunk
+
+    while not buf.strip() and not eof:
+        fill()
+    buf = buf.lstrip()
+    if not buf.startswith("["):
+        raise ValueError("Expected a JSON array")
+    buf = buf[1:]
+    after_value = False
+    allow_close = True
+    while True:
+        buf = buf.lstrip()
+        while not buf:
+            if eof:
+                raise ValueError("Unterminated JSON array")
+            fill()
+            buf = buf.lstrip()
+        if buf[0] == "]" and (after_value or allow_close):
+            return
+        if after_value:
+            if buf[0] != ",":
+                raise ValueError(f"Expected ',' in JSON array, got {buf[0]!r}")
+            buf = buf[1:]
+            after_value = allow_close = False
+            continue
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError as exc:
+                # read more only if the value was cut off by the end of the
+                # buffer; a syntax error further back is raised right away
+                cut_off = exc.msg.startswith("Unterminated string") or (
+                    exc.pos >= len(buf) - DECODE_TAIL
+                )
+                if eof or not cut_off:
+                    raise
+                fill()
+                continue
+            # a number or literal ending the buffer may continue in the next read
+            if end == len(buf) and not eof and not isinstance(value, (dict, list, str)):
+                fill()
+                continue
+            break
+        yield value
+        buf = buf[end:]
+        after_value = True
+
+
+def iter_records(src) -> Iterator[dict]:
+    """Yield records from a JSON array or JSONL file object, one at a time."""
+    first = src.read(1)
+    while first and first.isspace():
+        first = src.read(1)
+    src.seek(0)
+    if first == "[":
+        yield from iter_json_array(src)
+        return
+    for line in src:
+        if line.strip():
+            yield json.loads(line)
+
+
+def clean_record(
+    rec: dict, min_tokens: int, max_tokens: int, stripper: str = "bleach"
+) -> Optional[dict]:
+    """Clean one raw record; None if it has no QA pair or fails the length filter."""
+    qa = extract_qa(rec)
+    if not qa:
+        return None
+    q_raw, a_raw = qa
+    q = clean_text(q_raw, stripper)
+    a = clean_text(a_raw, stripper)
+    # Length filtering (skip for FAQ entries)
+    is_faq = "title" in rec and "body" in rec
+    if not is_faq:
+        qtoks = len(q.split())
+        atoks = len(a.split())
+        if qtoks < min_tokens or qtoks > max_tokens:
+            return None
+        if atoks < min_tokens or atoks > max_tokens:
+            return None
+    return {"question": q, "answer": a}
+
+
+def iter_cleaned(
+    records, min_tokens: int, max_tokens: int, stripper: str = "bleach"
+) -> Iterator[dict]:
+    for rec in records:
+        out = clean_record(rec, min_tokens, max_tokens, stripper)
+        if out is not None:
+            yield out
+
+
+def clean_chunk(
+    records: List[dict], min_tokens: int, max_tokens: int, stripper: str = "bleach"
+) -> List[dict]:
+    return list(iter_cleaned(records, min_tokens, max_tokens, stripper))
+
+
+def iter_chunks(records, size: int) -> Iterator[List[dict]]:
+    chunk = []
+    for rec in records:
+        chunk.append(rec)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_cleaned_parallel(
+    records,
+    min_tokens: int,
+    max_tokens: int,
+    workers: int,
+    chunk_size: int = WORKER_CHUNK,
+    stripper: str = "bleach",
+) -> Iterator[dict]:
+    """
+    ``iter_cleaned`` on a pool of ``workers`` processes.
+
+    Records are cleaned in chunks of ``chunk_size`` and yielded in input
+    order; at most two chunks per worker are in flight, so memory stays
+    bounded. Dedup stays in the caller, so it sees records in the same order
+    as the serial path and catches duplicates across chunks.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in iter_chunks(records, chunk_size):
+            pending.append(
+                pool.submit(clean_chunk, chunk, min_tokens, max_tokens, stripper)
+            )
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class DigestSet:
+    """
+    Set of 64- or 128-bit content digests in an open-addressed ``array`` table.
+
+    The table doubles once it is half full, so an entry costs 16-32 bytes
+    (64-bit) or 32-64 bytes (128-bit) instead of the full text it stands for.
+    An all-zero slot marks empty, so a zero digest is stored as 1.
+    """
+
+    def __init__(self, bits: int = 64, capacity: int = 1024):
+        if bits not in (64, 128):
+            raise ValueError("bits must be 64 or 128")
+        self.bits = bits
+        self._words = bits // 64
+        self._size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        slots = 1 << max(capacity * 2 - 1, 1).bit_length()
+        self._mask = slots - 1
+        self._table = array("Q", bytes(8 * slots * self._words))
+
+    def digest(self, text: str) -> int:
+        raw = hashlib.blake2b(text.encode("utf8"), digest_size=self.bits // 8)
+        return int.from_bytes(raw.digest(), "little") or 1
+
+    def _split(self, digest: int):
+        if self._words == 1:
+            return digest, 0
+        return digest & 0xFFFFFFFFFFFFFFFF, digest >> 64
+
+    def _probe(self, lo: int, hi: int) -> Tuple[int, bool]:
+        """Slot holding the digest (found) or the empty slot it would go in."""
+        table, words = self._table, self._words
+        i = lo & self._mask
+        while True:
+            base = i * words
+            slot_lo = table[base]
+            slot_hi = table[base + 1] if words == 2 else 0
+            if slot_lo == lo and slot_hi == hi:
+                return base, True
+            if slot_lo == 0 and slot_hi == 0:
+                return base, False
+            i = (i + 1) & self._mask
+
+    def add_digest(self, digest: int) -> bool:
+        """Add ``digest``; returns False if it was already present."""
+        lo, hi = self._split(digest)
+        base, found = self._probe(lo, hi)
+        if found:
+            return False
+        self._table[base] = lo
+        if self._words == 2:
+            self._table[base + 1] = hi
+        self._size += 1
+        if self._size * 2 > self._mask + 1:
+            self._grow()
+        return True
+
+    def add(self, text: str) -> bool:
+        """Add the digest of ``text``; returns False if it was already present."""
+        return self.add_digest(self.digest(text))
+
+    def __contains__(self, text: str) -> bool:
+        return self._probe(*self._split(self.digest(text)))[1]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def digests(self) -> Iterator[int]:
+        table, words = self._table, self._words
+        for base in range(0, len(table), words):
+            lo = table[base]
+            hi = table[base + 1] if words == 2 else 0
+            if lo or hi:
+                yield lo | (hi << 64)
+
+    def _grow(self):
+        # walk the old table in place; no per-digest Python ints or list
+        old, words = self._table, self._words
+        self._allocate(self._size)
+        table = self._table
+        for base in range(0, len(old), words):
+            lo = old[base]
+            hi = old[base + 1] if words == 2 else 0
+            if lo or hi:
+                slot = self._probe(lo, hi)[0]
+                table[slot] = lo
+                if words == 2:
+                    table[slot + 1] = hi
+
+    def save(self, path: str):
+        """Write the digests to ``path`` (atomically, via a temporary file)."""
+        packed = array("Q")
+        for digest in self.digests():
+            packed.extend(self._split(digest)[: self._words])
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, self.bits, self._size))
+            packed.tofile(f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "DigestSet":
+        with open(path, "rb") as f:
+            magic, bits, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"{path} is not a dedup hash index")
+            packed = array("Q")
+            packed.fromfile(f, count * (bits // 64))
+        index = cls(bits, capacity=count)
+        step = bits // 64
+        for i in range(0, len(packed), step):
+            digest = packed[i]
+            if step == 2:
+                digest |= packed[i + 1] << 64
+            index.add_digest(digest)
+        return index
+
+
+def dedup_text(rec: dict, key: str = "answer") -> str:
+    """The text a record is deduplicated on (see ``DEDUP_KEYS``)."""
+    if key == "question+answer":
+        return rec["question"] + "\x1f" + rec["answer"]
+    return rec["answer"]
+
+
+def dedupe_records(records, index: DigestSet, key: str = "answer") -> Iterator[dict]:
+    """Drop records whose dedup text is already in ``index``, adding the rest."""
+    for rec in records:
+        if index.add(dedup_text(rec, key)):
+            yield rec
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def load_indexed_inputs(hash_index: str) -> List[str]:
+    """Content digests of the inputs already added to ``hash_index``."""
+    try:
+        with open(hash_index + INDEX_INPUTS_SUFFIX, encoding="utf8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def save_indexed_inputs(hash_index: str, digests: List[str]):
+    path = hash_index + INDEX_INPUTS_SUFFIX
+    with open(f"{path}.tmp", "w", encoding="utf8") as f:
+        json.dump(digests, f)
+    os.replace(f"{path}.tmp", path)
+
+
 def clean_dataset(
-    input_path: str, output_path: str, min_tokens: int, max_tokens: int
+    input_path: str,
+    output_path: str,
+    min_tokens: int,
+    max_tokens: int,
+    workers: int = 1,
+    chunk_size: int = WORKER_CHUNK,
+    stripper: str = "bleach",
+    dedup_key: str = "answer",
+    hash_index: Optional[str] = None,
+    hash_bits: int = 64,
 ) -> int:
-    # track seen answers to dedupe duplicates by answer content
-    seen_answers = set()
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    """
+    Stream ``input_path`` (JSON array or JSONL) through parse -> clean ->
+    dedupe and write each kept record as it is produced. With ``workers > 1``
+    cleaning runs on a process pool; the output is identical. ``stripper``
+    picks the HTML stripping backend from ``STRIPPERS``.
+
+    Records are deduplicated on digests of ``dedup_key``. If ``hash_index``
+    exists it is loaded first, so records kept by earlier runs are dropped,
+    and the updated index is written back at the end. The index is meant for
+    new inputs only: an input whose exact content it already holds would
+    come out empty, so it is rejected before the output is touched.
+    """
+    input_digest = indexed = None
+    if hash_index:
+        input_digest = file_digest(input_path)
+        indexed = load_indexed_inputs(hash_index)
+        if input_digest in indexed:
+            raise ValueError(
+                f"{input_path} is already in {hash_index}, so every record would "
+                "be dropped; clean it without --hash-index or with a new index"
+            )
+    if hash_index and os.path.exists(hash_index):
+        index = DigestSet.load(hash_index)
+        if index.bits != hash_bits:
+            raise ValueError(
+                f"{hash_index} holds {index.bits}-bit digests, not {hash_bits}-bit"
+            )
+    else:
+        index = DigestSet(hash_bits)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
     count = 0
     with open(input_path, "r", encoding="utf8") as src, open(
         output_path, "w", encoding="utf8"
     ) as dst:
-        # Load JSON or JSONL
-        first = src.read(1)
-        src.seek(0)
-        if first == "[":
-            data = json.load(src)
+        records = iter_records(src)
+        if workers > 1:
+            records = iter_cleaned_parallel(
+                records, min_tokens, max_tokens, workers, chunk_size, stripper
+            )
         else:
-            data = [json.loads(line) for line in src if line.strip()]
-        for rec in data:
-            qa = extract_qa(rec)
-            if not qa:
-                continue
-            q_raw, a_raw = qa
-            q = clean_text(q_raw)
-            a = clean_text(a_raw)
-            # Length filtering (skip for FAQ entries)
-            is_faq = "title" in rec and "body" in rec
-            if not is_faq:
-                qtoks = len(q.split())
-                atoks = len(a.split())
-                if qtoks < min_tokens or qtoks > max_tokens:
-                    continue
-                if atoks < min_tokens or atoks > max_tokens:
-                    continue
-            # Deduplicate by answer content (skip repeated answers)
-            if a in seen_answers:
-                continue
-            seen_answers.add(a)
-            out = {"question": q, "answer": a}
+            records = iter_cleaned(records, min_tokens, max_tokens, stripper)
+        for out in dedupe_records(records, index, dedup_key):
             dst.write(json.dumps(out, ensure_ascii=False) + "\n")
             count += 1
+    if hash_index:
+        index.save(hash_index)
+        save_indexed_inputs(hash_index, indexed + [input_digest])
     return count
 
 
@@ -86,9 +481,59 @@ def main():
     parser.add_argument(
         "--max-tokens", type=int, default=512, help="Maximum token count per QA"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes used for cleaning (1 cleans in the main process)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=WORKER_CHUNK,
+        help="Records per worker task when --workers > 1",
+    )
+    parser.add_argument(
+        "--stripper",
+        choices=sorted(STRIPPERS),
+        default="bleach",
+        help="HTML stripping backend: bleach (html5lib) or fast (regex tokenizer)",
+    )
+    parser.add_argument(
+        "--dedup-key",
+        choices=DEDUP_KEYS,
+        default="answer",
+        help="Drop records repeating an earlier answer, or question and answer",
+    )
+    parser.add_argument(
+        "--hash-index",
+        default=None,
+        help="Dedup digest index file, loaded if present and updated after the "
+        "run, to dedupe new inputs against previously cleaned data",
+    )
+    parser.add_argument(
+        "--hash-bits",
+        type=int,
+        choices=[64, 128],
+        default=64,
+        help="Digest size used for dedup",
+    )
     args = parser.parse_args()
-    total = clean_dataset(args.input, args.output, args.min_tokens, args.max_tokens)
+    total = clean_dataset(
+        args.input,
+        args.output,
+        args.min_tokens,
+        args.max_tokens,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        stripper=args.stripper,
+        dedup_key=args.dedup_key,
+        hash_index=args.hash_index,
+        hash_bits=args.hash_bits,
+    )
     print(f"Saved {total} cleaned records to {args.output}")
+    if total == 0 and args.hash_index:
+        print(f"Warning: every record was already in {args.hash_index} or filtered")
 
 
 if __name__ == "__main__":
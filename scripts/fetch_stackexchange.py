@@ -1,14 +1,122 @@
 #!/usr/bin/env python3
 """
 Fetch Q&A data from the Stack Exchange API based on tags.
-"""
 
+Queries are crawled concurrently through one pooled session and a shared
+rate limiter that also applies the ``backoff`` the API asks for. Items are
+appended to a JSONL file as pages arrive, and the next page of every query
+is checkpointed so an interrupted run (crash, or ``quota_remaining`` running
+out) resumes where it stopped.
+"""
 import argparse
 import json
 import os
+import re
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = "https://api.stackexchange.com/2.3/questions"
+# the API throttles above 30 requests/sec per IP
+MAX_RATE = 25.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# error_id of the API's "throttle_violation" (sent with HTTP 400)
+THROTTLE_ERROR_ID = 502
+
+
+class RateLimiter:
+    """
+    Thread-safe spacing of requests to at most ``rate`` per second. ``backoff``
+    pushes every caller's next request back by the given number of seconds.
+    """
+
+    def __init__(self, rate: float = MAX_RATE):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def backoff(self, seconds: float):
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+def retry_delay(resp, attempt: int):
+    """Seconds to wait before retrying a failed response, or None if fatal."""
+    if resp.status_code in RETRY_STATUSES:
+        try:
+            return float(resp.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return float(2**attempt)
+    try:
+        error = resp.json()
+    except ValueError:
+        return None
+    if error.get("error_id") == THROTTLE_ERROR_ID:
+        # "too many requests from this IP, more requests available in 42 seconds"
+        match = re.search(r"(\d+) seconds", error.get("error_message", ""))
+        return float(match.group(1)) if match else float(2**attempt)
+    return None
+
+
+def fetch_page(get, url, params, limiter: RateLimiter, max_retries: int = 5) -> dict:
+    """
+    GET one page with ``get(url, params=...)``, retrying throttling and
+    server errors, and register the ``backoff`` the response asks for.
+    """
+    for attempt in range(max_retries + 1):
+        limiter.wait()
+        resp = get(url, params=params)
+        try:
+            resp.raise_for_status()
+        except requests.HTTPError as exc:
+            delay = retry_delay(exc.response, attempt)
+            if delay is None or attempt == max_retries:
+                raise
+            limiter.backoff(delay)
+            continue
+        data = resp.json()
+        if data.get("backoff"):
+            limiter.backoff(data["backoff"])
+        return data
+
+
+def iter_pages(get, url, params, limiter, page: int = 1, max_retries: int = 5):
+    """Yield ``(page, data)`` from ``page`` on until ``has_more`` is false."""
+    while True:
+        data = fetch_page(get, url, dict(params, page=page), limiter, max_retries)
+        yield page, data
+        if not data.get("has_more"):
+            return
+        page += 1
+
+
+def query_params(
+    tagged, page_size, api_key, access_token=None, sort="activity", site="stackoverflow"
+) -> dict:
+    params = {
+        "order": "desc",
+        "sort": sort,
+        "tagged": tagged,
+        "site": site,
+        "filter": "withbody",
+        "pagesize": page_size,
+        "key": api_key,
+    }
+    if access_token:
+        params["access_token"] = access_token
+    return params
 
 
 def fetch_questions(tags, page_size, api_key, access_token=None):
@@ -24,32 +132,131 @@ def fetch_questions(tags, page_size, api_key, access_token=None):
     Returns:
         list[dict]: Aggregated question data from API.
     """
-    url = "https://api.stackexchange.com/2.3/questions"
-    params = {
-        "order": "desc",
-        "sort": "activity",
-        "tagged": ";".join(tags),
-        "site": "stackoverflow",
-        "filter": "withbody",
-        "pagesize": page_size,
-        "page": 1,
-        "key": api_key,
-    }
-    if access_token:
-        params["access_token"] = access_token
+    params = query_params(";".join(tags), page_size, api_key, access_token)
+    pages = iter_pages(requests.get, API_URL, params, RateLimiter())
+    return [item for _, data in pages for item in data.get("items", [])]
 
-    all_items = []
-    while True:
-        resp = requests.get(url, params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        items = data.get("items", [])
-        all_items.extend(items)
-        if not data.get("has_more"):
-            break
-        params["page"] += 1
-        time.sleep(1)
-    return all_items
+
+def checkpoint_path(output_path: str) -> str:
+    return f"{output_path}.checkpoint.json"
+
+
+def load_written_ids(output_path: str) -> set:
+    """
+    ``question_id``s already in ``output_path``. A partial last line left by
+    a crash is truncated away first.
+    """
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+    ids = set()
+    for line in data[:end].splitlines():
+        if line.strip():
+            ids.add(json.loads(line).get("question_id"))
+    return ids
+
+
+def fetch_to_jsonl(
+    queries,
+    page_size: int,
+    api_key: str,
+    output_path: str,
+    access_token: str = None,
+    concurrency: int = 4,
+    rate: float = MAX_RATE,
+    min_quota: int = 0,
+    url: str = API_URL,
+    max_retries: int = 5,
+) -> dict:
+    """
+    Crawl every ``tagged`` value in ``queries`` concurrently and append new
+    questions (deduplicated on ``question_id``) to ``output_path``.
+
+    After each page the next page of its query is saved to
+    ``checkpoint_path(output_path)``; a later call with the same queries
+    resumes from there. Crawling stops once ``quota_remaining`` drops to
+    ``min_quota``. The checkpoint is removed when every query is complete.
+    Returns a summary with ``items``, ``pages``, ``quota_remaining`` and
+    ``complete``.
+    """
+    queries = list(dict.fromkeys(queries))
+    identity = {"queries": sorted(queries), "page_size": page_size, "url": url}
+    ckpt = checkpoint_path(output_path)
+    state = None
+    if os.path.exists(ckpt) and os.path.exists(output_path):
+        with open(ckpt, "r", encoding="utf8") as f:
+            state = json.load(f)
+        if state.get("identity") != identity:
+            state = None
+    if state is None:
+        state = {"identity": identity, "next_page": {q: 1 for q in queries}}
+        seen, mode = set(), "w"
+    else:
+        seen, mode = load_written_ids(output_path), "a"
+        print(f"Resuming {output_path} ({len(seen)} questions already fetched)")
+
+    limiter = RateLimiter(rate)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    lock = threading.Lock()
+    stop = threading.Event()
+    summary = {"items": 0, "pages": 0, "quota_remaining": None, "complete": False}
+
+    def save_checkpoint():
+        with open(f"{ckpt}.tmp", "w", encoding="utf8") as f:
+            json.dump(state, f)
+        os.replace(f"{ckpt}.tmp", ckpt)
+
+    def crawl(query):
+        page = state["next_page"][query]
+        if page is None:
+            return
+        # creation order keeps earlier pages stable while a crawl is resumed
+        params = query_params(query, page_size, api_key, access_token, "creation")
+        for page, data in iter_pages(
+            session.get, url, params, limiter, page, max_retries
+        ):
+            with lock:
+                for item in data.get("items", []):
+                    qid = item.get("question_id")
+                    if qid is None or qid not in seen:
+                        seen.add(qid)
+                        out.write(json.dumps(item, ensure_ascii=False) + "\n")
+                        summary["items"] += 1
+                out.flush()
+                summary["pages"] += 1
+                state["next_page"][query] = page + 1 if data.get("has_more") else None
+                save_checkpoint()
+                quota = data.get("quota_remaining")
+                if quota is not None:
+                    summary["quota_remaining"] = quota
+                    if quota <= min_quota:
+                        stop.set()
+            if stop.is_set():
+                return
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    try:
+        with open(output_path, mode, encoding="utf8") as out, ThreadPoolExecutor(
+            max_workers=max(1, min(concurrency, len(queries)))
+        ) as pool:
+            futures = [pool.submit(crawl, query) for query in queries]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                stop.set()
+                raise
+    finally:
+        session.close()
+    summary["complete"] = all(p is None for p in state["next_page"].values())
+    if summary["complete"] and os.path.exists(ckpt):
+        os.remove(ckpt)
+    return summary
 
 
 def main():
@@ -62,6 +269,13 @@ def main():
         required=True,
         help="Tags to filter (e.g., kubernetes networking)",
     )
+    parser.add_argument(
+        "--match",
+        choices=["all", "any"],
+        default="all",
+        help="Fetch questions with all tags (one query), or with any tag "
+        "(one query per tag, crawled concurrently)",
+    )
     parser.add_argument(
         "--page-size",
         type=int,
@@ -71,7 +285,25 @@ def main():
     parser.add_argument(
         "--output",
         required=True,
-        help="Output JSON file path for raw question data",
+        help="Output JSONL file path for raw question data",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Queries crawled at once"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=MAX_RATE,
+        help="Maximum requests/sec shared by all queries",
+    )
+    parser.add_argument(
+        "--min-quota",
+        type=int,
+        default=0,
+        help="Stop (resumably) once quota_remaining drops to this value",
+    )
+    parser.add_argument(
+        "--api-url", default=API_URL, help="Questions endpoint (e.g. a local stub)"
     )
     args = parser.parse_args()
 
@@ -80,20 +312,27 @@ def main():
     if not api_key:
         parser.error("Environment variable STACKEX_API_KEY is required.")
 
-    questions = fetch_questions(
-        tags=args.tags,
+    queries = [";".join(args.tags)] if args.match == "all" else args.tags
+    summary = fetch_to_jsonl(
+        queries,
         page_size=args.page_size,
         api_key=api_key,
+        output_path=args.output,
         access_token=access_token,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        min_quota=args.min_quota,
+        url=args.api_url,
+    )
+    print(
+        f"Saved {summary['items']} new questions from {summary['pages']} pages "
+        f"to {args.output} (quota remaining: {summary['quota_remaining']})."
     )
-    output_dir = os.path.dirname(args.output)
-    if (
-        output_dir
-    ):  # Ensure the directory part is not empty (e.g., for current directory files)
-        os.makedirs(output_dir, exist_ok=True)
-    with open(args.output, "w", encoding="utf-8") as f:
-        json.dump(questions, f, ensure_ascii=False, indent=2)
-    print(f"Successfully saved {len(questions)} questions to {args.output}.")
+    if not summary["complete"]:
+        print(
+            f"Stopped early; rerun to resume from {checkpoint_path(args.output)}.",
+            file=sys.stderr,
+        )
 
 
 if __name__ == "__main__":
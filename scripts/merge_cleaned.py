@@ -1,28 +1,132 @@
 #!/usr/bin/env python3
 """
 Merge all cleaned JSONL files under data/clean/ into a single combined JSONL.
-"""
 
+Inputs are streamed in sorted order and deduplicated across files on content
+digests. The merge skips its own output (and output shards), and can shuffle
+deterministically with a seed and split the result into shards.
+"""
 import argparse
 import glob
 import json
 import os
+import random
+import re
+import tempfile
+from typing import Iterator, List
+
+from scripts.clean_data import DEDUP_KEYS, DigestSet, dedupe_records
+
+# temporary buckets used by the out-of-core shuffle
+SHUFFLE_BUCKETS = 64
+
+
+def shard_paths(output_path: str, num_shards: int = 1) -> List[str]:
+    """``output_path`` itself, or ``{stem}-00000-of-0000N{ext}`` shard paths."""
+    if num_shards <= 1:
+        return [output_path]
+    stem, ext = os.path.splitext(output_path)
+    return [f"{stem}-{i:05d}-of-{num_shards:05d}{ext}" for i in range(num_shards)]
+
 
+def input_files(input_dir: str, output_path: str) -> List[str]:
+    """
+    Sorted ``*.jsonl`` files in ``input_dir``, minus the merge output and any
+    shards of it from earlier runs.
+    """
+    stem = os.path.splitext(os.path.basename(output_path))[0]
+    own = re.compile(re.escape(stem) + r"(-\d{5}-of-\d{5})?\.jsonl")
+    out_dir = os.path.realpath(os.path.dirname(output_path) or ".")
+    return [
+        path
+        for path in sorted(glob.glob(os.path.join(input_dir, "*.jsonl")))
+        if not (
+            os.path.realpath(os.path.dirname(path)) == out_dir
+            and own.fullmatch(os.path.basename(path))
+        )
+    ]
+
+
+def iter_jsonl(paths) -> Iterator[dict]:
+    for path in paths:
+        with open(path, "r", encoding="utf8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def shuffle_lines(
+    lines, seed: int, buckets: int = SHUFFLE_BUCKETS, workdir: str = None
+) -> Iterator[str]:
+    """
+    Yield ``lines`` in a seeded random order, holding one bucket in memory.
 
-def merge_cleaned(input_dir: str, output_path: str) -> int:
+    Each line goes to a random temporary bucket file; buckets are then read
+    back one at a time and shuffled, which gives a uniform permutation.
+    """
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        files = [
+            open(os.path.join(tmp, f"{i}.jsonl"), "w+", encoding="utf8")
+            for i in range(buckets)
+        ]
+        try:
+            for line in lines:
+                files[rng.randrange(buckets)].write(line)
+            for f in files:
+                f.seek(0)
+                bucket = f.readlines()
+                rng.shuffle(bucket)
+                yield from bucket
+        finally:
+            for f in files:
+                f.close()
+
+
+def merge_cleaned(
+    input_dir: str,
+    output_path: str,
+    dedup_key: str = "answer",
+    hash_bits: int = 64,
+    shuffle: bool = False,
+    seed: int = 0,
+    num_shards: int = 1,
+) -> int:
     """
     Merge all JSONL files in input_dir into output_path.
 
+    Records repeating the ``dedup_key`` text of an earlier record (in any
+    file) are dropped. With ``shuffle`` the output order is a permutation
+    fixed by ``seed``; with ``num_shards > 1`` records are dealt round-robin
+    into ``shard_paths(output_path, num_shards)``. Outputs are replaced
+    atomically once complete.
+
     Returns the total number of records merged.
     """
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    paths = input_files(input_dir, output_path)
+    outputs = shard_paths(output_path, num_shards)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    records = dedupe_records(iter_jsonl(paths), DigestSet(hash_bits), dedup_key)
+    lines = (json.dumps(rec, ensure_ascii=False) + "\n" for rec in records)
+    if shuffle:
+        lines = shuffle_lines(lines, seed, workdir=os.path.dirname(output_path) or None)
     count = 0
-    with open(output_path, "w", encoding="utf8") as out_f:
-        for path in glob.glob(os.path.join(input_dir, "*.jsonl")):
-            with open(path, "r", encoding="utf8") as in_f:
-                for line in in_f:
-                    out_f.write(line)
-                    count += 1
+    files = []
+    try:
+        for path in outputs:
+            files.append(open(f"{path}.tmp", "w", encoding="utf8"))
+        for line in lines:
+            files[count % len(files)].write(line)
+            count += 1
+    except BaseException:
+        for f in files:
+            f.close()
+            os.remove(f.name)
+        raise
+    for f in files:
+        f.close()
+    for path in outputs:
+        os.replace(f"{path}.tmp", path)
     return count
 
 
@@ -38,9 +142,41 @@ def main():
         default="data/clean/combined.jsonl",
         help="Output combined JSONL path",
     )
+    parser.add_argument(
+        "--dedup-key",
+        choices=DEDUP_KEYS,
+        default="answer",
+        help="Drop records repeating an earlier answer, or question and answer",
+    )
+    parser.add_argument(
+        "--hash-bits",
+        type=int,
+        choices=(64, 128),
+        default=64,
+        help="Digest size used for cross-file dedup",
+    )
+    parser.add_argument(
+        "--shuffle", action="store_true", help="Shuffle records deterministically"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for --shuffle")
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        help="Split the output into this many {stem}-NNNNN-of-NNNNN.jsonl shards",
+    )
     args = parser.parse_args()
-    total = merge_cleaned(args.input_dir, args.output)
-    print(f"Merged {total} records into {args.output}")
+    total = merge_cleaned(
+        args.input_dir,
+        args.output,
+        dedup_key=args.dedup_key,
+        hash_bits=args.hash_bits,
+        shuffle=args.shuffle,
+        seed=args.seed,
+        num_shards=args.num_shards,
+    )
+    outputs = ", ".join(shard_paths(args.output, args.num_shards))
+    print(f"Merged {total} records into {outputs}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Drop near-duplicate QA pairs using MinHash signatures and an LSH index.
+
+Pass 1 streams the cleaned JSONL, computes a MinHash signature per record
+and its LSH band keys, and spills both to disk-backed arrays. Records that
+share a band key and whose estimated Jaccard similarity reaches the
+threshold are merged into clusters with union-find over per-band sorts.
+Pass 2 streams the input again and keeps the first record of each cluster.
+RAM stays at a few dozen bytes per record.
+"""
+import argparse
+import json
+import os
+import tempfile
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from scripts.clean_data import DEDUP_KEYS, dedup_text, iter_records
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+# records per batch when computing band keys
+BATCH = 4096
+
+
+def shingle_hashes(text: str, size: int) -> np.ndarray:
+    """32-bit hashes of the lowercased word ``size``-grams of ``text``."""
+    words = text.lower().split()
+    if len(words) <= size:
+        grams = {" ".join(words)}
+    else:
+        grams = {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter(
+        (zlib.crc32(g.encode("utf8")) for g in grams), dtype=np.uint64, count=len(grams)
+    )
+
+
+class MinHasher:
+    """MinHash over ``num_perm`` universal hash functions ``(a*x + b) mod p``."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        # a, b span [0, p) so a*x mixes all bits; the uint64 product wraps
+        # mod 2**64 before the mod p, which keeps the family well spread
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)[:, None]
+        self.num_perm = num_perm
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        if not len(hashes):
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint32)
+        values = (self.a * hashes[None, :] + self.b) % MERSENNE_PRIME
+        return (values.min(axis=1) & MAX_HASH).astype(np.uint32)
+
+
+def lsh_params(threshold: float, num_perm: int):
+    """
+    Pick ``(bands, rows)`` with ``bands * rows <= num_perm`` minimizing the
+    sum of false-positive and false-negative probability mass around
+    ``threshold`` under the LSH S-curve ``1 - (1 - s**rows) ** bands``.
+    """
+    s = np.linspace(0, 1, 201)
+    best, best_err = None, None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            p = 1 - (1 - s**rows) ** bands
+            err = np.where(s < threshold, p, 1 - p).mean()
+            if best_err is None or err < best_err:
+                best, best_err = (bands, rows), err
+    return best
+
+
+def band_keys(signatures: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    """One 64-bit key per band: a multiply-xor hash of the band's rows."""
+    keys = np.zeros((len(signatures), bands), dtype=np.uint64)
+    mixers = np.random.RandomState(7).randint(
+        1, np.iinfo(np.int64).max, size=rows, dtype=np.int64
+    ).astype(np.uint64) | np.uint64(1)
+    with np.errstate(over="ignore"):
+        for band in range(bands):
+            block = signatures[:, band * rows : (band + 1) * rows].astype(np.uint64)
+            keys[:, band] = np.bitwise_xor.reduce(block * mixers, axis=1)
+    return keys
+
+
+def _find(parent: np.ndarray, i: int) -> int:
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def cluster(signatures: np.ndarray, keys: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Union records that share an LSH bucket and whose signatures agree on at
+    least ``threshold`` of their positions. Returns each record's cluster
+    root, which is the smallest record index in the cluster.
+    """
+    n = len(keys)
+    parent = np.arange(n, dtype=np.int64)
+    for band in range(keys.shape[1]):
+        column = np.asarray(keys[:, band])
+        order = np.argsort(column, kind="stable")
+        sorted_keys = column[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+        for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+            members = order[start : start + size]
+            # each member is checked against one representative per group
+            # of the bucket, so a dissimilar first member cannot hide a pair
+            reps = [int(members[0])]
+            for member in members[1:]:
+                member = int(member)
+                similar = (signatures[reps] == signatures[member]).mean(axis=1)
+                matched = np.flatnonzero(similar >= threshold)
+                if not len(matched):
+                    reps.append(member)
+                for i in matched:
+                    a, b = _find(parent, reps[i]), _find(parent, member)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+    # pointer jumping leaves every entry pointing at its root
+    while True:
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            return parent
+        parent = jumped
+
+
+def cluster_report(roots: np.ndarray, top: int = 10) -> dict:
+    sizes = np.bincount(roots, minlength=len(roots))
+    histogram = Counter(int(s) for s in sizes[sizes > 0])
+    largest = np.argsort(-sizes, kind="stable")[:top]
+    return {
+        "records": int(len(roots)),
+        "clusters": int((sizes > 0).sum()),
+        "removed": int(len(roots) - (sizes > 0).sum()),
+        "cluster_sizes": {str(k): v for k, v in sorted(histogram.items())},
+        "largest_clusters": [
+            {"representative": int(i), "size": int(sizes[i])}
+            for i in largest
+            if sizes[i] > 1
+        ],
+    }
+
+
+def near_dedup(
+    input_path: str,
+    output_path: str,
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    shingle_size: int = 5,
+    key: str = "answer",
+    seed: int = 1,
+    workdir: str = None,
+) -> dict:
+    """
+    Write the records of ``input_path`` minus near-duplicates of earlier
+    records to ``output_path`` and return a cluster-size report.
+    """
+    hasher = MinHasher(num_perm, seed)
+    bands, rows = lsh_params(threshold, num_perm)
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        sig_path = os.path.join(tmp, "signatures.u32")
+        key_path = os.path.join(tmp, "bands.u64")
+        n = 0
+        with open(input_path, "r", encoding="utf8") as src, open(
+            sig_path, "wb"
+        ) as sig_out, open(key_path, "wb") as key_out:
+            batch = []
+            for rec in iter_records(src):
+                text = dedup_text(rec, key)
+                batch.append(hasher.signature(shingle_hashes(text, shingle_size)))
+                n += 1
+                if len(batch) == BATCH:
+                    sigs = np.stack(batch)
+                    sig_out.write(sigs.tobytes())
+                    key_out.write(band_keys(sigs, bands, rows).tobytes())
+                    batch = []
+            if batch:
+                sigs = np.stack(batch)
+                sig_out.write(sigs.tobytes())
+                key_out.write(band_keys(sigs, bands, rows).tobytes())
+        if n == 0:
+            roots = np.zeros(0, dtype=np.int64)
+        else:
+            signatures = np.memmap(
+                sig_path, dtype=np.uint32, mode="r", shape=(n, num_perm)
+            )
+            keys = np.memmap(key_path, dtype=np.uint64, mode="r", shape=(n, bands))
+            roots = cluster(signatures, keys, threshold)
+            del signatures, keys
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(input_path, "r", encoding="utf8") as src, open(
+        output_path, "w", encoding="utf8"
+    ) as dst:
+        for i, rec in enumerate(iter_records(src)):
+            if roots[i] == i:
+                dst.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    report = cluster_report(roots)
+    report.update(threshold=threshold, num_perm=num_perm, bands=bands, rows=rows)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Remove near-duplicate QA pairs with MinHash LSH."
+    )
+    parser.add_argument("--input", required=True, help="Cleaned JSONL file path")
+    parser.add_argument("--output", required=True, help="Output JSONL file path")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.8,
+        help="Estimated Jaccard similarity at which records are near-duplicates",
+    )
+    parser.add_argument(
+        "--num-perm", type=int, default=128, help="MinHash signature length"
+    )
+    parser.add_argument("--shingle-size", type=int, default=5, help="Words per shingle")
+    parser.add_argument(
+        "--key",
+        choices=DEDUP_KEYS,
+        default="answer",
+        help="Text compared for similarity",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="MinHash seed")
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        help="Directory for the on-disk signature arrays (default: system temp)",
+    )
+    parser.add_argument("--report", help="Write the cluster-size report as JSON")
+    args = parser.parse_args()
+
+    report = near_dedup(
+        args.input,
+        args.output,
+        threshold=args.threshold,
+        num_perm=args.num_perm,
+        shingle_size=args.shingle_size,
+        key=args.key,
+        seed=args.seed,
+        workdir=args.workdir,
+    )
+    if args.report:
+        os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+        with open(args.report, "w", encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+    kept = report["clusters"]
+    print(
+        f"Kept {kept} of {report['records']} records "
+        f"({report['removed']} near-duplicates removed) in {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Incremental fetch -> clean -> merge -> prepare -> train pipeline over the
+scripts/ entry points.
+
+Every stage is keyed on a digest of its input contents, its code and its
+parameters. A stage whose key and outputs match the last recorded run is
+skipped, and cleaning runs once per raw file, so a refresh only re-cleans
+new or changed files in data/raw/ before merging.
+"""
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+
+import yaml
+
+from scripts.merge_cleaned import input_files
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("fetch", "clean", "merge", "prepare", "train")
+HASH_CHUNK = 1 << 20
+# parameters that change how fast a stage runs, not what it writes
+RUNTIME_PARAMS = ("workers", "chunk_size", "num_proc", "map_batch_size", "cache_dir")
+# parameters naming files or directories whose contents the stage reads
+PATH_PARAMS = ("config", "model_name_or_path")
+
+DEFAULT_CONFIG = {
+    "raw_dir": "data/raw",
+    "clean_dir": "data/clean",
+    "combined": "data/clean/combined.jsonl",
+    "dataset_dir": "data/processed/dataset",
+    "model_dir": "models/t5-finetuned",
+    "state": "data/.pipeline_state.json",
+    "fetch": {"stackexchange": None, "faqs": None},
+    "clean": {"min_tokens": 10, "max_tokens": 512},
+    "merge": {},
+    "prepare": {"model_name_or_path": "t5-small", "max_length": 512},
+    "train": {"model_name_or_path": "t5-small"},
+}
+
+
+def load_config(path: str = None) -> dict:
+    """``DEFAULT_CONFIG`` overridden by the YAML file at ``path``."""
+    config = {
+        key: dict(value) if isinstance(value, dict) else value
+        for key, value in DEFAULT_CONFIG.items()
+    }
+    if path:
+        with open(path, "r") as f:
+            overrides = yaml.safe_load(f) or {}
+        for key, value in overrides.items():
+            if isinstance(config.get(key), dict) and isinstance(value, dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+    return config
+
+
+def to_argv(params: dict) -> list:
+    """``{"max_tokens": 512, "shuffle": True}`` -> ``--max-tokens 512 --shuffle``."""
+    argv = []
+    for key, value in params.items():
+        flag = "--" + key.replace("_", "-")
+        if value is None or value is False:
+            continue
+        if value is True:
+            argv.append(flag)
+        elif isinstance(value, (list, tuple)):
+            argv += [flag, *map(str, value)]
+        else:
+            argv += [flag, str(value)]
+    return argv
+
+
+def module_path(module: str) -> str:
+    return importlib.util.find_spec(module).origin
+
+
+def raw_files(raw_dir: str) -> list:
+    patterns = ("*.json", "*.jsonl")
+    paths = (p for pat in patterns for p in glob.glob(os.path.join(raw_dir, pat)))
+    # skip the fetcher's resume checkpoints
+    return sorted(p for p in paths if not p.endswith(".checkpoint.json"))
+
+
+def clean_output(clean_dir: str, raw_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(raw_path))[0]
+    return os.path.join(clean_dir, f"{stem}_clean.jsonl")
+
+
+class Pipeline:
+    """
+    Run stages as ``python -m <module>`` subprocesses, recording each stage's
+    key and output digests in the JSON state file ``config["state"]``.
+
+    File digests are cached by size and mtime, so unchanged inputs are not
+    re-read. Stage types in ``force`` always run; with ``dry_run`` nothing is
+    executed and stages downstream of a pending one are reported as pending.
+    """
+
+    def __init__(self, config: dict, force=(), dry_run: bool = False):
+        self.config = config
+        self.force = set(force)
+        self.dry_run = dry_run
+        self.state = {"files": {}, "stages": {}}
+        if os.path.exists(config["state"]):
+            with open(config["state"], "r", encoding="utf8") as f:
+                self.state = json.load(f)
+        self.ran, self.skipped = [], []
+        self._pending = set()
+
+    def file_digest(self, path: str) -> str:
+        st = os.stat(path)
+        cached = self.state["files"].get(path)
+        if cached and cached[:2] == [st.st_size, st.st_mtime_ns]:
+            return cached[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(chunk)
+        self.state["files"][path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def digest(self, path: str):
+        """Digest of a file or of a directory tree's names and contents."""
+        if os.path.isfile(path):
+            return self.file_digest(path)
+        if not os.path.isdir(path):
+            return None
+        h = hashlib.sha256()
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                full = os.path.join(dirpath, name)
+                h.update(os.path.relpath(full, path).encode("utf8") + b"\0")
+                h.update(self.file_digest(full).encode("ascii"))
+        return h.hexdigest()
+
+    def stage_key(self, module: str, code, params: dict, inputs) -> str:
+        params = {k: v for k, v in params.items() if k not in RUNTIME_PARAMS}
+        inputs = list(inputs) + [
+            params[k]
+            for k in PATH_PARAMS
+            if isinstance(params.get(k), str) and os.path.exists(params[k])
+        ]
+        payload = {
+            "module": module,
+            "code": [self.digest(module_path(m)) for m in (module, *code)],
+            "params": params,
+            "inputs": {path: self.digest(path) for path in inputs},
+        }
+        blob = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf8")).hexdigest()
+
+    def run(self, name, module, params, inputs, outputs, code=(), cached=True):
+        """
+        Run ``module`` with ``params`` as CLI flags unless stage ``name`` is
+        up to date. ``inputs``/``outputs`` are the paths it reads/writes and
+        ``code`` names extra modules it imports. Returns True if it ran.
+        """
+        key = self.stage_key(module, code, params, inputs)
+        record = self.state["stages"].get(name)
+        fresh = (
+            cached
+            and record is not None
+            and record["key"] == key
+            and not self._pending.intersection(inputs)
+            and all(self.digest(p) == d for p, d in record["outputs"].items())
+        )
+        if fresh and name.split(":")[0] not in self.force:
+            print(f"[skip] {name}")
+            self.skipped.append(name)
+            return False
+        print(f"[run]  {name}")
+        self.ran.append(name)
+        if self.dry_run:
+            self._pending.update(outputs)
+            return True
+        env = dict(os.environ)
+        paths = [ROOT, env.get("PYTHONPATH")]
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, paths))
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", module, *to_argv(params)], check=True, env=env
+        )
+        self.state["stages"][name] = {
+            "key": key,
+            "outputs": {path: self.digest(path) for path in outputs},
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        self.save()
+        return True
+
+    def forget(self, name: str):
+        """Drop stage ``name`` from the state and delete its outputs."""
+        record = self.state["stages"].pop(name)
+        print(f"[prune] {name}")
+        if self.dry_run:
+            return
+        for path in record["outputs"]:
+            if os.path.isfile(path):
+                os.remove(path)
+        self.save()
+
+    def save(self):
+        self.state["files"] = {
+            p: v for p, v in self.state["files"].items() if os.path.exists(p)
+        }
+        path = self.config["state"]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf8") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(f"{path}.tmp", path)
+
+    def fetch(self):
+        """Refresh raw data; remote content cannot be fingerprinted, so always run."""
+        raw_dir, sources = self.config["raw_dir"], self.config["fetch"]
+        if sources.get("stackexchange"):
+            output = os.path.join(raw_dir, "stackexchange.jsonl")
+            params = dict(sources["stackexchange"], output=output)
+            self.run(
+                "fetch:stackexchange",
+                "scripts.fetch_stackexchange",
+                params,
+                [],
+                [output],
+                cached=False,
+            )
+        if sources.get("faqs"):
+            output = os.path.join(raw_dir, "faqs.jsonl")
+            params = dict(sources["faqs"], output=output)
+            self.run(
+                "fetch:faqs", "scripts.scrape_faqs", params, [], [output], cached=False
+            )
+
+    def clean(self):
+        """Clean each raw file separately and prune outputs of deleted ones."""
+        raw = raw_files(self.config["raw_dir"])
+        for name in [n for n in self.state["stages"] if n.startswith("clean:")]:
+            if name[len("clean:") :] not in raw:
+                self.forget(name)
+        for path in raw:
+            output = clean_output(self.config["clean_dir"], path)
+            params = dict(self.config["clean"], input=path, output=output)
+            self.run(f"clean:{path}", "scripts.clean_data", params, [path], [output])
+
+    def merge(self):
+        combined = self.config["combined"]
+        inputs = input_files(self.config["clean_dir"], combined)
+        # clean outputs a dry run would (re)create
+        clean_dir = os.path.realpath(self.config["clean_dir"])
+        inputs += sorted(
+            p
+            for p in self._pending.difference(inputs, [combined])
+            if os.path.realpath(os.path.dirname(p)) == clean_dir
+        )
+        params = dict(
+            self.config["merge"], input_dir=self.config["clean_dir"], output=combined
+        )
+        self.run(
+            "merge",
+            "scripts.merge_cleaned",
+            params,
+            inputs,
+            [combined],
+            code=["scripts.clean_data"],
+        )
+
+    def prepare(self):
+        combined, dataset_dir = self.config["combined"], self.config["dataset_dir"]
+        params = dict(self.config["prepare"], input=combined, output_dir=dataset_dir)
+        self.run(
+            "prepare",
+            "scripts.prepare_dataset",
+            params,
+            [combined],
+            [dataset_dir],
+            code=["scripts.stats"],
+        )
+
+    def train(self):
+        dataset_dir, model_dir = self.config["dataset_dir"], self.config["model_dir"]
+        params = dict(
+            self.config["train"], dataset_dir=dataset_dir, output_dir=model_dir
+        )
+        self.run("train", "scripts.train_model", params, [dataset_dir], [model_dir])
+
+    def run_until(self, until: str = "train", fetch: bool = False):
+        start = time.perf_counter()
+        for stage in STAGES[: STAGES.index(until) + 1]:
+            if stage == "fetch" and not fetch:
+                continue
+            getattr(self, stage)()
+        print(
+            f"{len(self.ran)} stages run, {len(self.skipped)} up to date "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the data and training pipeline, skipping up-to-date stages"
+    )
+    parser.add_argument(
+        "--config", default="configs/pipeline.yaml", help="Pipeline YAML config"
+    )
+    parser.add_argument(
+        "--until", choices=STAGES[1:], default="train", help="Last stage to run"
+    )
+    parser.add_argument(
+        "--fetch",
+        action="store_true",
+        help="Refresh data/raw from the configured sources first",
+    )
+    parser.add_argument(
+        "--force",
+        nargs="+",
+        choices=STAGES,
+        default=[],
+        help="Stages to rerun even if up to date",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only report which stages would run"
+    )
+    args = parser.parse_args()
+    config = load_config(args.config if os.path.exists(args.config) else None)
+    Pipeline(config, args.force, args.dry_run).run_until(args.until, args.fetch)
+
+
+if __name__ == "__main__":
+    main()
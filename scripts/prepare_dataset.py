@@ -1,24 +1,193 @@
 #!/usr/bin/env python3
 """
 Prepare a Hugging Face dataset from cleaned JSONL for model fine-tuning.
+
+With ``pack``, short examples are concatenated into rows of up to
+``max_length`` tokens with per-example segment ids, so training spends far
+less compute on padding (see ``train_model.PackedSeq2SeqCollator``).
+
+Tokenization runs in ``num_proc`` processes and is keyed on a fingerprint of
+the input contents, the tokenizer and ``max_length``: the tokenized Arrow
+files are cached under ``cache_dir`` and reused when the fingerprint
+matches, and an output directory already holding that fingerprint is left
+as is.
 """
 import argparse
+import bisect
+import glob
+import hashlib
+import json
 import os
+import time
+from collections import Counter
 
+import numpy as np
+import pyarrow.compute as pc
 import yaml
 from datasets import load_dataset
 from transformers import AutoTokenizer
 
+from scripts.stats import padding_waste
+
+# bump when tokenize_fn changes, so cached shards are not reused
+TOKENIZE_VERSION = 1
+HASH_CHUNK = 1 << 20
+META_FILE = "prepare_meta.json"
+# examples considered together when packing rows
+PACK_WINDOW = 10000
+# open rows checked for an uneven fit before starting a new row
+PACK_SCAN = 64
+
+
+def dataset_fingerprint(
+    input_path: str, tokenizer, max_length: int, pack: bool = False
+) -> str:
+    """Digest of the input file contents, the tokenizer and the settings."""
+    h = hashlib.sha256(f"{TOKENIZE_VERSION}/{max_length}/{pack}".encode("utf8"))
+    with open(input_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    ident = backend.to_str() if backend is not None else type(tokenizer).__name__
+    h.update(ident.encode("utf8"))
+    h.update(getattr(tokenizer, "name_or_path", "").encode("utf8"))
+    return h.hexdigest()
+
+
+def pack_examples(input_ids, labels, max_length: int) -> dict:
+    """
+    Concatenate examples into rows whose inputs and labels each fit in
+    ``max_length`` tokens, by best-fit decreasing: longest examples first,
+    each into the open row with the least room (the smaller of its input and
+    label room) that fits both, else the first of ``PACK_SCAN`` rows with
+    uneven room that fit it. ``segment_ids``/``label_segment_ids`` number
+    the examples of a row from 1.
+    """
+    order = sorted(
+        range(len(input_ids)),
+        key=lambda i: max(len(input_ids[i]), len(labels[i])),
+        reverse=True,
+    )
+    rows = []
+    # (min room, input room, label room, row index) of the open rows, sorted
+    rooms = []
+    for i in order:
+        in_len, label_len = len(input_ids[i]), len(labels[i])
+        j = bisect.bisect_left(rooms, (max(in_len, label_len),))
+        if j == len(rooms):
+            # no row fits both on its smaller room; look for uneven fits
+            lo = bisect.bisect_left(rooms, (min(in_len, label_len),))
+            fits = (
+                k
+                for k in range(lo, min(lo + PACK_SCAN, len(rooms)))
+                if rooms[k][1] >= in_len and rooms[k][2] >= label_len
+            )
+            j = next(fits, j)
+        if j < len(rooms):
+            _, in_room, label_room, row = rooms.pop(j)
+        else:
+            in_room, label_room, row = max_length, max_length, len(rows)
+            rows.append([])
+        rows[row].append(i)
+        in_room, label_room = in_room - in_len, label_room - label_len
+        if in_room and label_room:
+            bisect.insort(rooms, (min(in_room, label_room), in_room, label_room, row))
+
+    packed = {"input_ids": [], "segment_ids": [], "labels": [], "label_segment_ids": []}
+    for row in rows:
+        for key, segments, column in (
+            ("input_ids", "segment_ids", input_ids),
+            ("labels", "label_segment_ids", labels),
+        ):
+            packed[key].append([t for i in row for t in column[i]])
+            packed[segments].append(
+                [n for n, i in enumerate(row, 1) for _ in column[i]]
+            )
+    return packed
+
+
+def length_counts(ds, column: str) -> Counter:
+    """Counter of the list lengths in ``column``, read from the Arrow table."""
+    lengths = pc.list_value_length(ds.data.column(column)).to_numpy()
+    counts = np.bincount(lengths)
+    return Counter({int(k): int(counts[k]) for k in np.flatnonzero(counts)})
+
+
+def tokens_per_step(inputs: Counter, labels: Counter, batch_size: int) -> dict:
+    """
+    Real and padded (input + label) tokens per training step of
+    ``batch_size`` rows padded to the longest row, and steps per epoch.
+    """
+    rows = sum(inputs.values())
+    real = padded = 0.0
+    for lengths in (inputs, labels):
+        mean = sum(k * v for k, v in lengths.items()) / rows
+        waste = padding_waste(lengths, max(lengths), batch_size)["dynamic"]
+        real += batch_size * mean
+        padded += batch_size * mean / (1 - waste)
+    return {
+        "rows": rows,
+        "steps_per_epoch": -(-rows // batch_size),
+        "effective_tokens_per_step": round(real, 1),
+        "padded_tokens_per_step": round(padded, 1),
+        "padding_pct": round(100 * (1 - real / padded), 2),
+    }
+
+
+def cache_file_state(paths) -> dict:
+    """``(size, mtime_ns)`` of each existing file in ``paths``."""
+    state = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        state[os.path.abspath(path)] = (st.st_size, st.st_mtime_ns)
+    return state
+
+
+def load_meta(output_dir: str) -> dict:
+    try:
+        with open(os.path.join(output_dir, META_FILE), "r", encoding="utf8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
 
 def prepare_dataset(
-    input_path: str, output_dir: str, model_name_or_path: str, max_length: int
+    input_path: str,
+    output_dir: str,
+    model_name_or_path: str,
+    max_length: int,
+    num_proc: int = None,
+    map_batch_size: int = 1000,
+    num_shards: int = None,
+    cache_dir: str = "data/cache/tokenized",
+    force: bool = False,
+    pack: bool = False,
+    train_batch_size: int = 8,
 ):
     """
     Load a JSONL file, tokenize questions and answers, and save dataset to disk.
+
+    The dataset is saved in ``num_shards`` Arrow shards (by default
+    ``datasets`` picks the count from ``max_shard_size``). Returns a summary
+    with the example count, tokenization throughput and whether cached
+    results were reused. With ``pack``, it also compares the effective
+    tokens per step of ``train_batch_size`` rows before and after packing.
     """
     os.makedirs(output_dir, exist_ok=True)
-    ds = load_dataset("json", data_files={"train": input_path}, split="train")
     tokenizer = AutoTokenizer.from_pretrained(model_name_or_path, use_fast=True)
+    fingerprint = dataset_fingerprint(input_path, tokenizer, max_length, pack)
+    meta = load_meta(output_dir)
+    saved = os.path.exists(os.path.join(output_dir, "state.json"))
+    if not force and saved and meta.get("fingerprint") == fingerprint:
+        print(f"{output_dir} is up to date ({meta['examples']} examples)")
+        return dict(meta, reused=True)
+    if num_proc and num_proc > 1:
+        # the tokenizer's own thread pool does not survive forking
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    ds = load_dataset("json", data_files={"train": input_path}, split="train")
 
     def tokenize_fn(example):
         inputs = example["question"]
@@ -29,13 +198,88 @@ def prepare_dataset(
         model_inputs["labels"] = labels["input_ids"]
         return model_inputs
 
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, f"tokenized-{fingerprint[:16]}.arrow")
+    # a single file, or one per process when written with num_proc
+    cached = cache_file_state(glob.glob(f"{cache_file[:-6]}*.arrow"))
+    start = time.perf_counter()
     tokenized = ds.map(
         tokenize_fn,
         batched=True,
         remove_columns=ds.column_names,
+        batch_size=map_batch_size,
+        num_proc=num_proc,
+        cache_file_name=cache_file,
+        new_fingerprint=fingerprint[:32],
+        load_from_cache_file=not force,
+        desc="Tokenizing",
+    )
+    seconds = time.perf_counter() - start
+    examples = len(tokenized)
+    # a cache hit reads files that all existed, unchanged, before the map
+    files = [f["filename"] for f in getattr(tokenized, "cache_files", [])]
+    from_cache = bool(files) and all(
+        cached.get(f) == state for f, state in cache_file_state(files).items()
     )
-    tokenized.save_to_disk(output_dir)
+    report = None
+    if pack:
+        before = tokens_per_step(
+            length_counts(tokenized, "input_ids"),
+            length_counts(tokenized, "labels"),
+            train_batch_size,
+        )
+        tokenized = tokenized.map(
+            pack_examples,
+            batched=True,
+            batch_size=PACK_WINDOW,
+            input_columns=["input_ids", "labels"],
+            remove_columns=tokenized.column_names,
+            fn_kwargs={"max_length": max_length},
+            # one process, so the rows do not depend on how num_proc shards it
+            cache_file_name=os.path.join(cache_dir, f"packed-{fingerprint[:16]}.arrow"),
+            new_fingerprint=f"packed-{fingerprint[:25]}",
+            load_from_cache_file=not force,
+            desc="Packing",
+        )
+        after = tokens_per_step(
+            length_counts(tokenized, "input_ids"),
+            length_counts(tokenized, "labels"),
+            train_batch_size,
+        )
+        report = {"batch_size": train_batch_size, "before": before, "after": after}
+        for name, row in (("unpacked", before), ("packed", after)):
+            print(
+                f"{name:>8}: {row['rows']} rows, {row['steps_per_epoch']} steps/epoch, "
+                f"{row['effective_tokens_per_step']} of "
+                f"{row['padded_tokens_per_step']} tokens/step are real "
+                f"({row['padding_pct']}% padding)"
+            )
+    # drop shards of an earlier, differently sharded save
+    for path in glob.glob(os.path.join(output_dir, "data-*.arrow")):
+        os.remove(path)
+    tokenized.save_to_disk(output_dir, num_shards=num_shards, num_proc=num_proc)
+    meta = {
+        "fingerprint": fingerprint,
+        "examples": examples,
+        "rows": len(tokenized),
+        "seconds": round(seconds, 3),
+        "examples_per_sec": None,
+        "num_proc": num_proc or 1,
+        "from_cache": from_cache,
+        "packing": report,
+    }
+    if from_cache:
+        print(f"Reused cached tokenization of {examples} examples")
+    else:
+        meta["examples_per_sec"] = round(examples / seconds, 1)
+        print(
+            f"Tokenized {examples} examples in {seconds:.1f}s "
+            f"({meta['examples_per_sec']} examples/sec, {meta['num_proc']} processes)"
+        )
+    with open(os.path.join(output_dir, META_FILE), "w", encoding="utf8") as f:
+        json.dump(meta, f, indent=2)
     print(f"Saved tokenized dataset to {output_dir}")
+    return dict(meta, reused=False)
 
 
 def main():
@@ -64,6 +308,39 @@ def main():
         default=512,
         help="Max sequence length after tokenization",
     )
+    parser.add_argument(
+        "--num-proc", type=int, default=None, help="Tokenization processes"
+    )
+    parser.add_argument(
+        "--map-batch-size",
+        type=int,
+        default=1000,
+        help="Examples per tokenizer call",
+    )
+    parser.add_argument(
+        "--num-shards", type=int, default=None, help="Arrow shards to save"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default="data/cache/tokenized",
+        help="Directory for cached tokenized shards",
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="Pack short examples into rows of up to --max-length tokens",
+    )
+    parser.add_argument(
+        "--train-batch-size",
+        type=int,
+        default=8,
+        help="Batch size used for the packing tokens-per-step report",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-tokenize even if the cached fingerprint matches",
+    )
     args = parser.parse_args()
     # load config overrides
     cfg = {}
@@ -76,12 +353,28 @@ def main():
         "output_dir": "output_dir",
         "model_name_or_path": "model_name_or_path",
         "max_length": "max_length",
+        "num_proc": "num_proc",
+        "map_batch_size": "map_batch_size",
+        "num_shards": "num_shards",
+        "cache_dir": "cache_dir",
+        "pack": "pack",
+        "train_batch_size": "train_batch_size",
     }
     for key, attr in mapping.items():
         if key in cfg:
             setattr(args, attr, cfg[key])
     prepare_dataset(
-        args.input, args.output_dir, args.model_name_or_path, args.max_length
+        args.input,
+        args.output_dir,
+        args.model_name_or_path,
+        args.max_length,
+        num_proc=args.num_proc,
+        map_batch_size=args.map_batch_size,
+        num_shards=args.num_shards,
+        cache_dir=args.cache_dir,
+        force=args.force,
+        pack=args.pack,
+        train_batch_size=args.train_batch_size,
     )
 
 
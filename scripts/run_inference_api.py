@@ -3,11 +3,39 @@
 Run a FastAPI server for inference using a fine-tuned Seq2Seq model.
 """
 import argparse
+import bisect
+import hashlib
+import json
+import multiprocessing
 import os
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
 
-from fastapi import Depends, FastAPI, Header, HTTPException
+import torch
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from transformers import (AutoModelForSeq2SeqLM, AutoTokenizer,
+                          TextIteratorStreamer)
+
+from scripts.clean_data import clean_text
+
+try:
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+except ImportError:
+    ort = None
+    ORTModelForSeq2SeqLM = None
+
+BACKENDS = ("pytorch", "onnx")
 
 app = FastAPI(title="QA Inference API")
 
@@ -23,6 +51,22 @@ class InferenceResponse(BaseModel):
 
 tokenizer = None
 model = None
+# identity of the loaded model, part of every response-cache key
+model_id = None
+# optional response cache for repeated questions (configured in main)
+cache = None
+# optional request-coalescing scheduler for /predict (configured in main)
+batcher = None
+# max questions per generate call in /predict_batch
+batch_chunk_size = 16
+# optional dedicated pool (threads or model-replica processes) for generate
+executor = None
+# admission control: max requests in flight before answering 503
+max_pending = None
+pending_requests = 0
+_pending_lock = threading.Lock()
+# generation stats collected inside a replica process, returned to the parent
+_stats_sink = None
 
 # optional API key enforcement (set via environment variable)
 API_KEY = os.environ.get("API_KEY")
@@ -33,11 +77,673 @@ def verify_api_key(x_api_key: str = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid API key")
 
 
-def init_model(model_dir: str):
-    """Load tokenizer and model from the specified directory."""
-    global tokenizer, model
+def load_seq2seq(
+    model_dir: str, backend: str = "pytorch", num_threads: Optional[int] = None
+):
+    """
+    Load a Seq2Seq model for the given backend.
+
+    ``backend="onnx"`` expects a directory with an exported encoder, decoder
+    and decoder-with-past ONNX model (as saved by optimum) and runs it with
+    ONNX Runtime on CPU; the result exposes the same ``generate`` API as the
+    PyTorch model.
+    """
+    if backend == "onnx":
+        if ORTModelForSeq2SeqLM is None:
+            raise RuntimeError(
+                "The onnx backend requires optimum[onnxruntime] to be installed."
+            )
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        return ORTModelForSeq2SeqLM.from_pretrained(
+            model_dir,
+            use_cache=True,
+            provider="CPUExecutionProvider",
+            session_options=options,
+        )
+    return AutoModelForSeq2SeqLM.from_pretrained(model_dir)
+
+
+def init_model(
+    model_dir: str,
+    load_model: bool = True,
+    backend: str = "pytorch",
+    num_threads: Optional[int] = None,
+):
+    """
+    Load tokenizer and model from the specified directory.
+
+    With ``load_model=False`` only the tokenizer is loaded, for a front-end
+    process whose model replicas live in worker processes.
+    """
+    global tokenizer, model, model_id
     tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
-    model = AutoModelForSeq2SeqLM.from_pretrained(model_dir)
+    if load_model:
+        model = load_seq2seq(model_dir, backend=backend, num_threads=num_threads)
+    model_id = f"{backend}:{model_fingerprint(model_dir)}"
+
+
+def model_fingerprint(model_dir: str) -> str:
+    """Identify a model directory by its path and the size/mtime of its files."""
+    h = hashlib.sha256(os.path.abspath(model_dir).encode("utf8"))
+    if os.path.isdir(model_dir):
+        for name in sorted(os.listdir(model_dir)):
+            st = os.stat(os.path.join(model_dir, name))
+            h.update(f"{name}:{st.st_size}:{st.st_mtime_ns}".encode("utf8"))
+    return h.hexdigest()
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+TOKEN_RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class Histogram:
+    """Fixed-bucket histogram; ``observe`` is a bisect plus three additions."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, **labels) -> List[str]:
+        lines = []
+        cumulative = 0
+        bounds = [f"{b:g}" for b in self.buckets] + ["+Inf"]
+        for bound, n in zip(bounds, self.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        suffix = _labels(**labels) if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class ServerMetrics:
+    """
+    In-process counters and histograms rendered in Prometheus text format.
+
+    Every update takes one lock and touches a few integers, so it is cheap
+    enough to stay enabled in production.
+    """
+
+    STAGES = ("tokenize", "generate", "decode")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.request_latency = {}
+        self.stage_latency = {
+            stage: Histogram(LATENCY_BUCKETS) for stage in self.STAGES
+        }
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.tokens_per_second = Histogram(TOKEN_RATE_BUCKETS)
+        self.time_to_first_token = Histogram(LATENCY_BUCKETS)
+        self.generated_tokens = 0
+
+    def observe_request(self, path: str, status: int, seconds: float):
+        with self._lock:
+            key = (path, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if path not in self.request_latency:
+                self.request_latency[path] = Histogram(LATENCY_BUCKETS)
+            self.request_latency[path].observe(seconds)
+
+    def observe_generation(self, stats: dict):
+        with self._lock:
+            for stage in self.STAGES:
+                self.stage_latency[stage].observe(stats[stage])
+            self.batch_size.observe(stats["batch_size"])
+            self.generated_tokens += stats["tokens"]
+            if stats["generate"] > 0:
+                self.tokens_per_second.observe(stats["tokens"] / stats["generate"])
+
+    def observe_ttft(self, seconds: float):
+        with self._lock:
+            self.time_to_first_token.observe(seconds)
+
+    def render(self, gauges: dict) -> str:
+        with self._lock:
+            lines = [
+                "# HELP localllm_requests_total HTTP requests by path and status.",
+                "# TYPE localllm_requests_total counter",
+            ]
+            for (path, status), n in sorted(self.requests.items()):
+                labels = _labels(path=path, status=status)
+                lines.append(f"localllm_requests_total{labels} {n}")
+            lines += [
+                "# HELP localllm_request_seconds End-to-end request latency.",
+                "# TYPE localllm_request_seconds histogram",
+            ]
+            for path, hist in sorted(self.request_latency.items()):
+                lines += hist.render("localllm_request_seconds", path=path)
+            lines += [
+                "# HELP localllm_stage_seconds Latency of tokenize/generate/decode.",
+                "# TYPE localllm_stage_seconds histogram",
+            ]
+            for stage in self.STAGES:
+                lines += self.stage_latency[stage].render(
+                    "localllm_stage_seconds", stage=stage
+                )
+            lines += [
+                "# HELP localllm_batch_size Questions per generate call.",
+                "# TYPE localllm_batch_size histogram",
+                *self.batch_size.render("localllm_batch_size"),
+                "# HELP localllm_generated_tokens_total Tokens produced by generate.",
+                "# TYPE localllm_generated_tokens_total counter",
+                f"localllm_generated_tokens_total {self.generated_tokens}",
+                "# HELP localllm_tokens_per_second Generated tokens per second "
+                "of generate time, per call.",
+                "# TYPE localllm_tokens_per_second histogram",
+                *self.tokens_per_second.render("localllm_tokens_per_second"),
+                "# HELP localllm_time_to_first_token_seconds Streaming TTFT.",
+                "# TYPE localllm_time_to_first_token_seconds histogram",
+                *self.time_to_first_token.render(
+                    "localllm_time_to_first_token_seconds"
+                ),
+            ]
+        for name, (kind, help_text, value) in gauges.items():
+            lines += [
+                f"# HELP {name} {help_text}",
+                f"# TYPE {name} {kind}",
+                f"{name} {value}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+metrics = ServerMetrics()
+
+
+def record_generation(stats: dict):
+    """Record stats for one generate call (buffered when inside a replica)."""
+    if _stats_sink is not None:
+        _stats_sink.append(stats)
+    else:
+        metrics.observe_generation(stats)
+
+
+def _count_tokens(outputs) -> int:
+    pad_id = getattr(tokenizer, "pad_token_id", None)
+    if isinstance(outputs, torch.Tensor) and pad_id is not None:
+        return int((outputs != pad_id).sum())
+    return sum(len(out) for out in outputs)
+
+
+def generate_answers(questions: List[str], max_length: int) -> List[str]:
+    """Run a single padded ``generate`` call and decode one answer per question."""
+    t0 = time.perf_counter()
+    inputs = tokenizer(
+        questions,
+        return_tensors="pt",
+        padding=True,
+        truncation=True,
+        max_length=max_length,
+    )
+    t1 = time.perf_counter()
+    outputs = model.generate(
+        input_ids=inputs.input_ids,
+        attention_mask=inputs.attention_mask,
+        max_length=max_length,
+    )
+    t2 = time.perf_counter()
+    if len(outputs) != len(questions):
+        raise RuntimeError(
+            "Model failed to generate an output. Please try again or check the input."
+        )
+    answers = [tokenizer.decode(out, skip_special_tokens=True) for out in outputs]
+    record_generation(
+        {
+            "batch_size": len(questions),
+            "tokenize": t1 - t0,
+            "generate": t2 - t1,
+            "decode": time.perf_counter() - t2,
+            "tokens": _count_tokens(outputs),
+        }
+    )
+    return answers
+
+
+def _replica_call(fn, *args):
+    """Run ``fn`` in a replica process, returning its generation stats as well."""
+    global _stats_sink
+    _stats_sink = []
+    try:
+        return fn(*args), _stats_sink
+    finally:
+        _stats_sink = None
+
+
+class ReplicaPool(ProcessPoolExecutor):
+    """Process pool of model replicas that relays their stats to ``metrics``."""
+
+    def submit(self, fn, *args, **kwargs):
+        job = super().submit(_replica_call, fn, *args)
+        result: Future = Future()
+
+        def _relay(done: Future):
+            exc = done.exception()
+            if exc is not None:
+                result.set_exception(exc)
+                return
+            value, stats = done.result()
+            for entry in stats:
+                metrics.observe_generation(entry)
+            result.set_result(value)
+
+        job.add_done_callback(_relay)
+        return result
+
+
+def _init_worker(
+    model_dir: Optional[str], num_threads: Optional[int], backend: str = "pytorch"
+):
+    """Set a worker's intra-op thread budget; replica processes also load the model."""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if model_dir:
+        init_model(model_dir, backend=backend, num_threads=num_threads)
+
+
+def init_executor(
+    kind: str,
+    workers: int,
+    threads_per_worker: Optional[int] = None,
+    model_dir: Optional[str] = None,
+    backend: str = "pytorch",
+):
+    """
+    Create the pool that runs ``generate_answers``.
+
+    ``kind="thread"`` shares the server's model across ``workers`` threads;
+    ``kind="process"`` starts ``workers`` spawned processes, each holding its
+    own model replica loaded from ``model_dir``.
+    """
+    global executor
+    if kind == "process":
+        executor = ReplicaPool(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_dir, threads_per_worker, backend),
+        )
+        # start every replica now instead of on the first requests
+        for fut in [executor.submit(os.getpid) for _ in range(workers)]:
+            fut.result()
+    else:
+        executor = ThreadPoolExecutor(
+            workers,
+            thread_name_prefix="generate",
+            initializer=_init_worker,
+            initargs=(None, threads_per_worker),
+        )
+
+
+def submit_generate(questions: List[str], max_length: int) -> Future:
+    """Schedule ``generate_answers`` on the worker pool, or run it inline."""
+    if executor is not None:
+        return executor.submit(generate_answers, questions, max_length)
+    fut: Future = Future()
+    try:
+        fut.set_result(generate_answers(questions, max_length))
+    except Exception as exc:
+        fut.set_exception(exc)
+    return fut
+
+
+def generate_bucketed(
+    questions: List[str], max_length: int, chunk_size: int
+) -> List[str]:
+    """
+    Generate answers in chunks of similar token length, returned in input order.
+
+    Sorting by length before chunking keeps short questions from being padded
+    to the longest question in the whole request.
+    """
+    if not questions:
+        return []
+    encoded = tokenizer(questions, truncation=True, max_length=max_length)
+    lengths = [len(ids) for ids in encoded.input_ids]
+    order = sorted(range(len(questions)), key=lambda i: lengths[i])
+    chunks = [order[i : i + chunk_size] for i in range(0, len(order), chunk_size)]
+    # submit every chunk first so a worker pool can run them concurrently
+    jobs = [submit_generate([questions[i] for i in c], max_length) for c in chunks]
+    answers: List[Optional[str]] = [None] * len(questions)
+    for chunk, job in zip(chunks, jobs):
+        for i, answer in zip(chunk, job.result()):
+            answers[i] = answer
+    return answers
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-question requests into batched ``generate`` calls.
+
+    A background worker takes the first queued request, then keeps collecting
+    until ``max_batch_size`` requests are pending or ``max_wait_ms`` has elapsed.
+    Requests are grouped by ``max_length`` so each group shares generation
+    parameters, and every caller receives its own answer through a ``Future``.
+    With an ``executor``, batches are handed to it so several can run at once.
+    """
+
+    def __init__(
+        self,
+        generate_fn,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        executor=None,
+    ):
+        self.generate_fn = generate_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self._queue: "queue.Queue[Optional[Tuple[str, int, Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, question: str, max_length: int) -> Future:
+        fut: Future = Future()
+        self._queue.put((question, max_length, fut))
+        return fut
+
+    def _collect(self):
+        """Block for one request, then gather more until size or deadline."""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # finish the current batch, then let the next _collect stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            groups = {}
+            for question, max_length, fut in batch:
+                groups.setdefault(max_length, []).append((question, fut))
+            for max_length, items in groups.items():
+                self._dispatch(
+                    [q for q, _ in items], max_length, [fut for _, fut in items]
+                )
+
+    def _dispatch(self, questions: List[str], max_length: int, futures: List[Future]):
+        if self.executor is not None:
+            job = self.executor.submit(self.generate_fn, questions, max_length)
+            job.add_done_callback(lambda done: self._resolve(futures, done))
+            return
+        job = Future()
+        try:
+            job.set_result(self.generate_fn(questions, max_length))
+        except Exception as exc:  # propagate to every waiting caller
+            job.set_exception(exc)
+        self._resolve(futures, job)
+
+    @staticmethod
+    def _resolve(futures: List[Future], job: Future):
+        exc = job.exception()
+        if exc is not None:
+            for fut in futures:
+                fut.set_exception(exc)
+            return
+        for fut, answer in zip(futures, job.result()):
+            fut.set_result(answer)
+
+
+def init_batcher(max_batch_size: int, max_wait_ms: float):
+    """Start the micro-batching scheduler used by /predict."""
+    global batcher
+    batcher = MicroBatcher(
+        generate_answers,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        executor=executor,
+    ).start()
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of generated answers with optional TTL and disk store.
+
+    Keys combine the question normalized with ``clean_text``, the model
+    identity and the generation parameters. When ``path`` is given, entries are
+    also written to a SQLite file so the cache survives restarts; memory and
+    disk are both capped at ``max_entries``. Disk writes are committed at
+    most once per ``COMMIT_INTERVAL`` seconds (and on ``flush``).
+    """
+
+    COMMIT_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: Optional[float] = None,
+        path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_rows = 0
+        self._last_commit = 0.0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            # WAL without a sync per commit: a crash can lose recent entries
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, created REAL, answer TEXT)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_created ON responses (created)"
+            )
+            self._db.commit()
+            self._db_rows = self._db.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+            # commit whatever is pending when the cache goes away or at exit
+            weakref.finalize(self, self._db.commit)
+
+    @staticmethod
+    def make_key(question: str, model_id: Optional[str], max_length: int) -> str:
+        raw = json.dumps([clean_text(question), model_id, max_length])
+        return hashlib.sha256(raw.encode("utf8")).hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, answer FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+            if entry is None or self._expired(entry[0]):
+                if entry is not None:
+                    self._forget(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, answer: str):
+        entry = (time.time(), answer)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                exists = self._db.execute(
+                    "SELECT 1 FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                    (key, entry[0], answer),
+                )
+                if not exists:
+                    self._db_rows += 1
+                if self._db_rows > self.max_entries:
+                    # drop the oldest rows through the index on created
+                    self._db.execute(
+                        "DELETE FROM responses WHERE key IN (SELECT key FROM "
+                        "responses ORDER BY created LIMIT ?)",
+                        (self._db_rows - self.max_entries,),
+                    )
+                    self._db_rows = self.max_entries
+                self._maybe_commit()
+
+    def _maybe_commit(self):
+        # batch writes into at most one commit per COMMIT_INTERVAL
+        now = time.monotonic()
+        if now - self._last_commit >= self.COMMIT_INTERVAL:
+            self._db.commit()
+            self._last_commit = now
+
+    def flush(self):
+        """Commit pending disk writes."""
+        if self._db is not None:
+            with self._lock:
+                self._db.commit()
+                self._last_commit = time.monotonic()
+
+    def _remember(self, key: str, entry: Tuple[float, str]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _forget(self, key: str):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            deleted = self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db_rows -= deleted.rowcount
+            self._maybe_commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def init_cache(
+    max_entries: int, ttl_seconds: Optional[float] = None, path: Optional[str] = None
+):
+    """Enable the response cache shared by all prediction endpoints."""
+    global cache
+    cache = ResponseCache(max_entries, ttl_seconds=ttl_seconds, path=path)
+
+
+def answer_questions(questions: List[str], max_length: int, generate_fn) -> List[str]:
+    """Serve cached answers and call ``generate_fn`` only for the misses."""
+    if cache is None:
+        return generate_fn(questions, max_length)
+    keys = [ResponseCache.make_key(q, model_id, max_length) for q in questions]
+    answers = [cache.get(key) for key in keys]
+    missing = [i for i, answer in enumerate(answers) if answer is None]
+    if missing:
+        generated = generate_fn([questions[i] for i in missing], max_length)
+        for i, answer in zip(missing, generated):
+            cache.put(keys[i], answer)
+            answers[i] = answer
+    return answers
+
+
+def _generate_single(questions: List[str], max_length: int) -> List[str]:
+    if batcher is not None:
+        return [batcher.submit(questions[0], max_length).result()]
+    return submit_generate(questions, max_length).result()
+
+
+def _generate_chunked(questions: List[str], max_length: int) -> List[str]:
+    return generate_bucketed(questions, max_length, batch_chunk_size)
+
+
+def _require_model():
+    replicas = isinstance(executor, ProcessPoolExecutor)
+    if tokenizer is None or (model is None and not replicas):
+        raise HTTPException(
+            status_code=503,
+            detail="Model not initialized. Please start server via script.",
+        )
+
+
+def _check_capacity():
+    """Reject the request with 503 when the server is full."""
+    if max_pending is not None and pending_requests >= max_pending:
+        raise HTTPException(
+            status_code=503,
+            detail="Server overloaded. Please retry later.",
+            headers={"Retry-After": "1"},
+        )
+
+
+def _admit():
+    """Count a request in flight, rejecting it with 503 when the server is full."""
+    global pending_requests
+    with _pending_lock:
+        _check_capacity()
+        pending_requests += 1
+
+
+def _release():
+    global pending_requests
+    with _pending_lock:
+        pending_requests -= 1
+
+
+@contextmanager
+def admitted():
+    _admit()
+    try:
+        yield
+    finally:
+        _release()
 
 
 @app.post(
@@ -45,36 +751,207 @@ def init_model(model_dir: str):
     response_model=InferenceResponse,
     dependencies=[Depends(verify_api_key)],
 )
-def predict(req: InferenceRequest):
-    if model is None or tokenizer is None:
-        raise HTTPException(
-            status_code=503,
-            detail="Model not initialized. Please start server via script.",
-        )
+async def predict(req: InferenceRequest):
+    _require_model()
+    with admitted():
+        try:
+            answers = await run_in_threadpool(
+                answer_questions, [req.question], req.max_length, _generate_single
+            )
+        except RuntimeError as exc:
+            raise HTTPException(status_code=500, detail=str(exc))
+    return InferenceResponse(answer=answers[0])
+
+
+def _sse(payload: dict) -> str:
+    """Format a payload as a single Server-Sent Events message."""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _stream_text(question: str, max_length: int, errors: List[Exception]):
+    """Yield decoded text chunks as ``generate`` produces them."""
+    if isinstance(executor, ProcessPoolExecutor):
+        # replicas live in other processes, so send the full answer as one chunk
+        try:
+            yield submit_generate([question], max_length).result()[0]
+        except Exception as exc:
+            errors.append(exc)
+        return
     inputs = tokenizer(
-        req.question, return_tensors="pt", truncation=True, max_length=req.max_length
+        question, return_tensors="pt", truncation=True, max_length=max_length
     )
-    outputs = model.generate(
-        input_ids=inputs.input_ids,
-        attention_mask=inputs.attention_mask,
-        max_length=req.max_length,
+    streamer = TextIteratorStreamer(
+        tokenizer, skip_prompt=True, skip_special_tokens=True
     )
-    if not outputs:
-        raise HTTPException(
-            status_code=500,
-            detail="Model failed to generate an output. Please try again or check the input.",
+
+    def _generate():
+        try:
+            model.generate(
+                input_ids=inputs.input_ids,
+                attention_mask=inputs.attention_mask,
+                max_length=max_length,
+                streamer=streamer,
+            )
+        except Exception as exc:  # surface to the client instead of hanging
+            errors.append(exc)
+            streamer.end()
+
+    if executor is not None:
+        executor.submit(_generate)
+    else:
+        threading.Thread(target=_generate, daemon=True).start()
+    yield from streamer
+
+
+def stream_answer(question: str, max_length: int):
+    """
+    Yield SSE messages with decoded text as the model generates it.
+
+    ``generate`` runs in a background thread (or the worker pool) and pushes
+    text into a ``TextIteratorStreamer``; each chunk is emitted as
+    ``{"token": ...}``. The final message is ``{"done": true}`` with the
+    server-side time to first token and total generation time, or
+    ``{"error": ...}`` if generation failed.
+    """
+    start = time.perf_counter()
+    key = None
+    if cache is not None:
+        key = ResponseCache.make_key(question, model_id, max_length)
+        cached = cache.get(key)
+        if cached is not None:
+            yield _sse({"token": cached})
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            yield _sse({"done": True, "ttft_ms": elapsed_ms, "total_ms": elapsed_ms})
+            return
+    errors: List[Exception] = []
+    ttft_ms = None
+    parts: List[str] = []
+    for text in _stream_text(question, max_length, errors):
+        if not text:
+            continue
+        if ttft_ms is None:
+            ttft_ms = (time.perf_counter() - start) * 1000
+            metrics.observe_ttft(ttft_ms / 1000)
+        parts.append(text)
+        yield _sse({"token": text})
+    if errors:
+        yield _sse({"error": str(errors[0])})
+        return
+    if key is not None:
+        cache.put(key, "".join(parts))
+    total_ms = (time.perf_counter() - start) * 1000
+    yield _sse({"done": True, "ttft_ms": ttft_ms, "total_ms": total_ms})
+
+
+def _admitted_stream(stream):
+    """
+    Hold an admission slot only while ``stream`` is consumed, so a body that
+    is never iterated (client gone, middleware error) cannot leak one.
+    """
+    try:
+        _admit()
+    except HTTPException as exc:
+        # filled up after the response started
+        yield _sse({"error": exc.detail})
+        return
+    try:
+        yield from stream
+    finally:
+        _release()
+
+
+@app.post("/predict_stream", dependencies=[Depends(verify_api_key)])
+async def predict_stream(req: InferenceRequest):
+    """Stream the answer for a single question as Server-Sent Events."""
+    _require_model()
+    # reject up front while a 503 status can still be sent
+    _check_capacity()
+    return StreamingResponse(
+        _admitted_stream(stream_answer(req.question, req.max_length)),
+        media_type="text/event-stream",
+    )
+
+
+_route_paths: Optional[frozenset] = None
+
+
+@app.middleware("http")
+async def record_requests(request: Request, call_next):
+    global _route_paths
+    start = time.perf_counter()
+    response = await call_next(request)
+    if _route_paths is None:
+        _route_paths = frozenset(route.path for route in app.routes)
+    path = request.url.path if request.url.path in _route_paths else "other"
+    body = response.body_iterator
+
+    async def recorded_body():
+        # observe once the body is sent, so streamed answers count in full
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            metrics.observe_request(
+                path, response.status_code, time.perf_counter() - start
+            )
+
+    response.body_iterator = recorded_body()
+    return response
+
+
+@app.get("/metrics", dependencies=[Depends(verify_api_key)])
+def metrics_endpoint():
+    """Expose request, stage latency, batching and cache metrics for Prometheus."""
+    gauges = {
+        "localllm_requests_in_flight": (
+            "gauge",
+            "Requests admitted and not yet answered.",
+            pending_requests,
+        ),
+        "localllm_batcher_queue_depth": (
+            "gauge",
+            "Requests waiting in the micro-batching queue.",
+            batcher.queue_depth() if batcher is not None else 0,
+        ),
+    }
+    if cache is not None:
+        stats = cache.stats()
+        gauges.update(
+            {
+                "localllm_cache_hits_total": (
+                    "counter",
+                    "Response cache hits.",
+                    stats["hits"],
+                ),
+                "localllm_cache_misses_total": (
+                    "counter",
+                    "Response cache misses.",
+                    stats["misses"],
+                ),
+                "localllm_cache_hit_ratio": (
+                    "gauge",
+                    "Response cache hit ratio.",
+                    stats["hit_rate"],
+                ),
+                "localllm_cache_entries": (
+                    "gauge",
+                    "Answers held in memory.",
+                    stats["size"],
+                ),
+            }
         )
-    answer = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    return InferenceResponse(answer=answer)
+    return PlainTextResponse(
+        metrics.render(gauges), media_type="text/plain; version=0.0.4"
+    )
 
 
 @app.get("/health", dependencies=[Depends(verify_api_key)])
 def health():
     """Health check endpoint returning service status."""
-    return {"status": "ok"}
-
-
-from typing import List
+    status = {"status": "ok"}
+    if cache is not None:
+        status["cache"] = cache.stats()
+    return status
 
 
 class BatchRequest(BaseModel):
@@ -91,34 +968,119 @@ class BatchResponse(BaseModel):
     response_model=BatchResponse,
     dependencies=[Depends(verify_api_key)],
 )
-def predict_batch(req: BatchRequest):
+async def predict_batch(req: BatchRequest):
     """Handle batch inference for a list of questions."""
-    if model is None or tokenizer is None:
-        raise HTTPException(status_code=503, detail="Model not initialized.")
-    answers: List[str] = []
-    for question in req.questions:
-        inputs = tokenizer(
-            question, return_tensors="pt", truncation=True, max_length=req.max_length
-        )
-        outputs = model.generate(
-            input_ids=inputs.input_ids,
-            attention_mask=inputs.attention_mask,
-            max_length=req.max_length,
-        )
-        answers.append(tokenizer.decode(outputs[0], skip_special_tokens=True))
+    _require_model()
+    with admitted():
+        try:
+            answers = await run_in_threadpool(
+                answer_questions, req.questions, req.max_length, _generate_chunked
+            )
+        except RuntimeError as exc:
+            raise HTTPException(status_code=500, detail=str(exc))
     return BatchResponse(answers=answers)
 
 
 def main():
+    global batch_chunk_size, max_pending
     parser = argparse.ArgumentParser(description="Serve QA model via FastAPI")
     parser.add_argument(
         "--model-dir", required=True, help="Directory of the fine-tuned model to serve"
     )
     parser.add_argument("--host", default="0.0.0.0", help="Host/IP to bind the server")
     parser.add_argument("--port", type=int, default=8000, help="Port for the server")
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="pytorch",
+        help="Inference runtime: PyTorch, or ONNX Runtime for an exported model dir",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=1,
+        help="Coalesce up to this many concurrent /predict requests per generate "
+        "call (1 disables micro-batching)",
+    )
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=10.0,
+        help="Max time to wait for a micro-batch to fill before running it",
+    )
+    parser.add_argument(
+        "--batch-chunk-size",
+        type=int,
+        default=16,
+        help="Max questions per generate call in /predict_batch",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=0,
+        help="Max cached answers for repeated questions (0 disables the cache)",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=None,
+        help="Seconds before a cached answer expires (default: never)",
+    )
+    parser.add_argument(
+        "--cache-path",
+        default=None,
+        help="SQLite file backing the response cache across restarts",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help="Run generate on a thread pool sharing one model, or on a pool of "
+        "model-replica processes",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Size of the generate pool (0 runs generate on the request threads)",
+    )
+    parser.add_argument(
+        "--threads-per-worker",
+        type=int,
+        default=None,
+        help="torch.set_num_threads budget for each generate worker",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=None,
+        help="Reject requests with 503 once this many are in flight",
+    )
     args = parser.parse_args()
 
-    init_model(args.model_dir)
+    replicas = args.executor == "process" and args.workers > 0
+    init_model(
+        args.model_dir,
+        load_model=not replicas,
+        backend=args.backend,
+        num_threads=args.threads_per_worker,
+    )
+    batch_chunk_size = args.batch_chunk_size
+    max_pending = args.max_pending
+    if args.workers > 0:
+        init_executor(
+            args.executor,
+            args.workers,
+            threads_per_worker=args.threads_per_worker,
+            model_dir=args.model_dir,
+            backend=args.backend,
+        )
+    elif args.threads_per_worker:
+        torch.set_num_threads(args.threads_per_worker)
+    if args.max_batch_size > 1:
+        init_batcher(args.max_batch_size, args.max_wait_ms)
+    if args.cache_size > 0:
+        init_cache(args.cache_size, ttl_seconds=args.cache_ttl, path=args.cache_path)
     import uvicorn
 
     uvicorn.run(app, host=args.host, port=args.port)
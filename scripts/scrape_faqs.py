@@ -1,54 +1,307 @@
 #!/usr/bin/env python3
 """
 Scrape FAQ pages for simple Q&A extraction.
+
+Pages are fetched concurrently with asyncio, with a per-host connection
+limit and politeness delay. Responses are kept in an on-disk cache and
+revalidated with ETag/Last-Modified, so an unchanged page costs a 304 and
+no re-parse. Q&A pairs are appended to JSONL as each page is done.
 """
 import argparse
+import asyncio
+import hashlib
 import json
 import os
-import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString, Tag
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+# bump when parse_faq_html changes, so cached pages are re-parsed
+PARSER_VERSION = 2
+HEADINGS = ("h2", "h3")
+PARSERS = ("auto", "lxml", "html.parser")
+
+
+def resolve_parser(parser: str = "auto") -> str:
+    """BeautifulSoup backend for ``parser``; ``auto`` prefers lxml if installed."""
+    if parser == "auto":
+        return "lxml" if lxml is not None else "html.parser"
+    if parser == "lxml" and lxml is None:
+        raise RuntimeError("the lxml parser requires lxml to be installed.")
+    return parser
+
+
+def _text(node) -> str:
+    if isinstance(node, Tag):
+        return node.get_text(strip=True)
+    # comments, CDATA, doctypes etc. are NavigableString subclasses too
+    return node.strip() if type(node) is NavigableString else ""
+
+
+def parse_faq_html(html: str, parser: str = "auto"):
+    """
+    Extract Q&A pairs from three FAQ layouts, in document order:
+
+    - an h2/h3 heading followed by sibling paragraphs, up to the next heading
+    - ``<dl>`` lists, pairing each ``<dt>`` with the ``<dd>``s after it
+    - ``<details>`` blocks, whose ``<summary>`` is the question
+
+    Headings are grouped with their paragraphs in one walk over the children
+    of each heading's parent, so the work is linear in the page size.
+    """
+    soup = BeautifulSoup(html, resolve_parser(parser))
+    blocks = soup.find_all([*HEADINGS, "dl", "details"])
+    answers = {}
+    parents = {id(b.parent): b.parent for b in blocks if b.name in HEADINGS}
+    for parent in parents.values():
+        current = None
+        for child in parent.children:
+            if child.name in HEADINGS:
+                current = answers.setdefault(id(child), [])
+            elif child.name == "p" and current is not None:
+                current.append(child.get_text(strip=True))
 
-def scrape_faq_page(url):
-    resp = requests.get(url)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
     faqs = []
-    for header in soup.find_all(["h2", "h3"]):
-        question = header.get_text(strip=True)
-        answer_parts = []
-        for sib in header.find_next_siblings():
-            if sib.name in ["h2", "h3"]:
-                break
-            if sib.name == "p":
-                answer_parts.append(sib.get_text(strip=True))
-        if answer_parts:
-            faqs.append({"question": question, "answer": " ".join(answer_parts)})
+    for block in blocks:
+        if block.name in HEADINGS:
+            pairs = [(block.get_text(strip=True), answers[id(block)])]
+        elif block.name == "dl":
+            pairs = []
+            for child in block.find_all(["dt", "dd"], recursive=False):
+                if child.name == "dt":
+                    pairs.append((child.get_text(strip=True), []))
+                elif pairs:
+                    pairs[-1][1].append(child.get_text(strip=True))
+        else:
+            summary = block.find("summary", recursive=False)
+            if summary is None:
+                continue
+            body = [_text(c) for c in block.children if c is not summary]
+            pairs = [(summary.get_text(strip=True), body)]
+        for question, parts in pairs:
+            answer = " ".join(part for part in parts if part)
+            if question and answer:
+                faqs.append({"question": question, "answer": answer})
     return faqs
 
 
+def scrape_faq_page(url, parser: str = "auto"):
+    resp = requests.get(url)
+    resp.raise_for_status()
+    return parse_faq_html(resp.text, parser)
+
+
+class HTTPCache:
+    """
+    One JSON file per URL under ``cache_dir`` holding the validators, body
+    and parsed FAQs of the last 200 response.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest())
+
+    def get(self, url: str):
+        try:
+            with open(self._path(url), "r", encoding="utf8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url: str, entry: dict):
+        path = self._path(url)
+        with open(f"{path}.tmp", "w", encoding="utf8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def validators(entry) -> dict:
+        """Conditional request headers for a cached ``entry``."""
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+class HostThrottle:
+    """
+    At most ``per_host`` requests in flight per host, with request starts
+    to the same host spaced ``delay`` seconds apart.
+    """
+
+    def __init__(self, per_host: int = 2, delay: float = 1.0):
+        self.delay = delay
+        self._slots = defaultdict(lambda: asyncio.Semaphore(per_host))
+        self._next = defaultdict(float)
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        async with self._slots[host]:
+            now = asyncio.get_running_loop().time()
+            start = max(now, self._next[host])
+            self._next[host] = start + self.delay
+            if start > now:
+                await asyncio.sleep(start - now)
+            yield
+
+
+async def fetch_faqs(
+    client, url: str, cache: HTTPCache, throttle: HostThrottle, parser: str = "auto"
+):
+    """Return ``(faqs, status)`` for ``url``, revalidating any cached copy."""
+    version = f"{PARSER_VERSION}/{resolve_parser(parser)}"
+    entry = cache.get(url)
+    async with throttle.slot(urlsplit(url).netloc):
+        resp = await client.get(url, headers=HTTPCache.validators(entry))
+    if resp.status_code == 304 and entry:
+        if entry.get("parser") != version:
+            faqs = await asyncio.to_thread(parse_faq_html, entry["body"], parser)
+            entry.update(faqs=faqs, parser=version)
+            cache.put(url, entry)
+        return entry["faqs"], 304
+    resp.raise_for_status()
+    # parse off the event loop so other hosts' requests keep going
+    faqs = await asyncio.to_thread(parse_faq_html, resp.text, parser)
+    if resp.headers.get("ETag") or resp.headers.get("Last-Modified"):
+        cache.put(
+            url,
+            {
+                "url": url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "body": resp.text,
+                "faqs": faqs,
+                "parser": version,
+            },
+        )
+    return faqs, resp.status_code
+
+
+async def scrape_all(
+    urls,
+    output_path: str,
+    cache_dir: str,
+    per_host: int = 2,
+    delay: float = 1.0,
+    concurrency: int = 16,
+    timeout: float = 30.0,
+    transport=None,
+    parser: str = "auto",
+) -> dict:
+    """
+    Scrape ``urls`` concurrently and write their Q&A pairs (tagged with the
+    page ``url``) to ``output_path`` as JSONL, in URL order, as soon as each
+    page and all earlier ones are done. Failed pages are reported and
+    skipped. Returns counts of records, fetched pages, 304s and errors.
+    """
+    if httpx is None:
+        raise RuntimeError("scrape_all requires httpx to be installed.")
+    cache = HTTPCache(cache_dir)
+    throttle = HostThrottle(per_host, delay)
+    limit = asyncio.Semaphore(concurrency)
+    summary = {"records": 0, "fetched": 0, "not_modified": 0, "errors": 0}
+
+    async def scrape(client, url):
+        async with limit:
+            return await fetch_faqs(client, url, cache, throttle, parser)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    async with httpx.AsyncClient(
+        timeout=timeout, follow_redirects=True, transport=transport
+    ) as client:
+        tasks = [asyncio.ensure_future(scrape(client, url)) for url in urls]
+        try:
+            with open(output_path, "w", encoding="utf8") as out:
+                for url, task in zip(urls, tasks):
+                    try:
+                        faqs, status = await task
+                    except Exception as exc:
+                        print(f"Failed {url}: {exc}")
+                        summary["errors"] += 1
+                        continue
+                    summary["not_modified" if status == 304 else "fetched"] += 1
+                    for faq in faqs:
+                        record = dict(faq, url=url)
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    summary["records"] += len(faqs)
+        finally:
+            # on an error outside a page (e.g. writing the output) or a
+            # cancellation, do not leave the other pages running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return summary
+
+
 def main():
     parser = argparse.ArgumentParser(description="Scrape FAQ pages for Q&A pairs")
     parser.add_argument(
         "--urls", required=True, nargs="+", help="List of FAQ page URLs"
     )
-    parser.add_argument("--output", default="data/raw/faqs.json")
+    parser.add_argument("--output", default="data/raw/faqs.jsonl")
     parser.add_argument(
-        "--delay", type=float, default=1.0, help="Delay between requests in seconds"
+        "--delay",
+        type=float,
+        default=1.0,
+        help="Delay between requests to the same host in seconds",
+    )
+    parser.add_argument(
+        "--per-host", type=int, default=2, help="Concurrent requests per host"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="Concurrent requests overall"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default="data/cache/faqs",
+        help="HTTP cache directory used for conditional requests",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30.0, help="Per-request timeout in seconds"
+    )
+    parser.add_argument(
+        "--parser",
+        choices=PARSERS,
+        default="auto",
+        help="HTML parser backend (auto uses lxml when installed)",
     )
     args = parser.parse_args()
-    all_faqs = []
-    for url in args.urls:
-        print(f"Scraping {url}")
-        faqs = scrape_faq_page(url)
-        all_faqs.extend(faqs)
-        time.sleep(args.delay)
-    os.makedirs(os.path.dirname(args.output), exist_ok=True)
-    with open(args.output, "w") as f:
-        json.dump(all_faqs, f, indent=2)
-    print(f"Saved {len(all_faqs)} entries to {args.output}")
+    summary = asyncio.run(
+        scrape_all(
+            args.urls,
+            args.output,
+            args.cache_dir,
+            per_host=args.per_host,
+            delay=args.delay,
+            concurrency=args.concurrency,
+            timeout=args.timeout,
+            parser=args.parser,
+        )
+    )
+    print(
+        f"Saved {summary['records']} entries to {args.output} "
+        f"({summary['fetched']} pages fetched, {summary['not_modified']} unchanged, "
+        f"{summary['errors']} failed)"
+    )
 
 
 if __name__ == "__main__":
@@ -1,61 +1,362 @@
 #!/usr/bin/env python3
 """
 Compute dataset statistics: average tokens in question/answer and vocabulary size.
-"""
 
+Input files (or shards) are split into byte ranges that worker processes
+scan in one pass, returning mergeable partial stats. The vocabulary is
+counted exactly or with a HyperLogLog sketch, and with a tokenizer the
+subword length distributions and padding waste are reported as well.
+"""
 import argparse
+import glob
+import hashlib
 import json
+import math
+import os
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# bytes of JSONL scanned per worker task
+STATS_CHUNK = 1 << 23
+# texts per fast-tokenizer call
+TOKEN_BATCH = 1000
+PERCENTILES = (50, 90, 95, 99)
+
+_tokenizer = None
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter with ``2**precision`` one-byte registers
+    (16 KiB and about 0.8% standard error at the default precision 14).
+    """
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item: str):
+        h = hashlib.blake2b(item.encode("utf8"), digest_size=8).digest()
+        x = int.from_bytes(h, "little")
+        index = x & ((1 << self.precision) - 1)
+        rank = 64 - self.precision - (x >> self.precision).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def __len__(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class StatsAccumulator:
+    """Partial statistics over part of the corpus; ``merge`` combines them."""
+
+    def __init__(self, distinct: str = "exact", hll_precision: int = 14):
+        self.records = 0
+        self.q_words = 0
+        self.a_words = 0
+        self.vocab = HyperLogLog(hll_precision) if distinct == "hll" else set()
+        self.q_lengths = Counter()
+        self.a_lengths = Counter()
+
+    def merge(self, other: "StatsAccumulator"):
+        self.records += other.records
+        self.q_words += other.q_words
+        self.a_words += other.a_words
+        if isinstance(self.vocab, HyperLogLog):
+            self.vocab.merge(other.vocab)
+        else:
+            self.vocab |= other.vocab
+        self.q_lengths.update(other.q_lengths)
+        self.a_lengths.update(other.a_lengths)
+
+
+def resolve_inputs(patterns) -> list:
+    """Sorted files matching ``patterns`` (paths or globs such as shard sets)."""
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    paths = []
+    for pattern in patterns:
+        paths += sorted(glob.glob(pattern)) or [pattern]
+    return list(dict.fromkeys(paths))
+
+
+def iter_ranges(paths, chunk_bytes: int = STATS_CHUNK):
+    """``(path, start, end)`` byte ranges of about ``chunk_bytes`` per file."""
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, size, chunk_bytes):
+            yield path, start, min(start + chunk_bytes, size)
+
+
+def iter_range_records(path: str, start: int, end: int):
+    """Records of the JSONL lines that start within ``[start, end)``."""
+    with open(path, "rb") as f:
+        if start:
+            # finish the line running into this range; it belongs to the last one
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            if line.strip():
+                yield json.loads(line)
+
+
+def _init_worker(tokenizer_name):
+    global _tokenizer
+    _tokenizer = None
+    if tokenizer_name:
+        from transformers import AutoTokenizer
+
+        _tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True)
+
+
+def _token_lengths(texts):
+    ids = _tokenizer(texts, add_special_tokens=True, verbose=False)["input_ids"]
+    return Counter(len(seq) for seq in ids)
+
+
+def stats_range(task) -> StatsAccumulator:
+    """Scan one ``(path, start, end, distinct, hll_precision)`` task."""
+    path, start, end, distinct, hll_precision = task
+    acc = StatsAccumulator(distinct, hll_precision)
+    # words seen in this range; the sketch only hashes each one once
+    words = set()
+    questions, answers = [], []
+
+    def flush():
+        if _tokenizer is not None and questions:
+            acc.q_lengths.update(_token_lengths(questions))
+            acc.a_lengths.update(_token_lengths(answers))
+        questions.clear()
+        answers.clear()
+
+    for rec in iter_range_records(path, start, end):
+        q = rec.get("question", "")
+        a = rec.get("answer", "")
+        q_tokens = q.split()
+        a_tokens = a.split()
+        acc.records += 1
+        acc.q_words += len(q_tokens)
+        acc.a_words += len(a_tokens)
+        words.update(q_tokens)
+        words.update(a_tokens)
+        questions.append(q)
+        answers.append(a)
+        if len(questions) >= TOKEN_BATCH:
+            flush()
+    flush()
+    acc.vocab.update(words)
+    return acc
 
 
-def compute_stats(input_path: str):
+def length_summary(lengths: Counter, max_length: int) -> dict:
+    """Mean, nearest-rank percentiles, max and share above ``max_length``."""
+    total = sum(lengths.values())
+    if not total:
+        return {}
+    summary = {"mean": round(sum(k * v for k, v in lengths.items()) / total, 2)}
+    keys = sorted(lengths)
+    cumulative = np.cumsum([lengths[k] for k in keys])
+    for q in PERCENTILES:
+        rank = max(math.ceil(q / 100 * total), 1)
+        summary[f"p{q}"] = keys[int(np.searchsorted(cumulative, rank))]
+    summary["max"] = keys[-1]
+    over = sum(v for k, v in lengths.items() if k > max_length)
+    summary["truncated_pct"] = round(100 * over / total, 2)
+    return summary
+
+
+def padding_waste(lengths: Counter, max_length: int, batch_size: int) -> dict:
+    """
+    Share of padded positions for sequences truncated to ``max_length`` in
+    batches of ``batch_size``, under three padding schemes:
+
+    - ``max_length``: every sequence padded to ``max_length``
+    - ``dynamic``: padded to the longest of a random batch (expected value)
+    - ``sorted``: padded to the longest of length-sorted batches
+    """
+    clipped = Counter()
+    for k, v in lengths.items():
+        clipped[min(k, max_length)] += v
+    total = sum(clipped.values())
+    if not total:
+        return {}
+    keys = np.array(sorted(clipped))
+    counts = np.array([clipped[k] for k in keys])
+    mean = float((keys * counts).sum() / total)
+    # E[max of batch_size iid draws] from the length CDF
+    cdf = np.cumsum(counts) / total
+    prev = np.concatenate([[0.0], cdf[:-1]])
+    expected_max = float((keys * (cdf**batch_size - prev**batch_size)).sum())
+    # sorted batching: each batch is padded to the length of its last member
+    cumulative = np.cumsum(counts)
+    ends = np.append(np.arange(batch_size - 1, total - 1, batch_size), total - 1)
+    sizes = np.diff(np.concatenate([[-1], ends]))
+    batch_max = keys[np.searchsorted(cumulative, ends, side="right")]
+    return {
+        "max_length": round(1 - mean / max_length, 4),
+        "dynamic": round(1 - mean / expected_max, 4),
+        "sorted": round(1 - mean * total / float((batch_max * sizes).sum()), 4),
+    }
+
+
+def compute_stats(
+    input_path,
+    distinct: str = "exact",
+    workers: int = 1,
+    tokenizer: str = None,
+    max_length: int = 512,
+    batch_size: int = 8,
+    hll_precision: int = 14,
+    chunk_bytes: int = STATS_CHUNK,
+):
     """
     Read JSONL from input_path and compute stats.
 
     Returns a dict with average question tokens, average answer tokens, and vocab size.
+    ``input_path`` may also be a glob or a list of shards, scanned by
+    ``workers`` processes. ``distinct="hll"`` estimates the vocabulary size
+    with a HyperLogLog sketch instead of holding every word. With a
+    ``tokenizer`` (name or path of a fast tokenizer), subword length
+    summaries and padding waste for ``max_length``/``batch_size`` are added.
     """
-    total_q_tokens = 0
-    total_a_tokens = 0
-    total = 0
-    vocab = Counter()
-    with open(input_path, "r", encoding="utf8") as f:
-        for line in f:
-            rec = json.loads(line)
-            q = rec.get("question", "")
-            a = rec.get("answer", "")
-            q_tokens = q.split()
-            a_tokens = a.split()
-            total_q_tokens += len(q_tokens)
-            total_a_tokens += len(a_tokens)
-            total += 1
-            vocab.update(q_tokens)
-            vocab.update(a_tokens)
-    return {
+    tasks = [
+        (path, start, end, distinct, hll_precision)
+        for path, start, end in iter_ranges(resolve_inputs(input_path), chunk_bytes)
+    ]
+    acc = StatsAccumulator(distinct, hll_precision)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(tokenizer,)
+        ) as pool:
+            for part in pool.map(stats_range, tasks):
+                acc.merge(part)
+    else:
+        _init_worker(tokenizer)
+        for task in tasks:
+            acc.merge(stats_range(task))
+
+    total = acc.records
+    stats = {
         "num_records": total,
-        "avg_q_tokens": total_q_tokens / total if total else 0,
-        "avg_a_tokens": total_a_tokens / total if total else 0,
-        "vocab_size": len(vocab),
+        "avg_q_tokens": acc.q_words / total if total else 0,
+        "avg_a_tokens": acc.a_words / total if total else 0,
+        "vocab_size": len(acc.vocab),
+        "vocab_estimated": distinct == "hll",
     }
+    if tokenizer:
+        stats["question_tokens"] = length_summary(acc.q_lengths, max_length)
+        stats["answer_tokens"] = length_summary(acc.a_lengths, max_length)
+        stats["padding_waste"] = {
+            "question": padding_waste(acc.q_lengths, max_length, batch_size),
+            "answer": padding_waste(acc.a_lengths, max_length, batch_size),
+        }
+        stats.update(tokenizer=tokenizer, max_length=max_length, batch_size=batch_size)
+    return stats
+
+
+def write_markdown(stats: dict, output_path: str):
+    vocab = (
+        "Vocabulary size (estimated)" if stats["vocab_estimated"] else "Vocabulary size"
+    )
+    with open(output_path, "w", encoding="utf8") as f:
+        f.write(f"# Dataset Statistics\n")
+        f.write(f"- Number of records: {stats['num_records']}\n")
+        f.write(f"- Average question tokens: {stats['avg_q_tokens']:.2f}\n")
+        f.write(f"- Average answer tokens: {stats['avg_a_tokens']:.2f}\n")
+        f.write(f"- {vocab}: {stats['vocab_size']}\n")
+        if "question_tokens" not in stats:
+            return
+        f.write(f"\n## Subword Tokens ({stats['tokenizer']})\n\n")
+        columns = ["mean", *(f"p{q}" for q in PERCENTILES), "max", "truncated_pct"]
+        f.write("| field | " + " | ".join(columns) + " |\n")
+        f.write("|" + "---|" * (len(columns) + 1) + "\n")
+        for field in ("question", "answer"):
+            row = stats[f"{field}_tokens"]
+            f.write(f"| {field} | " + " | ".join(str(row.get(c)) for c in columns))
+            f.write(" |\n")
+        f.write(
+            f"\n## Padding Waste (max_length={stats['max_length']}, "
+            f"batch_size={stats['batch_size']})\n\n"
+        )
+        f.write("| field | pad to max_length | dynamic | length-sorted |\n")
+        f.write("|---|---|---|---|\n")
+        for field, waste in stats["padding_waste"].items():
+            f.write(
+                f"| {field} | {waste.get('max_length', 0):.1%} | "
+                f"{waste.get('dynamic', 0):.1%} | {waste.get('sorted', 0):.1%} |\n"
+            )
 
 
 def main():
     parser = argparse.ArgumentParser(description="Compute stats for cleaned dataset")
     parser.add_argument(
-        "--input", default="data/clean/combined.jsonl", help="Input combined JSONL file"
+        "--input",
+        nargs="+",
+        default=["data/clean/combined.jsonl"],
+        help="Input JSONL files or globs (e.g. data/clean/combined-*.jsonl)",
     )
     parser.add_argument(
         "--output",
         default="data/processed/stats.md",
         help="Output markdown file for stats",
     )
+    parser.add_argument("--json", help="Also write the stats as JSON to this path")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Worker processes scanning the input"
+    )
+    parser.add_argument(
+        "--distinct",
+        choices=["exact", "hll"],
+        default="exact",
+        help="Count the vocabulary exactly or estimate it with HyperLogLog",
+    )
+    parser.add_argument(
+        "--tokenizer",
+        help="Fast tokenizer (name or path) for subword length stats",
+    )
+    parser.add_argument(
+        "--max-length", type=int, default=512, help="Max sequence length for padding"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=8, help="Batch size for padding waste"
+    )
     args = parser.parse_args()
-    stats = compute_stats(args.input)
-    with open(args.output, "w", encoding="utf8") as f:
-        f.write(f"# Dataset Statistics\n")
-        f.write(f"- Number of records: {stats['num_records']}\n")
-        f.write(f"- Average question tokens: {stats['avg_q_tokens']:.2f}\n")
-        f.write(f"- Average answer tokens: {stats['avg_a_tokens']:.2f}\n")
-        f.write(f"- Vocabulary size: {stats['vocab_size']}\n")
+    stats = compute_stats(
+        args.input,
+        distinct=args.distinct,
+        workers=args.workers,
+        tokenizer=args.tokenizer,
+        max_length=args.max_length,
+        batch_size=args.batch_size,
+    )
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    write_markdown(stats, args.output)
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as f:
+            json.dump(stats, f, indent=2)
     print(f"Wrote stats to {args.output}")
 
 
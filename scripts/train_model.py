@@ -1,14 +1,155 @@
 #!/usr/bin/env python3
 """
 Fine-tune a pretrained model on a tokenized QA dataset using Hugging Face Trainer.
+
+Datasets packed by ``prepare_dataset --pack`` (rows carrying ``segment_ids``)
+are trained with attention restricted to each example's own segment.
 """
 import argparse
 
+import torch
 import yaml
 from datasets import load_from_disk
 from transformers import (AutoModelForSeq2SeqLM, AutoTokenizer,
                           DataCollatorForSeq2Seq, Trainer, TrainingArguments)
 
+PACKED_COLUMNS = ("segment_ids", "label_segment_ids")
+# models whose first encoder layer computes the position bias all layers share
+PACKED_MODEL_TYPES = ("t5", "mt5")
+# model class -> subclass whose forward takes the packed columns
+_PACKED_CLASSES = {}
+
+
+class PackedSeq2SeqCollator:
+    """
+    Pad packed rows to the longest in the batch and build decoder inputs that
+    are shifted right within each segment, so every example's decoder starts
+    from ``decoder_start_token_id`` instead of the previous example's tokens.
+    """
+
+    def __init__(
+        self,
+        pad_token_id: int,
+        decoder_start_token_id: int,
+        label_pad_token_id: int = -100,
+        pad_to_multiple_of: int = None,
+    ):
+        self.pad_token_id = pad_token_id
+        self.decoder_start_token_id = decoder_start_token_id
+        self.label_pad_token_id = label_pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def _pad(self, rows, value):
+        length = max(len(row) for row in rows)
+        if self.pad_to_multiple_of:
+            length = -(-length // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        return torch.tensor([list(row) + [value] * (length - len(row)) for row in rows])
+
+    def __call__(self, features):
+        batch = {
+            "input_ids": self._pad(
+                [f["input_ids"] for f in features], self.pad_token_id
+            ),
+            "segment_ids": self._pad([f["segment_ids"] for f in features], 0),
+            "labels": self._pad(
+                [f["labels"] for f in features], self.label_pad_token_id
+            ),
+            "label_segment_ids": self._pad(
+                [f["label_segment_ids"] for f in features], 0
+            ),
+        }
+        batch["attention_mask"] = (batch["segment_ids"] > 0).long()
+        labels, segments = batch["labels"], batch["label_segment_ids"]
+        decoder_input_ids = torch.full_like(labels, self.pad_token_id)
+        decoder_input_ids[:, 1:] = labels[:, :-1]
+        starts = torch.ones_like(segments, dtype=torch.bool)
+        starts[:, 1:] = segments[:, 1:] != segments[:, :-1]
+        decoder_input_ids[starts] = self.decoder_start_token_id
+        decoder_input_ids[segments == 0] = self.pad_token_id
+        batch["decoder_input_ids"] = decoder_input_ids
+        return batch
+
+
+def enable_packed_attention(model):
+    """
+    Let a T5-style ``model`` take ``segment_ids``/``label_segment_ids`` from
+    ``PackedSeq2SeqCollator``. Encoder self-attention is block-diagonal per
+    segment, decoder self-attention is causal within a segment and each
+    decoder segment only cross-attends to its own encoder segment.
+
+    The encoder stack only takes a padding mask, so the block-diagonal mask
+    is added to the relative position bias of its first layer, which all
+    later layers reuse. Other architectures are rejected with a ValueError.
+    """
+    model_type = getattr(model.config, "model_type", None)
+    if model_type not in PACKED_MODEL_TYPES:
+        raise ValueError(
+            f"packed datasets are only supported for T5 models, not {model_type!r}; "
+            "prepare the dataset without --pack"
+        )
+    model.get_encoder().block[0].layer[0].SelfAttention.register_forward_pre_hook(
+        _inject_packed_mask, with_kwargs=True
+    )
+    # a method of the class rather than an instance attribute: DataParallel
+    # replicas copy the instance __dict__, so a bound method there would
+    # still run on the original module
+    model.__class__ = _packed_class(type(model))
+    return model
+
+
+def _packed_class(cls):
+    if cls not in _PACKED_CLASSES:
+        # same name, so save_pretrained still records the base architecture;
+        # accepts_loss_kwargs stops Trainer passing num_items_in_batch
+        _PACKED_CLASSES[cls] = type(
+            cls.__name__,
+            (cls,),
+            {"forward": _packed_forward, "accepts_loss_kwargs": False},
+        )
+    return _PACKED_CLASSES[cls]
+
+
+def _inject_packed_mask(module, args, kwargs):
+    mask = getattr(module, "packed_mask", None)
+    if mask is not None:
+        kwargs["mask"] = mask
+    return args, kwargs
+
+
+def _packed_forward(self, segment_ids=None, label_segment_ids=None, **kwargs):
+    kwargs.pop("num_items_in_batch", None)
+    forward = super(type(self), self).forward
+    if segment_ids is None:
+        return forward(**kwargs)
+    encoder = self.get_encoder()
+    attention = encoder.block[0].layer[0].SelfAttention
+    min_value = torch.finfo(self.dtype).min
+    valid = segment_ids[:, None, :] > 0
+    same = (segment_ids[:, :, None] == segment_ids[:, None, :]) & valid
+    attention.packed_mask = (~same[:, None]).to(self.dtype) * min_value
+    try:
+        encoder_outputs = encoder(
+            input_ids=kwargs.pop("input_ids"),
+            attention_mask=kwargs.get("attention_mask"),
+            return_dict=True,
+        )
+    finally:
+        attention.packed_mask = None
+    length = label_segment_ids.shape[1]
+    causal = torch.ones(
+        length, length, dtype=torch.bool, device=label_segment_ids.device
+    ).tril()
+    decoder_same = (
+        label_segment_ids[:, :, None] == label_segment_ids[:, None, :]
+    ) & causal
+    cross = (label_segment_ids[:, :, None] == segment_ids[:, None, :]) & valid
+    kwargs.update(
+        encoder_outputs=encoder_outputs,
+        attention_mask=cross.long(),
+        decoder_attention_mask=(~decoder_same[:, None]).to(self.dtype) * min_value,
+    )
+    return forward(**kwargs)
+
 
 def train_model(
     dataset_dir: str,
@@ -37,7 +178,17 @@ def train_model(
     tokenizer = AutoTokenizer.from_pretrained(model_name_or_path, use_fast=True)
     model = AutoModelForSeq2SeqLM.from_pretrained(model_name_or_path)
 
-    data_collator = DataCollatorForSeq2Seq(tokenizer=tokenizer, model=model)
+    packed = all(c in getattr(ds, "column_names", ()) for c in PACKED_COLUMNS)
+    extra_args = {}
+    if packed:
+        enable_packed_attention(model)
+        data_collator = PackedSeq2SeqCollator(
+            tokenizer.pad_token_id, model.config.decoder_start_token_id
+        )
+        # keep the segment columns, which are not in the model's signature
+        extra_args["remove_unused_columns"] = False
+    else:
+        data_collator = DataCollatorForSeq2Seq(tokenizer=tokenizer, model=model)
     training_args = TrainingArguments(
         output_dir=output_dir,
         per_device_train_batch_size=per_device_train_batch_size,
@@ -55,6 +206,7 @@ def train_model(
         gradient_accumulation_steps=gradient_accumulation_steps,
         fp16=fp16,
         report_to=report_to,
+        **extra_args,
     )
 
     trainer = Trainer(
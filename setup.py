@@ -10,9 +10,13 @@ setup(
         "requests",
         "pydantic",
     ],
+    extras_require={
+        "async": ["httpx"],
+    },
     entry_points={
         "console_scripts": [
             "localllm-client=localllm_client.client:main",
+            "localllm-loadtest=localllm_client.loadtest:main",
         ],
     },
     author="",
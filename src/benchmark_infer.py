@@ -1,37 +1,264 @@
 #!/usr/bin/env python3
 """
 Benchmark inference latencies for PyTorch, ONNX, and FlashAttention variants.
+
+Each engine is swept over batch sizes, max generation lengths and thread
+counts. Every configuration is warmed up before timing, and the report has
+p50/p90/p99 batch latency, generated tokens/sec and peak memory. Results go
+to CSV (and optionally JSON) so runs can be diffed to catch regressions.
 """
 import argparse
 import csv
+import json
+import os
+import threading
 import time
 
 import numpy as np
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoTokenizer
 
 try:
     import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForCausalLM, ORTModelForSeq2SeqLM
 except ImportError:
     ort = None
 
-from src.infer import FLASH_ATTENTION_AVAILABLE
-from src.quantize import load_prompts
+try:
+    from src.infer import FLASH_ATTENTION_AVAILABLE
+except ImportError:
+    FLASH_ATTENTION_AVAILABLE = False
+
+from src.quantize import MODEL_CLASSES, load_prompts, peak_rss_bytes
+
+CSV_FIELDS = [
+    "engine",
+    "batch_size",
+    "max_length",
+    "threads",
+    "iterations",
+    "p50_ms",
+    "p90_ms",
+    "p99_ms",
+    "mean_ms",
+    "tokens_per_sec",
+    "peak_mem_mb",
+]
+
+
+def latency_summary(latencies_ms) -> dict:
+    """p50/p90/p99 and mean of a list of latencies in milliseconds."""
+    arr = np.asarray(latencies_ms, dtype=float)
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+    return {
+        "p50_ms": float(p50),
+        "p90_ms": float(p90),
+        "p99_ms": float(p99),
+        "mean_ms": float(arr.mean()),
+    }
+
+
+def current_rss_bytes() -> int:
+    """Current resident set size (Linux), falling back to the process peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+class PeakMemory:
+    """
+    Track peak memory while the block runs.
+
+    On CUDA this is the allocator's peak; on CPU a background thread samples
+    RSS, since the process-wide peak never goes down between configurations.
+    """
+
+    def __init__(self, device: torch.device, interval: float = 0.005):
+        self.device = device
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        else:
+            self.peak = current_rss_bytes()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.device.type == "cuda":
+            self.peak = torch.cuda.max_memory_allocated(self.device)
+        else:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, current_rss_bytes())
+        return False
+
+
+def load_engine(engine: str, model_dir: str, arch: str, num_threads: int, device):
+    """Load the model for ``engine`` (``pytorch``, ``pytorch+flash`` or ``onnx``)."""
+    if engine == "onnx":
+        if ort is None:
+            raise RuntimeError("onnx engine requires onnxruntime and optimum")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        ort_class = ORTModelForSeq2SeqLM if arch == "seq2seq" else ORTModelForCausalLM
+        return ort_class.from_pretrained(model_dir, session_options=options)
+    kwargs = {}
+    if engine == "pytorch+flash":
+        kwargs["attn_implementation"] = "flash_attention_2"
+        kwargs["torch_dtype"] = torch.float16
+    model = MODEL_CLASSES[arch].from_pretrained(model_dir, **kwargs)
+    return model.to(device).eval()
+
+
+def make_batches(prompts, batch_size: int, count: int):
+    """Yield ``count`` batches of ``batch_size`` prompts, cycling the prompt list."""
+    pos = 0
+    for _ in range(count):
+        batch = [prompts[(pos + i) % len(prompts)] for i in range(batch_size)]
+        pos += batch_size
+        yield batch
+
+
+def run_batch(model, tokenizer, batch, max_length: int, arch: str, device) -> int:
+    """Generate for one batch and return the number of generated tokens."""
+    inputs = tokenizer(batch, return_tensors="pt", padding=True)
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    out = model.generate(**inputs, max_length=max_length)
+    # seq2seq outputs start with the decoder start token, causal ones echo the prompt
+    start = 1 if arch == "seq2seq" else inputs["input_ids"].shape[1]
+    generated = out[:, start:]
+    if tokenizer.eos_token_id is None:
+        return int(generated.numel())
+    # rows that stopped early are padded after their first EOS
+    is_eos = generated == tokenizer.eos_token_id
+    lengths = torch.where(
+        is_eos.any(dim=1), is_eos.int().argmax(dim=1) + 1, generated.shape[1]
+    )
+    return int(lengths.sum())
 
 
-def benchmark_pytorch(model_dir: str, prompts, max_length: int):
+def benchmark_config(
+    model,
+    tokenizer,
+    prompts,
+    batch_size: int,
+    max_length: int,
+    arch: str,
+    device,
+    warmup: int = 2,
+    iterations: int = 10,
+) -> dict:
+    """Time ``iterations`` batches after ``warmup`` untimed ones."""
+    latencies, tokens = [], 0
+    with torch.inference_mode():
+        for batch in make_batches(prompts, batch_size, warmup):
+            run_batch(model, tokenizer, batch, max_length, arch, device)
+        with PeakMemory(device) as mem:
+            for batch in make_batches(prompts, batch_size, iterations):
+                start = time.perf_counter()
+                tokens += run_batch(model, tokenizer, batch, max_length, arch, device)
+                if device.type == "cuda":
+                    torch.cuda.synchronize(device)
+                latencies.append((time.perf_counter() - start) * 1000)
+    result = {
+        "batch_size": batch_size,
+        "max_length": max_length,
+        "iterations": iterations,
+    }
+    result.update(latency_summary(latencies))
+    result["tokens_per_sec"] = tokens / (sum(latencies) / 1000)
+    result["peak_mem_mb"] = mem.peak / 2**20
+    return result
+
+
+def run_sweep(
+    engines,
+    model_dir: str,
+    onnx_dir: str,
+    arch: str,
+    prompts,
+    batch_sizes,
+    max_lengths,
+    threads,
+    warmup: int,
+    iterations: int,
+):
+    """Benchmark every engine over the batch size x max length x threads grid."""
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
-    model = AutoModelForCausalLM.from_pretrained(model_dir).to(device)
-    times = []
-    for prompt in prompts:
-        # Tokenize and move tensors to target device
-        raw_inputs = tokenizer(prompt, return_tensors="pt")
-        inputs = {k: v.to(device) for k, v in raw_inputs.items()}
-        start = time.time()
-        _ = model.generate(**inputs, max_length=max_length)
-        times.append((time.time() - start) * 1000)
-    return float(np.mean(times))
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    if arch == "causal":
+        # decoder-only models must be left-padded for batched generation
+        tokenizer.padding_side = "left"
+    results = []
+    for engine in engines:
+        model = None
+        path = onnx_dir if engine == "onnx" else model_dir
+        for num_threads in threads:
+            torch.set_num_threads(num_threads)
+            # ONNX Runtime fixes its thread count when the session is created
+            if model is None or engine == "onnx":
+                model = load_engine(engine, path, arch, num_threads, device)
+            for batch_size in batch_sizes:
+                for max_length in max_lengths:
+                    row = benchmark_config(
+                        model,
+                        tokenizer,
+                        prompts,
+                        batch_size,
+                        max_length,
+                        arch,
+                        device,
+                        warmup=warmup,
+                        iterations=iterations,
+                    )
+                    row.update(engine=engine, threads=num_threads)
+                    results.append(row)
+                    print(
+                        f"{engine} bs={batch_size} len={max_length} "
+                        f"threads={num_threads}: p50={row['p50_ms']:.1f}ms "
+                        f"p99={row['p99_ms']:.1f}ms "
+                        f"{row['tokens_per_sec']:.1f} tok/s"
+                    )
+    return results
+
+
+def write_results(results, csv_path: str, json_path: str = None):
+    """Write benchmark rows as CSV and, optionally, JSON."""
+    for path in filter(None, [csv_path, json_path]):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for row in results:
+            writer.writerow(
+                {
+                    k: round(v, 3) if isinstance(v, float) else v
+                    for k, v in row.items()
+                    if k in CSV_FIELDS
+                }
+            )
+    if json_path:
+        with open(json_path, "w", encoding="utf8") as f:
+            json.dump(results, f, indent=2)
+
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
 
 
 def main():
@@ -45,34 +272,63 @@ def main():
         "--prompts", required=True, help="JSON file with {'prompts': [...]}."
     )
     parser.add_argument(
-        "--max-length", type=int, default=128, help="Max generation length"
+        "--arch",
+        choices=sorted(MODEL_CLASSES),
+        default="causal",
+        help="Model architecture",
+    )
+    parser.add_argument(
+        "--onnx-dir", help="Exported ONNX model directory (adds the onnx engine)"
+    )
+    parser.add_argument(
+        "--batch-sizes", type=_int_list, default=[1], help="Comma-separated sweep"
+    )
+    parser.add_argument(
+        "--max-lengths",
+        type=_int_list,
+        default=[128],
+        help="Comma-separated max generation lengths",
+    )
+    parser.add_argument(
+        "--threads",
+        type=_int_list,
+        default=[torch.get_num_threads()],
+        help="Comma-separated intra-op thread counts",
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=2, help="Untimed batches per configuration"
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=10, help="Timed batches per configuration"
     )
     parser.add_argument(
         "--output-csv", default="docs/benchmarks.csv", help="Output CSV path"
     )
+    parser.add_argument("--output-json", help="Optional JSON output path")
     args = parser.parse_args()
 
     prompts = load_prompts(args.prompts)
-    results = []
-    # PyTorch
-    pytime = benchmark_pytorch(args.model_dir, prompts, args.max_length)
-    results.append(("pytorch", pytime))
-    # FlashAttention flag
-    if FLASH_ATTENTION_AVAILABLE:
-        # re-run PyTorch to measure with FA enabled
-        fatime = benchmark_pytorch(args.model_dir, prompts, args.max_length)
-        results.append(("pytorch+flash", fatime))
-
-    # Write CSV
-    out_dir = args.output_csv.rsplit("/", 1)[0]
-    if out_dir:
-        import os
-
-        os.makedirs(out_dir, exist_ok=True)
-    with open(args.output_csv, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["engine", "avg_latency_ms"])
-        writer.writerows(results)
+    if not prompts:
+        parser.error("no prompts to benchmark")
+    engines = ["pytorch"]
+    if FLASH_ATTENTION_AVAILABLE and torch.cuda.is_available():
+        engines.append("pytorch+flash")
+    if args.onnx_dir:
+        engines.append("onnx")
+
+    results = run_sweep(
+        engines,
+        args.model_dir,
+        args.onnx_dir,
+        args.arch,
+        prompts,
+        args.batch_sizes,
+        args.max_lengths,
+        args.threads,
+        args.warmup,
+        args.iterations,
+    )
+    write_results(results, args.output_csv, args.output_json)
     print(f"Wrote benchmark results to {args.output_csv}")
 
 
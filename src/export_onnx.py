@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Export a fine-tuned Seq2Seq model to optimized (optionally INT8) ONNX and
+check numerical parity against the PyTorch model.
+"""
+import argparse
+
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+from src import onnx_exporter
+from src.quantize import load_prompts
+
+try:
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+except ImportError:
+    ORTModelForSeq2SeqLM = None
+
+
+def validate_parity(model_dir: str, onnx_dir: str, prompts, max_length: int = 64):
+    """
+    Compare the ONNX export with the PyTorch model on a list of prompts.
+
+    Both models are teacher-forced on the PyTorch greedy output to measure the
+    max absolute logit difference, and greedy generations are compared for an
+    exact-match rate.
+    """
+    if ORTModelForSeq2SeqLM is None:
+        raise RuntimeError("Parity check requires optimum[onnxruntime].")
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+    pt_model = AutoModelForSeq2SeqLM.from_pretrained(model_dir).eval()
+    ort_model = ORTModelForSeq2SeqLM.from_pretrained(onnx_dir, use_cache=True)
+    max_diff = 0.0
+    matches = 0
+    for prompt in prompts:
+        enc = tokenizer(prompt, return_tensors="pt")
+        inputs = {"input_ids": enc.input_ids, "attention_mask": enc.attention_mask}
+        with torch.inference_mode():
+            pt_ids = pt_model.generate(**inputs, max_length=max_length)
+            pt_logits = pt_model(**inputs, decoder_input_ids=pt_ids).logits
+            ort_logits = ort_model(**inputs, decoder_input_ids=pt_ids).logits
+            ort_ids = ort_model.generate(**inputs, max_length=max_length)
+        max_diff = max(max_diff, float((pt_logits - ort_logits).abs().max()))
+        same = pt_ids.shape == ort_ids.shape and bool((pt_ids == ort_ids).all())
+        matches += int(same)
+    return {
+        "prompts": len(prompts),
+        "max_abs_diff": max_diff,
+        "exact_match": matches / len(prompts) if prompts else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export a fine-tuned Seq2Seq model to ONNX"
+    )
+    parser.add_argument(
+        "--model-dir", required=True, help="Directory of the fine-tuned model"
+    )
+    parser.add_argument(
+        "--output", required=True, help="Output directory for the ONNX model"
+    )
+    parser.add_argument(
+        "--task",
+        default="text2text-generation-with-past",
+        help="optimum export task (default exports a decoder with past key/values)",
+    )
+    parser.add_argument("--opset", type=int, default=None, help="ONNX opset version")
+    parser.add_argument(
+        "--optimize",
+        choices=onnx_exporter.OPTIMIZATION_LEVELS,
+        default="extended",
+        help="ONNX Runtime graph optimization level applied offline",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Apply dynamic INT8 weight quantization to the exported graphs",
+    )
+    parser.add_argument(
+        "--prompts",
+        help="JSON file with {'prompts': [...]} to validate parity against PyTorch",
+    )
+    parser.add_argument(
+        "--max-length", type=int, default=64, help="Max generation length for parity"
+    )
+    parser.add_argument(
+        "--atol",
+        type=float,
+        default=None,
+        help="Fail if the max logit difference exceeds this "
+        "(default: 1e-3 unless --quantize)",
+    )
+    args = parser.parse_args()
+
+    onnx_exporter.convert(
+        args.model_dir,
+        args.output,
+        task=args.task,
+        opset=args.opset,
+        optimize=args.optimize,
+        quantize=args.quantize,
+    )
+    print(f"ONNX model exported to {args.output}")
+
+    if args.prompts:
+        report = validate_parity(
+            args.model_dir, args.output, load_prompts(args.prompts), args.max_length
+        )
+        print(
+            f"Parity on {report['prompts']} prompts: "
+            f"max abs logit diff {report['max_abs_diff']:.2e}, "
+            f"exact-match generations {report['exact_match']:.0%}"
+        )
+        atol = args.atol if args.atol is not None else (None if args.quantize else 1e-3)
+        if atol is not None and report["max_abs_diff"] > atol:
+            raise SystemExit(
+                f"ONNX parity check failed: {report['max_abs_diff']:.2e} > {atol}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Export a Seq2Seq model to ONNX and post-process the resulting graphs.
+"""
+import glob
+import os
+from typing import Optional
+
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+except ImportError:
+    ort = None
+
+try:
+    from optimum.exporters.onnx import main_export
+except ImportError:
+    main_export = None
+
+OPTIMIZATION_LEVELS = ("none", "basic", "extended")
+
+
+def onnx_files(output_dir: str):
+    """List the ONNX graphs (encoder, decoder, decoder-with-past...) in a directory."""
+    return sorted(glob.glob(os.path.join(output_dir, "*.onnx")))
+
+
+def optimize_graph(path: str, level: str = "extended"):
+    """Run ONNX Runtime graph optimizations offline and overwrite ``path``."""
+    options = ort.SessionOptions()
+    options.graph_optimization_level = {
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    }[level]
+    tmp_path = f"{path}.optimized"
+    options.optimized_model_filepath = tmp_path
+    ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+    os.replace(tmp_path, path)
+
+
+def quantize_int8(path: str):
+    """Apply dynamic INT8 weight quantization to an ONNX graph in place."""
+    tmp_path = f"{path}.int8"
+    quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, path)
+
+
+def convert(
+    model_dir: str,
+    output: str,
+    task: str = "text2text-generation-with-past",
+    opset: Optional[int] = None,
+    optimize: str = "extended",
+    quantize: bool = False,
+):
+    """
+    Export ``model_dir`` to ONNX under ``output`` and post-process each graph.
+
+    For Seq2Seq models the default task writes an encoder, a decoder and a
+    decoder-with-past graph next to the tokenizer and config, so ``output`` can
+    be served directly with ``--backend onnx``. Returns the ONNX file paths.
+    """
+    if main_export is None or ort is None:
+        raise RuntimeError("ONNX export requires optimum[exporters] and onnxruntime.")
+    main_export(model_dir, output, task=task, opset=opset)
+    files = onnx_files(output)
+    for path in files:
+        # quantize first: the quantizer cannot infer types for fused optimized ops
+        if quantize:
+            quantize_int8(path)
+        if optimize != "none":
+            optimize_graph(path, optimize)
+    return files
@@ -3,11 +3,29 @@
 Quantization and evaluation utilities for the LoRA adapter model.
 """
 import argparse
+import contextlib
+import glob
 import json
+import multiprocessing
 import os
+import resource
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import torch.nn.functional as F
+from transformers import (AutoConfig, AutoModelForCausalLM,
+                          AutoModelForSeq2SeqLM, AutoTokenizer)
+
+MODEL_CLASSES = {"causal": AutoModelForCausalLM, "seq2seq": AutoModelForSeq2SeqLM}
+# CPU quantization modes: PyTorch dynamic INT8, or weight-only int8/int4 Linear
+CPU_MODES = ("dynamic-int8", "weight-int8", "weight-int4")
+QUANT_STATE_FILE = "quantized_state_dict.pt"
+# top-level weight files of a model dir (not Trainer checkpoint-*/ subdirs)
+WEIGHT_FILE_PATTERNS = ("*.safetensors", "pytorch_model*.bin", QUANT_STATE_FILE)
+QUANT_META_FILE = "quantization.json"
+# output rows dequantized at once by WeightOnlyLinear.forward
+DEQUANT_ROWS = 1024
 
 
 def evaluate_baseline(model, tokenizer, prompts, max_length=128):
@@ -33,6 +51,282 @@ def evaluate_baseline(model, tokenizer, prompts, max_length=128):
     return results
 
 
+def _pack_int4(q: torch.Tensor) -> torch.Tensor:
+    """Pack int4 values in [-8, 7] two per byte along the last dimension."""
+    u = (q + 8).to(torch.uint8)
+    if u.shape[-1] % 2:
+        u = F.pad(u, (0, 1))
+    return u[..., 0::2] | (u[..., 1::2] << 4)
+
+
+def _unpack_int4(packed: torch.Tensor, cols: int) -> torch.Tensor:
+    low = packed & 0x0F
+    high = packed >> 4
+    u = torch.stack([low, high], dim=-1).reshape(packed.shape[0], -1)[:, :cols]
+    return u.to(torch.int8) - 8
+
+
+class WeightOnlyLinear(torch.nn.Module):
+    """
+    Linear layer with per-output-channel int8 or packed int4 weights.
+
+    Weights are dequantized on the fly in ``forward``, so this trades a little
+    compute for a 4x (int8) or 8x (int4) smaller weight footprint.
+    """
+
+    def __init__(self, in_features: int, out_features: int, bits: int, bias: bool):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.bits = bits
+        cols = in_features if bits == 8 else (in_features + 1) // 2
+        dtype = torch.int8 if bits == 8 else torch.uint8
+        self.register_buffer("qweight", torch.zeros(out_features, cols, dtype=dtype))
+        self.register_buffer("scale", torch.ones(out_features, 1))
+        self.register_buffer("bias", torch.zeros(out_features) if bias else None)
+
+    @classmethod
+    def from_linear(cls, linear: torch.nn.Linear, bits: int):
+        has_bias = linear.bias is not None
+        layer = cls(linear.in_features, linear.out_features, bits, has_bias)
+        weight = linear.weight.detach().float()
+        qmax = 2 ** (bits - 1) - 1
+        scale = weight.abs().amax(dim=1, keepdim=True).clamp(min=1e-8) / qmax
+        q = torch.round(weight / scale).clamp(-qmax - 1, qmax).to(torch.int8)
+        layer.qweight = q if bits == 8 else _pack_int4(q)
+        layer.scale = scale
+        if linear.bias is not None:
+            layer.bias = linear.bias.detach().float().clone()
+        return layer
+
+    def dequantized_weight(self, rows: slice = slice(None)) -> torch.Tensor:
+        if self.bits == 8:
+            q = self.qweight[rows]
+        else:
+            q = _unpack_int4(self.qweight[rows], self.in_features)
+        return q.float() * self.scale[rows]
+
+    @property
+    def weight(self) -> torch.Tensor:
+        # model code sometimes inspects ``layer.weight`` (e.g. its dtype)
+        return self.dequantized_weight()
+
+    def forward(self, x):
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        if self.out_features <= DEQUANT_ROWS:
+            return F.linear(x, self.dequantized_weight().to(x.dtype), bias)
+        # dequantize large layers (e.g. an LM head) a block of rows at a time,
+        # so the float copy never costs more than the quantized weights save
+        outputs = []
+        for start in range(0, self.out_features, DEQUANT_ROWS):
+            rows = slice(start, start + DEQUANT_ROWS)
+            weight = self.dequantized_weight(rows).to(x.dtype)
+            outputs.append(
+                F.linear(x, weight, bias[rows] if bias is not None else None)
+            )
+        return torch.cat(outputs, dim=-1)
+
+
+def quantize_model(model, mode: str):
+    """Quantize the Linear layers of a CPU model in ``mode`` (see ``CPU_MODES``)."""
+    if mode == "dynamic-int8":
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    bits = {"weight-int8": 8, "weight-int4": 4}[mode]
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, torch.nn.Linear):
+                setattr(module, name, WeightOnlyLinear.from_linear(child, bits))
+    return model
+
+
+def save_quantized(model, tokenizer, output_dir: str, mode: str, arch: str):
+    """Save a CPU-quantized model as config + tokenizer + quantized state dict."""
+    os.makedirs(output_dir, exist_ok=True)
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    torch.save(model.state_dict(), os.path.join(output_dir, QUANT_STATE_FILE))
+    with open(os.path.join(output_dir, QUANT_META_FILE), "w", encoding="utf8") as f:
+        json.dump({"mode": mode, "arch": arch}, f, indent=2)
+
+
+@contextlib.contextmanager
+def empty_weights():
+    """
+    Create module parameters on the meta device, so a model skeleton takes
+    no memory for its weights (buffers are still allocated).
+    """
+    register = torch.nn.Module.register_parameter
+
+    def register_meta(module, name, param):
+        register(module, name, param)
+        if param is not None:
+            param = module._parameters[name]
+            module._parameters[name] = type(param)(
+                param.to("meta"), requires_grad=param.requires_grad
+            )
+
+    torch.nn.Module.register_parameter = register_meta
+    try:
+        yield
+    finally:
+        torch.nn.Module.register_parameter = register
+
+
+def load_quantized(quant_dir: str):
+    """
+    Rebuild a model saved by ``save_quantized`` and load its quantized weights.
+
+    For the weight-only modes the skeleton is built on the meta device and
+    the quantized tensors are assigned in place, so the full-precision
+    weights are never allocated. Dynamic INT8 needs real Linear weights to
+    quantize, so that mode still starts from a full-precision skeleton.
+    """
+    with open(os.path.join(quant_dir, QUANT_META_FILE), encoding="utf8") as f:
+        meta = json.load(f)
+    config = AutoConfig.from_pretrained(quant_dir)
+    model_class = MODEL_CLASSES[meta["arch"]]
+    state = torch.load(
+        os.path.join(quant_dir, QUANT_STATE_FILE), weights_only=True, mmap=True
+    )
+    if meta["mode"] == "dynamic-int8":
+        model = quantize_model(model_class.from_config(config).eval(), meta["mode"])
+        model.load_state_dict(state)
+        return model.eval()
+    with empty_weights():
+        model = model_class.from_config(config)
+    model = quantize_model(model.eval(), meta["mode"])
+    model.load_state_dict(state, assign=True)
+    missing = [name for name, p in model.named_parameters() if p.is_meta]
+    if missing:
+        raise RuntimeError(f"weights missing from {quant_dir}: {missing}")
+    return model.eval()
+
+
+def weights_size(path: str) -> int:
+    """Total bytes of the top-level weight files of the model dir ``path``."""
+    files = {
+        f
+        for pattern in WEIGHT_FILE_PATTERNS
+        for f in glob.glob(os.path.join(path, pattern))
+    }
+    return sum(os.path.getsize(f) for f in files)
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset this process's peak RSS to its current RSS (Linux only). The
+    rusage peak is inherited across fork and exec, so a child process does
+    not start from a clean high-water mark otherwise.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of the current process (since ``reset_peak_rss``)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _load_and_evaluate(path: str, arch: str, quantized: bool, prompts, max_length):
+    torch.set_num_threads(1)
+    reset_peak_rss()
+    if quantized:
+        model = load_quantized(path)
+    else:
+        model = MODEL_CLASSES[arch].from_pretrained(path).eval()
+    tokenizer = AutoTokenizer.from_pretrained(path, use_fast=True)
+    evaluate_baseline(model, tokenizer, prompts, max_length=max_length)
+    return peak_rss_bytes()
+
+
+def measure_peak_rss(path: str, arch: str, quantized: bool, prompts, max_length=128):
+    """
+    Load a model and evaluate ``prompts`` in a fresh process; return its peak RSS.
+
+    A separate process keeps the measurement independent of whatever this
+    process has already allocated; its peak is reset once it has started, as
+    the rusage peak would otherwise carry over from this process.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+        job = pool.submit(
+            _load_and_evaluate, path, arch, quantized, prompts, max_length
+        )
+        return job.result()
+
+
+def _fmt_mb(num_bytes: int) -> str:
+    return f"{num_bytes / 2**20:.1f} MB"
+
+
+def write_quant_stats(path: str, label: str, stats: dict):
+    """Write ``eval/quant_stats.md`` from measured sizes and peak RSS."""
+    ratio = stats["size_before"] / stats["size_after"] if stats["size_after"] else 0
+    lines = [
+        "# Quantization Statistics",
+        "",
+        f"- **Pre-quantization size**: {_fmt_mb(stats['size_before'])}",
+        f"- **{label} quantized size**: {_fmt_mb(stats['size_after'])}",
+        f"- **Reduction ratio**: {ratio:.2f}x",
+        "",
+        f"- **Peak memory usage (PyTorch)**: {_fmt_mb(stats['rss_before'])}",
+        f"- **Peak memory usage ({label})**: {_fmt_mb(stats['rss_after'])}",
+    ]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def quantize_cpu(
+    model_dir: str,
+    prompts,
+    mode: str,
+    arch: str,
+    quant_out: str,
+    baseline_out: str,
+    stats_out: str,
+):
+    """
+    Quantize a model for CPU inference and record size and peak-memory stats.
+
+    The full-precision model is evaluated as the baseline, quantized with
+    ``quantize_model`` and saved to ``quant_out``; sizes on disk and peak RSS
+    of each model (measured in a fresh process) are written to ``stats_out``.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+    model = MODEL_CLASSES[arch].from_pretrained(model_dir).eval()
+    baseline = evaluate_baseline(model, tokenizer, prompts)
+    with open(baseline_out, "w", encoding="utf8") as f:
+        json.dump(baseline, f, indent=2)
+
+    model = quantize_model(model, mode)
+    save_quantized(model, tokenizer, quant_out, mode, arch)
+
+    stats = {
+        "size_before": weights_size(model_dir),
+        "size_after": weights_size(quant_out),
+        "rss_before": measure_peak_rss(model_dir, arch, False, prompts),
+        "rss_after": measure_peak_rss(quant_out, arch, True, prompts),
+    }
+    write_quant_stats(stats_out, mode, stats)
+    return stats
+
+
 def load_prompts(file_path):
     """Load JSON file with 'prompts': [str...]."""
     with open(file_path, "r", encoding="utf8") as f:
@@ -60,10 +354,45 @@ def main():
         default="models/quantized/8bit_model",
         help="Output dir for 8-bit model",
     )
+    parser.add_argument(
+        "--mode",
+        choices=("bnb-8bit",) + CPU_MODES,
+        default="bnb-8bit",
+        help="bitsandbytes 8-bit (CUDA) or a CPU mode: PyTorch dynamic INT8, "
+        "or weight-only int8/int4 Linear layers",
+    )
+    parser.add_argument(
+        "--arch",
+        choices=sorted(MODEL_CLASSES),
+        default="causal",
+        help="Model architecture to load (CPU modes)",
+    )
+    parser.add_argument(
+        "--stats-out",
+        default="eval/quant_stats.md",
+        help="Markdown file to write size and peak-memory stats to (CPU modes)",
+    )
     args = parser.parse_args()
 
     os.makedirs(os.path.dirname(args.baseline_out), exist_ok=True)
 
+    if args.mode in CPU_MODES:
+        stats = quantize_cpu(
+            args.model_dir,
+            load_prompts(args.prompts),
+            args.mode,
+            args.arch,
+            args.quant_out,
+            args.baseline_out,
+            args.stats_out,
+        )
+        print(
+            f"Saved {args.mode} model to {args.quant_out} "
+            f"({_fmt_mb(stats['size_before'])} -> {_fmt_mb(stats['size_after'])}); "
+            f"wrote stats to {args.stats_out}"
+        )
+        return
+
     # Load model and tokenizer in 8-bit mode for baseline
     tokenizer = AutoTokenizer.from_pretrained(args.model_dir, use_fast=True)
     model = AutoModelForCausalLM.from_pretrained(
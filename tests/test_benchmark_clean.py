@@ -0,0 +1,23 @@
+import json
+
+from scripts.benchmark_clean import benchmark_clean, compare_strippers
+
+
+def test_benchmark_clean_reports_each_worker_count(tmp_path):
+    records = [{"question": f"Q{i} " * 10, "answer": f"A{i} " * 10} for i in range(20)]
+    infile = tmp_path / "in.jsonl"
+    infile.write_text("\n".join(json.dumps(r) for r in records), encoding="utf8")
+    results = benchmark_clean(str(infile), [1, 2], chunk_size=5)
+    assert [r["workers"] for r in results] == [1, 2]
+    assert all(r["records"] == 20 and r["kept"] == 20 for r in results)
+    assert results[0]["speedup"] == 1.0
+    assert all(r["records_per_sec"] > 0 for r in results)
+
+
+def test_compare_strippers_reports_matches_and_mismatches():
+    report = compare_strippers(["<p>a &amp; b</p>", "plain", "&notanentity;"])
+    assert report["texts"] == 3
+    # legacy entities without ";" are decoded by html.unescape but not bleach
+    assert report["matches"] == 2
+    assert report["examples"][0]["input"] == "&notanentity;"
+    assert report["fast_texts_per_sec"] > 0
@@ -0,0 +1,17 @@
+from scripts.benchmark_faqs import (benchmark_parsers, parse_faq_html_siblings,
+                                    synthetic_faq_page)
+from scripts.scrape_faqs import parse_faq_html
+
+
+def test_single_pass_matches_sibling_scan():
+    html = synthetic_faq_page(50, "headings")
+    faqs = parse_faq_html(html, "html.parser")
+    assert len(faqs) == 50
+    assert faqs == parse_faq_html_siblings(html)
+
+
+def test_benchmark_parsers_covers_layouts():
+    results = benchmark_parsers([20], repeat=1)
+    assert {r["layout"] for r in results} == {"headings", "dl", "details"}
+    assert any(r["extractor"] == "siblings/html.parser" for r in results)
+    assert all(r["matches"] and r["items_per_sec"] > 0 for r in results)
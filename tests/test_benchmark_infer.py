@@ -0,0 +1,69 @@
+import csv
+import json
+
+import pytest
+import torch
+
+from src.benchmark_infer import (benchmark_config, latency_summary,
+                                 make_batches, run_batch, write_results)
+
+
+class DummyTok:
+    eos_token_id = 1
+
+    def __call__(self, batch, **kwargs):
+        ids = torch.full((len(batch), 3), 5)
+        return {"input_ids": ids, "attention_mask": torch.ones_like(ids)}
+
+
+class DummyModel:
+    def generate(self, input_ids, attention_mask, max_length):
+        # row 0 stops after two tokens, the others run to max_length
+        out = torch.full((input_ids.shape[0], max_length), 7)
+        out[:, 0] = 0
+        out[0, 2] = 1
+        out[0, 3:] = 0
+        return out
+
+
+def test_latency_summary():
+    summary = latency_summary(list(range(1, 101)))
+    assert summary["p50_ms"] == pytest.approx(50.5)
+    assert summary["p99_ms"] == pytest.approx(99.01)
+    assert summary["mean_ms"] == pytest.approx(50.5)
+
+
+def test_make_batches_cycles_prompts():
+    batches = list(make_batches(["a", "b", "c"], 2, 3))
+    assert batches == [["a", "b"], ["c", "a"], ["b", "c"]]
+
+
+def test_run_batch_counts_tokens_up_to_eos():
+    cpu = torch.device("cpu")
+    tokens = run_batch(DummyModel(), DummyTok(), ["x", "y"], 6, "seq2seq", cpu)
+    # row 0: two tokens including EOS; row 1: all five after the start token
+    assert tokens == 2 + 5
+
+
+def test_benchmark_config_and_write_results(tmp_path):
+    row = benchmark_config(
+        DummyModel(),
+        DummyTok(),
+        ["x", "y"],
+        batch_size=2,
+        max_length=6,
+        arch="seq2seq",
+        device=torch.device("cpu"),
+        warmup=1,
+        iterations=4,
+    )
+    assert row["p50_ms"] <= row["p90_ms"] <= row["p99_ms"]
+    assert row["tokens_per_sec"] > 0 and row["peak_mem_mb"] > 0
+    row.update(engine="pytorch", threads=1)
+
+    csv_path, json_path = tmp_path / "b.csv", tmp_path / "b.json"
+    write_results([row], str(csv_path), str(json_path))
+    with open(csv_path) as f:
+        rows = list(csv.DictReader(f))
+    assert rows[0]["engine"] == "pytorch" and rows[0]["iterations"] == "4"
+    assert json.loads(json_path.read_text())[0]["batch_size"] == 2
@@ -1,8 +1,12 @@
+import html
+import io
 import json
 
 import pytest
 
-from scripts.clean_data import clean_dataset, clean_text, extract_qa
+from scripts.clean_data import (DigestSet, clean_dataset, clean_text,
+                                extract_qa, iter_json_array, iter_records,
+                                strip_html_bleach, strip_html_fast)
 
 
 @pytest.mark.parametrize(
@@ -48,3 +52,182 @@ def test_clean_dataset(tmp_path):
     # Expect first cleaned Q1+A1 and third Q2+A2
     assert results[0]["question"].startswith("Q1")
     assert results[1]["question"] == "Q2?"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64])
+def test_iter_json_array_small_chunks(chunk_size):
+    data = [
+        {"question": "a, [b]?", "answer": 'c "quoted" ]'},
+        {"nested": {"list": [1, 2.5, None, True]}},
+        12345,
+        [],
+    ]
+    text = "  [\n " + " ,\n".join(json.dumps(d) for d in data) + "\n]\n"
+    assert list(iter_json_array(io.StringIO(text), chunk_size)) == data
+    assert list(iter_json_array(io.StringIO("[ ]"), chunk_size)) == []
+
+
+@pytest.mark.parametrize("text", ["[1, 2", "[1 2]", "[1,]", '{"a": 1}'])
+def test_iter_json_array_rejects_malformed(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), 2))
+
+
+def test_iter_json_array_is_lazy():
+    class CountingReader(io.StringIO):
+        reads = 0
+
+        def read(self, size=-1):
+            self.reads += 1
+            return super().read(size)
+
+    text = "[" + ",".join(json.dumps({"i": i}) for i in range(1000)) + "]"
+    src = CountingReader(text)
+    first = next(iter_json_array(src, chunk_size=16))
+    assert first == {"i": 0}
+    assert src.tell() < 100
+
+
+def test_iter_json_array_raises_syntax_errors_without_reading_on():
+    good = ",".join(json.dumps({"i": i, "text": "x" * 40}) for i in range(1000))
+    src = io.StringIO('[{"i": -1, "text": "ok"}, {"i": 0, "bad" 1},' + good + "]")
+    with pytest.raises(ValueError):
+        list(iter_json_array(src, chunk_size=256))
+    assert src.tell() <= 512
+
+
+def test_clean_dataset_jsonl_streaming(tmp_path):
+    records = [
+        {"question": "Q1 " * 10, "answer": "A1 " * 10},
+        {"question": "Q2 " * 10, "answer": "A1 " * 10},  # duplicate answer
+        {"foo": "bar"},
+        {"question": "Q3 " * 10, "answer": "<p>A3</p> " * 10},
+    ]
+    infile = tmp_path / "in.jsonl"
+    outfile = tmp_path / "out.jsonl"
+    infile.write_text(
+        "\n".join(json.dumps(r) for r in records) + "\n\n", encoding="utf8"
+    )
+    with open(infile, encoding="utf8") as src:
+        assert len(list(iter_records(src))) == 4
+    count = clean_dataset(str(infile), str(outfile), min_tokens=10, max_tokens=100)
+    results = [json.loads(l) for l in outfile.read_text(encoding="utf8").splitlines()]
+    assert count == 2
+    assert [r["question"][:2] for r in results] == ["Q1", "Q3"]
+    assert results[1]["answer"].startswith("A3 A3")
+
+
+def test_clean_dataset_workers_match_serial(tmp_path):
+    records = []
+    for i in range(60):
+        # every 7th answer repeats one from an earlier chunk
+        n = i - 20 if i % 7 == 0 and i > 20 else i
+        records.append({"question": f"<b>Q{i}</b> " * 10, "answer": f"A{n} " * 10})
+    records.append({"question": "short", "answer": "short"})
+    infile = tmp_path / "in.json"
+    infile.write_text(json.dumps(records), encoding="utf8")
+
+    serial, parallel = tmp_path / "serial.jsonl", tmp_path / "parallel.jsonl"
+    n_serial = clean_dataset(str(infile), str(serial), 10, 100)
+    n_parallel = clean_dataset(
+        str(infile), str(parallel), 10, 100, workers=2, chunk_size=4
+    )
+    assert n_parallel == n_serial < 60
+    assert parallel.read_text(encoding="utf8") == serial.read_text(encoding="utf8")
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        "<p>Hello <b>World</b>!</p>",
+        "<div>a</div><div>b</div>",
+        "<ul><li>one</li><li>two</li></ul>",
+        "<a href=\"x>y\" title='q'>link</a> <img src=x/>",
+        "<!-- note -->1 < 2 && 3 > 2",
+        "<pre><code>kind: Pod\n  name: &lt;none&gt;</code></pre>",
+        "unterminated <div",
+        "<!DOCTYPE html><p\nclass='x'>m</p>",
+    ],
+)
+def test_fast_stripper_matches_bleach(raw):
+    expected = html.unescape(strip_html_bleach(raw))
+    assert strip_html_fast(raw) == expected
+
+
+def test_clean_text_fast_decodes_code_entities():
+    raw = "<pre><code>image: &lt;registry&gt;/app:1.0 &amp;&amp; run</code></pre>"
+    assert clean_text(raw, "bleach") == "image: &lt;registry&gt;/app:1.0 &amp;&amp; run"
+    assert clean_text(raw, "fast") == "image: <registry>/app:1.0 && run"
+
+
+@pytest.mark.parametrize("bits", [64, 128])
+def test_digest_set_grows_and_persists(tmp_path, bits):
+    index = DigestSet(bits, capacity=2)
+    texts = [f"answer {i}" for i in range(500)]
+    assert all(index.add(t) for t in texts)
+    assert not any(index.add(t) for t in texts)
+    assert len(index) == 500 and "answer 7" in index and "other" not in index
+
+    path = tmp_path / "index.bin"
+    index.save(str(path))
+    loaded = DigestSet.load(str(path))
+    assert loaded.bits == bits and len(loaded) == 500
+    assert sorted(loaded.digests()) == sorted(index.digests())
+
+
+@pytest.mark.parametrize("bits", [64, 128])
+def test_digest_set_grows_without_listing_digests(monkeypatch, bits):
+    index = DigestSet(bits, capacity=2)
+    monkeypatch.setattr(DigestSet, "digests", None)
+    texts = [f"answer {i}" for i in range(100)]
+    assert all(index.add(t) for t in texts)
+    assert len(index) == 100 and all(t in index for t in texts)
+
+
+def test_clean_dataset_hash_index_dedupes_across_runs(tmp_path):
+    def write(name, answers):
+        path = tmp_path / name
+        records = [
+            {"question": f"Q {a} " * 10, "answer": f"A {a} " * 10} for a in answers
+        ]
+        path.write_text("\n".join(json.dumps(r) for r in records), encoding="utf8")
+        return str(path)
+
+    index = str(tmp_path / "seen.idx")
+    out = str(tmp_path / "out.jsonl")
+    assert (
+        clean_dataset(write("day1.jsonl", [1, 2, 2]), out, 10, 100, hash_index=index)
+        == 2
+    )
+    assert (
+        clean_dataset(write("day2.jsonl", [2, 3]), out, 10, 100, hash_index=index) == 1
+    )
+    assert json.loads(open(out, encoding="utf8").read())["answer"].startswith("A 3")
+    with pytest.raises(ValueError):
+        clean_dataset(
+            write("day3.jsonl", [4]), out, 10, 100, hash_index=index, hash_bits=128
+        )
+
+
+def test_clean_dataset_hash_index_rejects_reindexing_an_input(tmp_path):
+    infile = tmp_path / "in.jsonl"
+    infile.write_text(json.dumps({"question": "Q " * 10, "answer": "A " * 10}))
+    index, out = str(tmp_path / "seen.idx"), tmp_path / "out.jsonl"
+    assert clean_dataset(str(infile), str(out), 10, 100, hash_index=index) == 1
+    kept = out.read_text(encoding="utf8")
+    with pytest.raises(ValueError, match="already in"):
+        clean_dataset(str(infile), str(out), 10, 100, hash_index=index)
+    assert out.read_text(encoding="utf8") == kept
+
+
+def test_clean_dataset_question_answer_dedup(tmp_path):
+    records = [
+        {"question": "Q1 " * 10, "answer": "same " * 10},
+        {"question": "Q2 " * 10, "answer": "same " * 10},
+        {"question": "Q1 " * 10, "answer": "same " * 10},
+    ]
+    infile = tmp_path / "in.json"
+    infile.write_text(json.dumps(records), encoding="utf8")
+    out = str(tmp_path / "out.jsonl")
+    assert clean_dataset(str(infile), out, 10, 100) == 1
+    assert clean_dataset(str(infile), out, 10, 100, dedup_key="question+answer") == 2
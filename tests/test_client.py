@@ -2,6 +2,7 @@ import json
 import os
 
 import pytest
+import requests
 
 
 @pytest.fixture(autouse=True)
@@ -15,6 +16,8 @@ def test_client_single_request(monkeypatch, tmp_path, capsys):
     import localllm_client.client as client_mod
 
     class DummyResponse:
+        status_code = 200
+
         def __init__(self):
             self._json = {"answer": "dummy"}
 
@@ -24,13 +27,13 @@ def test_client_single_request(monkeypatch, tmp_path, capsys):
         def json(self):
             return self._json
 
-    def dummy_post(url, json, headers):
-        assert headers.get("X-API-Key") == "testkey"
+    def dummy_post(self, url, json, timeout):
+        assert self.headers.get("X-API-Key") == "testkey"
         assert "/predict" in url
         assert json["question"] == "Hello"
         return DummyResponse()
 
-    monkeypatch.setattr("requests.post", dummy_post)
+    monkeypatch.setattr("requests.Session.post", dummy_post)
 
     # run client
     monkeypatch.setenv("API_KEY", "testkey")
@@ -60,6 +63,8 @@ def test_client_batch_request(monkeypatch, tmp_path, capsys):
     batch_file.write_text(json.dumps({"questions": ["Q1", "Q2"]}), encoding="utf8")
 
     class DummyResponse:
+        status_code = 200
+
         def __init__(self):
             self._json = {"answers": ["a1", "a2"]}
 
@@ -69,12 +74,12 @@ def test_client_batch_request(monkeypatch, tmp_path, capsys):
         def json(self):
             return self._json
 
-    def dummy_post(url, json, headers):
+    def dummy_post(self, url, json, timeout):
         assert "/predict_batch" in url
         assert json["questions"] == ["Q1", "Q2"]
         return DummyResponse()
 
-    monkeypatch.setattr("requests.post", dummy_post)
+    monkeypatch.setattr("requests.Session.post", dummy_post)
     import sys
 
     monkeypatch.setenv("API_KEY", "testkey")
@@ -90,3 +95,137 @@ def test_client_batch_request(monkeypatch, tmp_path, capsys):
     client.main()
     captured = capsys.readouterr()
     assert '"answers": ["a1", "a2"]' in captured.out
+
+
+def test_client_stream_request(monkeypatch, capsys):
+    class DummyStreamResponse:
+        status_code = 200
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+        def raise_for_status(self):
+            pass
+
+        def iter_lines(self, decode_unicode=False):
+            yield 'data: {"token": "Hello "}'
+            yield ""
+            yield 'data: {"token": "world"}'
+            yield ""
+            yield 'data: {"done": true, "ttft_ms": 1.0, "total_ms": 2.0}'
+
+    def dummy_post(self, url, json, timeout, stream=False):
+        assert url.endswith("/predict_stream")
+        assert stream is True
+        return DummyStreamResponse()
+
+    monkeypatch.setattr("requests.Session.post", dummy_post)
+    import sys
+
+    sys.argv = ["client.py", "--url", "http://test", "--question", "Hi", "--stream"]
+    import localllm_client.client as client
+
+    client.main()
+    captured = capsys.readouterr()
+    assert captured.out == "Hello world\n"
+    assert "Time to first token:" in captured.err
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+    def json(self):
+        return self._data
+
+    def close(self):
+        pass
+
+
+def test_client_retries_on_503_and_429(monkeypatch):
+    from localllm_client import LocalLLMClient
+
+    responses = [
+        FakeResponse(503, headers={"Retry-After": "2"}),
+        FakeResponse(429),
+        FakeResponse(200, {"answer": "ok"}),
+    ]
+    sleeps = []
+    monkeypatch.setattr(
+        "requests.Session.post", lambda self, url, **kw: responses.pop(0)
+    )
+    monkeypatch.setattr("localllm_client.client.time.sleep", sleeps.append)
+    client = LocalLLMClient("http://test", max_retries=3, backoff=0.5)
+    assert client.predict("Hi") == "ok"
+    # Retry-After is honored, then exponential backoff from ``backoff``
+    assert sleeps == [2.0, 1.0]
+
+
+def test_client_gives_up_after_max_retries(monkeypatch):
+    from localllm_client import LocalLLMClient
+
+    monkeypatch.setattr(
+        "requests.Session.post", lambda self, url, **kw: FakeResponse(503)
+    )
+    monkeypatch.setattr("localllm_client.client.time.sleep", lambda s: None)
+    client = LocalLLMClient("http://test", max_retries=2)
+    with pytest.raises(requests.HTTPError):
+        client.predict("Hi")
+
+
+def test_client_batch_is_chunked_and_ordered(monkeypatch):
+    from localllm_client import LocalLLMClient
+
+    seen = []
+
+    def fake_post(self, url, json, timeout):
+        seen.append(json["questions"])
+        assert timeout == 5
+        return FakeResponse(200, {"answers": [q.lower() for q in json["questions"]]})
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+    client = LocalLLMClient("http://test", chunk_size=2, max_concurrency=3)
+    questions = [f"Q{i}" for i in range(7)]
+    assert client.predict_batch(questions, timeout=5) == [q.lower() for q in questions]
+    assert sorted(map(len, seen)) == [1, 2, 2, 2]
+
+
+def test_async_client_batch_and_retry():
+    import asyncio
+
+    import httpx
+
+    from localllm_client import AsyncLocalLLMClient
+
+    calls = []
+
+    def handler(request):
+        assert request.headers["X-API-Key"] == "k"
+        body = json.loads(request.content)
+        calls.append(body)
+        if len(calls) == 1:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        answers = [q + "!" for q in body["questions"]]
+        return httpx.Response(200, json={"answers": answers})
+
+    async def run():
+        client = AsyncLocalLLMClient(
+            "http://test",
+            api_key="k",
+            chunk_size=2,
+            transport=httpx.MockTransport(handler),
+        )
+        async with client:
+            return await client.predict_batch(["a", "b", "c"])
+
+    assert asyncio.run(run()) == ["a!", "b!", "c!"]
+    assert len(calls) == 3
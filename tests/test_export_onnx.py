@@ -29,3 +29,27 @@ def test_export_onnx_dry_run(monkeypatch, tmp_path, capsys):
     export_main()
     captured = capsys.readouterr()
     assert f"ONNX model exported to {onnx_out}" in captured.out
+
+
+def test_convert_quantizes_then_optimizes(monkeypatch, tmp_path):
+    from src import onnx_exporter
+
+    def fake_export(model_dir, output, task, opset):
+        assert task == "text2text-generation-with-past"
+        for name in ("encoder_model.onnx", "decoder_with_past_model.onnx"):
+            (tmp_path / name).write_text("graph")
+
+    steps = []
+    monkeypatch.setattr(onnx_exporter, "main_export", fake_export)
+    monkeypatch.setattr(
+        onnx_exporter, "quantize_int8", lambda p: steps.append(("int8", p))
+    )
+    monkeypatch.setattr(
+        onnx_exporter, "optimize_graph", lambda p, level: steps.append((level, p))
+    )
+    files = onnx_exporter.convert("model", str(tmp_path), quantize=True)
+    assert [os.path.basename(f) for f in files] == [
+        "decoder_with_past_model.onnx",
+        "encoder_model.onnx",
+    ]
+    assert [s[0] for s in steps] == ["int8", "extended", "int8", "extended"]
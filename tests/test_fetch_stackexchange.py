@@ -1,9 +1,16 @@
+import json
+import os
+import threading
 import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
 import pytest
 import requests
 
-from scripts.fetch_stackexchange import fetch_questions
+from scripts.fetch_stackexchange import (RateLimiter, checkpoint_path,
+                                         fetch_page, fetch_questions,
+                                         fetch_to_jsonl)
 
 
 def test_fetch_questions_pagination(monkeypatch):
@@ -38,3 +45,128 @@ def test_fetch_questions_pagination(monkeypatch):
     # Verify pagination incremented page parameter
     assert calls[0]["page"] == 1
     assert calls[1]["page"] == 2
+
+
+class StubAPI:
+    """Local stand-in for the questions endpoint, served on a free port."""
+
+    def __init__(self, items_by_tag, page_size=2, quota=100):
+        self.items_by_tag = items_by_tag
+        self.page_size = page_size
+        self.quota = quota
+        self.failures = {}  # (tag, page) -> HTTP statuses to answer with first
+        self.backoff = {}  # (tag, page) -> backoff seconds
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                tag, page = query["tagged"][0], int(query["page"][0])
+                stub.requests.append((tag, page))
+                statuses = stub.failures.get((tag, page))
+                if statuses:
+                    self.reply(statuses.pop(0), {"error_id": 500})
+                    return
+                stub.quota -= 1
+                items = stub.items_by_tag[tag]
+                start = (page - 1) * stub.page_size
+                body = {
+                    "items": items[start : start + stub.page_size],
+                    "has_more": start + stub.page_size < len(items),
+                    "quota_remaining": stub.quota,
+                }
+                if (tag, page) in stub.backoff:
+                    body["backoff"] = stub.backoff[(tag, page)]
+                self.reply(200, body)
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/2.3/questions"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    items = {
+        "a": [{"question_id": i} for i in range(1, 6)],
+        "b": [{"question_id": i} for i in (4, 5, 6, 7)],
+    }
+    api = StubAPI(items)
+    yield api
+    api.close()
+
+
+def read_ids(path):
+    return sorted(json.loads(line)["question_id"] for line in open(path))
+
+
+def test_fetch_to_jsonl_streams_and_dedupes_across_tags(stub, tmp_path):
+    output = tmp_path / "raw" / "se.jsonl"
+    summary = fetch_to_jsonl(
+        ["a", "b"], 2, "key", str(output), url=stub.url, concurrency=2
+    )
+    assert read_ids(output) == [1, 2, 3, 4, 5, 6, 7]
+    assert summary["items"] == 7
+    assert summary["pages"] == 5
+    assert summary["complete"]
+    assert summary["quota_remaining"] == 95
+    assert not os.path.exists(checkpoint_path(str(output)))
+
+
+def test_fetch_to_jsonl_resumes_after_failure(stub, tmp_path):
+    output = tmp_path / "se.jsonl"
+    stub.failures[("a", 3)] = [500, 500]
+    with pytest.raises(requests.HTTPError):
+        fetch_to_jsonl(
+            ["a"], 2, "key", str(output), url=stub.url, max_retries=1, rate=1000
+        )
+    assert read_ids(output) == [1, 2, 3, 4]
+    with open(checkpoint_path(str(output))) as f:
+        assert json.load(f)["next_page"] == {"a": 3}
+
+    # a crash mid-write leaves a partial line, which is dropped on resume
+    with open(output, "a") as f:
+        f.write('{"question_id": 5, "tit')
+    stub.requests.clear()
+    summary = fetch_to_jsonl(["a"], 2, "key", str(output), url=stub.url)
+    assert stub.requests == [("a", 3)]
+    assert read_ids(output) == [1, 2, 3, 4, 5]
+    assert summary["complete"]
+
+
+def test_fetch_to_jsonl_stops_at_quota_floor(stub, tmp_path):
+    output = tmp_path / "se.jsonl"
+    stub.quota = 3
+    summary = fetch_to_jsonl(["a"], 2, "key", str(output), url=stub.url, min_quota=1)
+    assert summary == {"items": 4, "pages": 2, "quota_remaining": 1, "complete": False}
+    assert os.path.exists(checkpoint_path(str(output)))
+
+
+def test_fetch_page_honors_backoff_and_retries(stub, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    stub.failures[("a", 1)] = [503]
+    stub.backoff[("a", 1)] = 5
+    limiter = RateLimiter(rate=1000)
+    params = {"tagged": "a", "page": 1}
+    data = fetch_page(requests.get, stub.url, params, limiter, max_retries=2)
+    assert [item["question_id"] for item in data["items"]] == [1, 2]
+    # the 503 is retried after 1s of exponential backoff
+    assert sleeps and 0.9 < sleeps[0] <= 1.0
+    limiter.wait()
+    assert 4.9 < sleeps[-1] <= 5.0
@@ -1,3 +1,7 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from fastapi import FastAPI
 
@@ -9,6 +13,12 @@ def clear_model(monkeypatch):
     # Ensure model/tokenizer are unset for tests
     monkeypatch.setattr(api, "tokenizer", None)
     monkeypatch.setattr(api, "model", None)
+    monkeypatch.setattr(api, "batcher", None)
+    monkeypatch.setattr(api, "cache", None)
+    monkeypatch.setattr(api, "executor", None)
+    monkeypatch.setattr(api, "max_pending", None)
+    monkeypatch.setattr(api, "pending_requests", 0)
+    monkeypatch.setattr(api, "metrics", api.ServerMetrics())
     # disable API key enforcement for tests
     monkeypatch.delenv("API_KEY", raising=False)
     return api
@@ -51,3 +61,393 @@ def test_predict_smoke(monkeypatch):
     response = client.post("/predict", json={"question": "Test question"})
     assert response.status_code == 200
     assert response.json() == {"answer": "dummy"}
+
+
+class EchoTok:
+    """Encode 'q<N>' questions to [[N], ...] so answers can be matched to callers."""
+
+    def __call__(self, texts, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+
+        class Enc:
+            input_ids = [[int(t[1:])] for t in texts]
+            attention_mask = [[1] for _ in texts]
+
+        return Enc()
+
+    def decode(self, ids, skip_special_tokens=True):
+        return f"a{ids[0]}"
+
+
+class SerialModel:
+    """Model stub with a fixed per-call cost that cannot overlap (like a busy CPU)."""
+
+    def __init__(self, cost=0.02):
+        self.cost = cost
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate(self, input_ids, attention_mask, max_length):
+        with self._lock:
+            self.calls.append(len(input_ids))
+            time.sleep(self.cost)
+            return list(input_ids)
+
+
+def _drive(client, n):
+    def call(i):
+        resp = client.post("/predict", json={"question": f"q{i}"})
+        assert resp.status_code == 200
+        return resp.json()["answer"]
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return list(pool.map(call, range(n)))
+
+
+def test_micro_batching_load(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    n = 16
+    monkeypatch.setattr(api, "tokenizer", EchoTok())
+    client = TestClient(api.app)
+
+    # current per-request path: one generate call per question
+    per_request = SerialModel()
+    monkeypatch.setattr(api, "model", per_request)
+    answers = _drive(client, n)
+    assert answers == [f"a{i}" for i in range(n)]
+    assert len(per_request.calls) == n
+
+    # micro-batched path: concurrent requests share generate calls
+    batched = SerialModel()
+    monkeypatch.setattr(api, "model", batched)
+    batcher = api.MicroBatcher(api.generate_answers, max_batch_size=8, max_wait_ms=20)
+    monkeypatch.setattr(api, "batcher", batcher.start())
+    try:
+        answers = _drive(client, n)
+    finally:
+        batcher.stop()
+    assert answers == [f"a{i}" for i in range(n)]
+    assert sum(batched.calls) == n
+    assert len(batched.calls) < n
+    assert max(batched.calls) <= 8
+
+
+def test_micro_batcher_groups_by_max_length():
+    seen = []
+
+    def fake_generate(questions, max_length):
+        seen.append((max_length, list(questions)))
+        return [f"{q}@{max_length}" for q in questions]
+
+    batcher = api.MicroBatcher(fake_generate, max_batch_size=4, max_wait_ms=50).start()
+    try:
+        futures = [
+            batcher.submit("a", 16),
+            batcher.submit("b", 32),
+            batcher.submit("c", 16),
+        ]
+        results = [f.result(timeout=5) for f in futures]
+    finally:
+        batcher.stop()
+    assert results == ["a@16", "b@32", "c@16"]
+    assert (16, ["a", "c"]) in seen and (32, ["b"]) in seen
+
+
+def test_micro_batcher_propagates_errors():
+    def failing_generate(questions, max_length):
+        raise RuntimeError("boom")
+
+    batcher = api.MicroBatcher(
+        failing_generate, max_batch_size=2, max_wait_ms=1
+    ).start()
+    try:
+        with pytest.raises(RuntimeError):
+            batcher.submit("q", 8).result(timeout=5)
+    finally:
+        batcher.stop()
+
+
+def test_predict_batch_bucketed(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    class LengthTok(EchoTok):
+        # token length grows with the question id so sorting reorders input
+        def __call__(self, texts, **kwargs):
+            enc = super().__call__(texts, **kwargs)
+            enc.input_ids = [[int(t[1:])] * int(t[1:]) for t in texts]
+            return enc
+
+    chunks = []
+    generate_answers = api.generate_answers
+
+    def recording_generate(questions, max_length):
+        chunks.append(list(questions))
+        return generate_answers(questions, max_length)
+
+    monkeypatch.setattr(api, "tokenizer", LengthTok())
+    monkeypatch.setattr(api, "model", SerialModel(cost=0))
+    monkeypatch.setattr(api, "generate_answers", recording_generate)
+    monkeypatch.setattr(api, "batch_chunk_size", 2)
+    client = TestClient(api.app)
+    questions = ["q5", "q1", "q4", "q2", "q3"]
+    response = client.post("/predict_batch", json={"questions": questions})
+    assert response.status_code == 200
+    assert response.json() == {"answers": ["a5", "a1", "a4", "a2", "a3"]}
+    # length-sorted chunks of 2 -> 3 generate calls instead of 5
+    assert chunks == [["q1", "q2"], ["q3", "q4"], ["q5"]]
+
+
+def test_predict_stream(monkeypatch):
+    import json
+
+    from fastapi.testclient import TestClient
+
+    class StreamingModel:
+        def generate(self, input_ids, attention_mask, max_length, streamer):
+            streamer.on_finalized_text("Hello ")
+            streamer.on_finalized_text("world", stream_end=True)
+
+    monkeypatch.setattr(api, "tokenizer", EchoTok())
+    monkeypatch.setattr(api, "model", StreamingModel())
+    client = TestClient(api.app)
+    response = client.post("/predict_stream", json={"question": "q1"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        json.loads(line[len("data: ") :])
+        for line in response.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert [e["token"] for e in events[:-1]] == ["Hello ", "world"]
+    assert events[-1]["done"] is True
+    assert events[-1]["ttft_ms"] <= events[-1]["total_ms"]
+
+
+def test_predict_stream_error(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    class FailingModel:
+        def generate(self, **kwargs):
+            raise RuntimeError("boom")
+
+    monkeypatch.setattr(api, "tokenizer", EchoTok())
+    monkeypatch.setattr(api, "model", FailingModel())
+    client = TestClient(api.app)
+    response = client.post("/predict_stream", json={"question": "q1"})
+    assert 'data: {"error": "boom"}' in response.text
+
+
+def test_predict_stream_admission_is_not_leaked(monkeypatch):
+    import asyncio
+
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(api, "tokenizer", EchoTok())
+    monkeypatch.setattr(api, "model", object())
+    monkeypatch.setattr(api, "max_pending", 1)
+    # a response whose body is never iterated holds no slot
+    req = api.InferenceRequest(question="q1")
+    response = asyncio.run(api.predict_stream(req))
+    assert api.pending_requests == 0
+    del response
+
+    monkeypatch.setattr(api, "pending_requests", 1)
+    rejected = TestClient(api.app).post("/predict_stream", json={"question": "q1"})
+    assert rejected.status_code == 503
+    assert api.pending_requests == 1
+
+
+def test_response_cache_normalizes_and_counts():
+    cache = api.ResponseCache(max_entries=2)
+    key = api.ResponseCache.make_key("<p>How do I expose a  Service?</p>", "m", 64)
+    same = api.ResponseCache.make_key("How do I expose a Service?", "m", 64)
+    assert key == same
+    assert key != api.ResponseCache.make_key("How do I expose a Service?", "m", 32)
+    assert key != api.ResponseCache.make_key("How do I expose a Service?", "n", 64)
+    assert cache.get(key) is None
+    cache.put(key, "kubectl expose")
+    assert cache.get(same) == "kubectl expose"
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_response_cache_lru_and_ttl(monkeypatch):
+    cache = api.ResponseCache(max_entries=2, ttl_seconds=10)
+    now = [1000.0]
+    monkeypatch.setattr(api.time, "time", lambda: now[0])
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"  # "b" becomes least recently used
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+def test_response_cache_persists_to_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    api.ResponseCache(max_entries=4, path=path).put("k", "answer")
+    restarted = api.ResponseCache(max_entries=4, path=path)
+    assert restarted.get("k") == "answer"
+    assert restarted.hits == 1
+
+
+def test_response_cache_evicts_oldest_rows_and_batches_commits(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "cache.sqlite")
+    cache = api.ResponseCache(max_entries=3, path=path)
+    cache.COMMIT_INTERVAL = 3600
+    for i in range(5):
+        cache.put(f"k{i}", f"a{i}")
+    cache.put("k4", "again")
+    reader = sqlite3.connect(path)
+    # only the first put was committed so far
+    assert reader.execute("SELECT key FROM responses").fetchall() == [("k0",)]
+    cache.flush()
+    rows = reader.execute("SELECT key FROM responses ORDER BY created").fetchall()
+    assert rows == [("k2",), ("k3",), ("k4",)]
+    assert cache._db_rows == 3
+
+
+def test_predict_uses_cache(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    model = SerialModel(cost=0)
+    monkeypatch.setattr(api, "tokenizer", EchoTok())
+    monkeypatch.setattr(api, "model", model)
+    monkeypatch.setattr(api, "cache", api.ResponseCache(max_entries=8))
+    client = TestClient(api.app)
+    for _ in range(3):
+        response = client.post("/predict", json={"question": "q7"})
+        assert response.json() == {"answer": "a7"}
+    response = client.post("/predict_batch", json={"questions": ["q7", "q8"]})
+    assert response.json() == {"answers": ["a7", "a8"]}
+    # one generate for q7, one for the q8 miss in the batch
+    assert model.calls == [1, 1]
+    assert client.get("/health").json()["cache"]["hits"] == 3
+
+
+def test_thread_executor_runs_batch_chunks(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(api, "tokenizer", EchoTok())
+    monkeypatch.setattr(api, "model", SerialModel(cost=0))
+    monkeypatch.setattr(api, "batch_chunk_size", 1)
+    api.init_executor("thread", 2, threads_per_worker=1)
+    try:
+        client = TestClient(api.app)
+        response = client.post("/predict_batch", json={"questions": ["q1", "q2"]})
+        assert response.json() == {"answers": ["a1", "a2"]}
+        response = client.post("/predict", json={"question": "q3"})
+        assert response.json() == {"answer": "a3"}
+    finally:
+        api.executor.shutdown()
+
+
+def test_admission_control_rejects_overload(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    started = threading.Event()
+    release = threading.Event()
+
+    class BlockingModel:
+        def generate(self, input_ids, attention_mask, max_length):
+            started.set()
+            release.wait(timeout=5)
+            return list(input_ids)
+
+    monkeypatch.setattr(api, "tokenizer", EchoTok())
+    monkeypatch.setattr(api, "model", BlockingModel())
+    monkeypatch.setattr(api, "max_pending", 1)
+    client = TestClient(api.app)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        first = pool.submit(client.post, "/predict", json={"question": "q1"})
+        assert started.wait(timeout=5)
+        rejected = client.post("/predict", json={"question": "q2"})
+        release.set()
+        assert first.result().json() == {"answer": "a1"}
+    assert rejected.status_code == 503
+    assert rejected.headers["retry-after"] == "1"
+    assert api.pending_requests == 0
+    # capacity is released once the first request completes
+    assert client.post("/predict", json={"question": "q3"}).status_code == 200
+
+
+def test_histogram_render_is_cumulative():
+    hist = api.Histogram((1, 5))
+    for value in (0.5, 1, 3, 10):
+        hist.observe(value)
+    assert hist.render("h", stage="x") == [
+        'h_bucket{stage="x",le="1"} 2',
+        'h_bucket{stage="x",le="5"} 3',
+        'h_bucket{stage="x",le="+Inf"} 4',
+        'h_sum{stage="x"} 14.5',
+        'h_count{stage="x"} 4',
+    ]
+
+
+def test_metrics_endpoint(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(api, "tokenizer", EchoTok())
+    monkeypatch.setattr(api, "model", SerialModel(cost=0))
+    monkeypatch.setattr(api, "cache", api.ResponseCache(max_entries=8))
+    client = TestClient(api.app)
+    client.post("/predict", json={"question": "q1"})
+    client.post("/predict", json={"question": "q1"})
+    client.post("/predict_batch", json={"questions": ["q2", "q3"]})
+    client.get("/does-not-exist")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    assert 'localllm_requests_total{path="/predict",status="200"} 2' in body
+    assert 'localllm_requests_total{path="other",status="404"} 1' in body
+    assert 'localllm_stage_seconds_count{stage="generate"} 2' in body
+    assert 'localllm_batch_size_bucket{le="1"} 1' in body
+    assert 'localllm_batch_size_bucket{le="2"} 2' in body
+    assert "localllm_generated_tokens_total 3" in body
+    assert "localllm_cache_hits_total 1" in body
+    assert "localllm_requests_in_flight 0" in body
+
+
+def test_metrics_time_streams_until_the_body_ends(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    class SlowStreamingModel:
+        def generate(self, input_ids, attention_mask, max_length, streamer):
+            streamer.on_finalized_text("Hello ")
+            time.sleep(0.3)
+            streamer.on_finalized_text("world", stream_end=True)
+
+    monkeypatch.setattr(api, "tokenizer", EchoTok())
+    monkeypatch.setattr(api, "model", SlowStreamingModel())
+    client = TestClient(api.app)
+    client.post("/predict_stream", json={"question": "q1"})
+    hist = api.metrics.request_latency["/predict_stream"]
+    assert hist.count == 1 and hist.sum >= 0.3
+
+
+def test_load_seq2seq_onnx_backend(monkeypatch):
+    loaded = {}
+
+    class FakeORTModel:
+        @classmethod
+        def from_pretrained(cls, model_dir, **kwargs):
+            loaded.update(kwargs, model_dir=model_dir)
+            return cls()
+
+    monkeypatch.setattr(api, "ORTModelForSeq2SeqLM", FakeORTModel)
+    model = api.load_seq2seq("onnx_dir", backend="onnx", num_threads=2)
+    assert isinstance(model, FakeORTModel)
+    assert loaded["model_dir"] == "onnx_dir"
+    assert loaded["use_cache"] is True
+    assert loaded["session_options"].intra_op_num_threads == 2
+
+
+def test_load_seq2seq_onnx_missing(monkeypatch):
+    monkeypatch.setattr(api, "ORTModelForSeq2SeqLM", None)
+    with pytest.raises(RuntimeError):
+        api.load_seq2seq("onnx_dir", backend="onnx")
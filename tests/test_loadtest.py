@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from localllm_client.loadtest import (LoadGenerator, LoadStats, load_questions,
+                                      percentile, start_stub_server)
+
+
+def test_load_questions_jsonl_and_json(tmp_path):
+    jsonl = tmp_path / "combined.jsonl"
+    jsonl.write_text(
+        '{"question": "Q1", "answer": "A1"}\n\n{"question": "Q2", "answer": "A2"}\n',
+        encoding="utf8",
+    )
+    assert load_questions(str(jsonl)) == ["Q1", "Q2"]
+    prompts = tmp_path / "prompts.json"
+    prompts.write_text(json.dumps({"prompts": ["P"]}), encoding="utf8")
+    assert load_questions(str(prompts)) == ["P"]
+
+
+def test_percentile_and_summary():
+    assert percentile([], 50) is None
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == pytest.approx(2.5)
+    stats = LoadStats()
+    for i in range(1, 11):
+        stats.record(i / 1000, 200, 2)
+    stats.record(0.5, 503, 2)
+    stats.record(0.5, "ConnectionError", 2)
+    stats.finish()
+    summary = stats.summary()
+    assert summary["requests"] == 12 and summary["succeeded"] == 10
+    assert summary["errors"] == {"503": 1, "ConnectionError": 1}
+    assert summary["error_rate"] == pytest.approx(2 / 12)
+    assert summary["max_ms"] == pytest.approx(10.0)
+
+
+def test_payloads_cycle_through_questions():
+    gen = LoadGenerator("http://x", ["a", "b", "c"], "predict_batch", batch_size=2)
+    assert gen._payload(0)["questions"] == ["a", "b"]
+    assert gen._payload(1)["questions"] == ["c", "a"]
+    single = LoadGenerator("http://x/", ["a", "b"])
+    assert single.path == "/predict"
+    assert single._payload(3)["question"] == "b"
+
+
+@pytest.fixture
+def stub_url(monkeypatch):
+    from scripts import run_inference_api as api
+
+    # restore the server globals the stub replaces
+    for name in ("tokenizer", "model", "model_id"):
+        monkeypatch.setattr(api, name, getattr(api, name))
+    server, url = start_stub_server(latency_ms=5)
+    yield url
+    server.should_exit = True
+
+
+@pytest.mark.parametrize("endpoint", ["predict", "predict_batch"])
+def test_closed_loop_against_stub(stub_url, endpoint):
+    gen = LoadGenerator(stub_url, ["q1", "q2"], endpoint, batch_size=3)
+    summary = gen.run_closed_loop(concurrency=4, num_requests=20).summary()
+    assert summary["requests"] == 20 and summary["errors"] == {}
+    assert summary["throughput_rps"] > 0
+    assert summary["p50_ms"] >= 5
+
+
+def test_open_loop_counts_connection_errors():
+    gen = LoadGenerator("http://127.0.0.1:9", ["q"], timeout=1)
+    summary = gen.run_open_loop(rate=200, num_requests=5).summary()
+    assert summary["requests"] == 5
+    assert summary["errors"] == {"ConnectionError": 5}
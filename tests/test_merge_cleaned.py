@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from scripts.merge_cleaned import input_files, merge_cleaned, shard_paths
+
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def make_inputs(tmp_path):
+    clean = tmp_path / "clean"
+    clean.mkdir()
+    write_jsonl(
+        clean / "b_faq.jsonl",
+        [{"question": "Q2", "answer": "A2"}, {"question": "Q1 again", "answer": "A1"}],
+    )
+    write_jsonl(
+        clean / "a_se.jsonl",
+        [{"question": "Q1", "answer": "A1"}, {"question": "Q3", "answer": "A3"}],
+    )
+    return clean
+
+
+def test_merge_dedupes_across_files_in_sorted_order(tmp_path):
+    clean = make_inputs(tmp_path)
+    output = clean / "combined.jsonl"
+    assert merge_cleaned(str(clean), str(output)) == 3
+    assert [r["question"] for r in read_jsonl(output)] == ["Q1", "Q3", "Q2"]
+
+    # re-running does not merge the previous output (or shards) into itself
+    write_jsonl(
+        clean / "combined-00000-of-00002.jsonl", [{"question": "x", "answer": "y"}]
+    )
+    assert input_files(str(clean), str(output)) == [
+        str(clean / "a_se.jsonl"),
+        str(clean / "b_faq.jsonl"),
+    ]
+    assert merge_cleaned(str(clean), str(output)) == 3
+
+
+def test_merge_question_answer_key_keeps_repeated_answers(tmp_path):
+    clean = make_inputs(tmp_path)
+    output = tmp_path / "out" / "combined.jsonl"
+    assert merge_cleaned(str(clean), str(output), dedup_key="question+answer") == 4
+
+
+def test_merge_shuffle_is_seeded(tmp_path):
+    clean = tmp_path / "clean"
+    clean.mkdir()
+    records = [{"question": f"Q{i}", "answer": f"A{i}"} for i in range(200)]
+    write_jsonl(clean / "data.jsonl", records)
+    orders = []
+    for seed in (1, 1, 2):
+        output = tmp_path / f"out{len(orders)}.jsonl"
+        merge_cleaned(str(clean), str(output), shuffle=True, seed=seed)
+        orders.append([r["question"] for r in read_jsonl(output)])
+    assert orders[0] == orders[1]
+    assert orders[0] != orders[2]
+    assert orders[0] != [r["question"] for r in records]
+    assert sorted(orders[0]) == sorted(r["question"] for r in records)
+    assert not list(tmp_path.glob("tmp*"))
+
+
+def test_merge_writes_balanced_shards(tmp_path):
+    clean = tmp_path / "clean"
+    clean.mkdir()
+    write_jsonl(
+        clean / "data.jsonl",
+        [{"question": f"Q{i}", "answer": f"A{i}"} for i in range(10)],
+    )
+    output = tmp_path / "combined.jsonl"
+    assert merge_cleaned(str(clean), str(output), num_shards=3) == 10
+    paths = shard_paths(str(output), 3)
+    assert paths[0].endswith("combined-00000-of-00003.jsonl")
+    sizes = [len(read_jsonl(tmp_path / p)) for p in paths]
+    assert sizes == [4, 3, 3]
+    assert not output.exists()
+
+
+def test_merge_failure_leaves_no_temporary_files(tmp_path):
+    clean = make_inputs(tmp_path)
+    (clean / "c_bad.jsonl").write_text('{"question": "Q4", "answer": "A4"}\n{bad\n')
+    output = tmp_path / "out" / "combined.jsonl"
+    with pytest.raises(ValueError):
+        merge_cleaned(str(clean), str(output), num_shards=2)
+    assert list(output.parent.iterdir()) == []
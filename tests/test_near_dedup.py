@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+
+from scripts.near_dedup import (MinHasher, cluster, cluster_report, lsh_params,
+                                near_dedup, shingle_hashes)
+
+BASE = (
+    "Use kubectl rollout undo to roll a deployment back to its previous "
+    "revision and kubectl rollout history to list the revisions you can "
+    "return to when a release goes wrong in production"
+)
+
+
+def jaccard(a, b):
+    a, b = set(a.tolist()), set(b.tolist())
+    return len(a & b) / len(a | b)
+
+
+def test_minhash_estimates_jaccard():
+    hasher = MinHasher(num_perm=256, seed=3)
+    rng = np.random.default_rng(0)
+    shared = rng.integers(0, 2**32, size=60, dtype=np.uint64)
+    x = np.r_[shared, rng.integers(0, 2**32, size=20, dtype=np.uint64)]
+    y = np.r_[shared, rng.integers(0, 2**32, size=20, dtype=np.uint64)]
+    estimate = (hasher.signature(x) == hasher.signature(y)).mean()
+    assert abs(estimate - jaccard(x, y)) < 0.1
+
+
+def test_shingles_of_short_text():
+    assert len(shingle_hashes("two words", 5)) == 1
+    assert len(shingle_hashes("", 5)) == 1
+    assert len(shingle_hashes("a b c d e f", 5)) == 2
+
+
+def test_lsh_params_fit_signature():
+    for threshold in (0.5, 0.8, 0.9):
+        bands, rows = lsh_params(threshold, 128)
+        assert bands * rows <= 128
+    # stricter thresholds need longer bands
+    assert lsh_params(0.9, 128)[1] > lsh_params(0.5, 128)[1]
+
+
+def test_cluster_compares_past_a_dissimilar_bucket_head():
+    signatures = np.array(
+        [[1] * 10, [2] * 10, [2] * 9 + [3], [4] * 10, [2] * 8 + [5] * 2],
+        dtype=np.uint32,
+    )
+    # one band in which every record collides; record 0 sorts first
+    keys = np.zeros((5, 1), dtype=np.uint64)
+    assert cluster(signatures, keys, 0.8).tolist() == [0, 1, 1, 3, 1]
+
+
+def test_cluster_report():
+    report = cluster_report(np.array([0, 0, 2, 0, 4, 4]))
+    assert report["records"] == 6
+    assert report["clusters"] == 3
+    assert report["removed"] == 3
+    assert report["cluster_sizes"] == {"1": 1, "2": 1, "3": 1}
+    assert report["largest_clusters"][0] == {"representative": 0, "size": 3}
+
+
+def test_near_dedup_drops_near_duplicates(tmp_path):
+    records = [
+        {"question": "How do I roll back?", "answer": BASE},
+        {"question": "Unrelated", "answer": "Set resources requests and limits " * 3},
+        {"question": "How to roll back?", "answer": BASE + " today"},
+        {"question": "Rollback", "answer": BASE.replace("production", "prod")},
+        {"question": "Other", "answer": "Mount a ConfigMap as a volume in the pod"},
+    ]
+    src = tmp_path / "in.jsonl"
+    src.write_text("".join(json.dumps(r) + "\n" for r in records))
+    dst = tmp_path / "out" / "near.jsonl"
+
+    report = near_dedup(str(src), str(dst), workdir=str(tmp_path))
+
+    kept = [json.loads(line) for line in dst.read_text().splitlines()]
+    assert [r["question"] for r in kept] == [
+        "How do I roll back?",
+        "Unrelated",
+        "Other",
+    ]
+    assert report["records"] == 5
+    assert report["removed"] == 2
+    assert report["largest_clusters"] == [{"representative": 0, "size": 3}]
+    # temporary signature arrays are cleaned up
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["in.jsonl", "out"]
+
+
+def test_near_dedup_empty_input(tmp_path):
+    src = tmp_path / "in.jsonl"
+    src.write_text("")
+    report = near_dedup(str(src), str(tmp_path / "out.jsonl"))
+    assert report["records"] == 0
+    assert (tmp_path / "out.jsonl").read_text() == ""
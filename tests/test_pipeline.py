@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+from scripts.pipeline import Pipeline, load_config, to_argv
+
+ANSWER = "Run kubectl rollout undo deployment to go back one revision number {}"
+
+
+def write_raw(path, questions):
+    records = [
+        {
+            "title": f"How do I roll back release {q}?",
+            "body": f"<p>{ANSWER.format(q)}</p>",
+        }
+        for q in questions
+    ]
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+
+
+@pytest.fixture
+def config(tmp_path):
+    (tmp_path / "raw").mkdir()
+    write_raw(tmp_path / "raw" / "a.jsonl", range(3))
+    write_raw(tmp_path / "raw" / "b.jsonl", range(3, 5))
+    config = load_config()
+    config.update(
+        raw_dir=str(tmp_path / "raw"),
+        clean_dir=str(tmp_path / "clean"),
+        combined=str(tmp_path / "clean" / "combined.jsonl"),
+        state=str(tmp_path / "state.json"),
+    )
+    config["clean"].update(min_tokens=3, stripper="fast")
+    return config
+
+
+def run(config, **kwargs):
+    pipeline = Pipeline(config, **kwargs)
+    pipeline.run_until("merge")
+    return pipeline.ran
+
+
+def test_to_argv():
+    params = {"max_tokens": 512, "shuffle": True, "seed": None, "tags": ["a", "b"]}
+    assert to_argv(params) == ["--max-tokens", "512", "--shuffle", "--tags", "a", "b"]
+
+
+def test_load_config_merges_sections(tmp_path):
+    path = tmp_path / "pipeline.yaml"
+    path.write_text("clean:\n  stripper: fast\nraw_dir: elsewhere\n")
+    config = load_config(str(path))
+    assert config["raw_dir"] == "elsewhere"
+    assert config["clean"] == {"min_tokens": 10, "max_tokens": 512, "stripper": "fast"}
+
+
+def test_pipeline_reruns_only_changed_stages(config, tmp_path):
+    raw_a = config["raw_dir"] + "/a.jsonl"
+    raw_b = config["raw_dir"] + "/b.jsonl"
+    assert run(config) == [f"clean:{raw_a}", f"clean:{raw_b}", "merge"]
+    combined = tmp_path / "clean" / "combined.jsonl"
+    assert len(combined.read_text().splitlines()) == 5
+
+    # nothing changed
+    assert run(config) == []
+
+    # only the changed raw file is re-cleaned
+    write_raw(tmp_path / "raw" / "b.jsonl", range(3, 7))
+    assert run(config) == [f"clean:{raw_b}", "merge"]
+    assert len(combined.read_text().splitlines()) == 7
+
+    # a runtime-only parameter does not invalidate outputs, a real one does
+    config["clean"]["workers"] = 2
+    assert run(config) == []
+    config["merge"]["shuffle"] = True
+    assert run(config) == ["merge"]
+
+    # deleting a raw file prunes its cleaned output
+    (tmp_path / "raw" / "a.jsonl").unlink()
+    assert run(config) == ["merge"]
+    assert not (tmp_path / "clean" / "a_clean.jsonl").exists()
+    assert len(combined.read_text().splitlines()) == 4
+
+
+def test_pipeline_reruns_when_output_changes_or_forced(config, tmp_path):
+    run(config)
+    combined = tmp_path / "clean" / "combined.jsonl"
+    combined.write_text("")
+    assert run(config) == ["merge"]
+    assert run(config, force=["merge"]) == ["merge"]
+
+
+def test_pipeline_dry_run_reports_downstream(config, tmp_path):
+    run(config)
+    write_raw(tmp_path / "raw" / "a.jsonl", range(2))
+    state = (tmp_path / "state.json").read_text()
+    ran = run(config, dry_run=True)
+    assert ran == [f"clean:{config['raw_dir']}/a.jsonl", "merge"]
+    assert (tmp_path / "state.json").read_text() == state
+
+
+def test_stage_code_covers_imported_modules(config, monkeypatch):
+    pipeline = Pipeline(config)
+    calls = {}
+    monkeypatch.setattr(
+        pipeline,
+        "run",
+        lambda name, module, *args, code=(), **kw: calls.update({name: code}),
+    )
+    pipeline.merge()
+    pipeline.prepare()
+    assert calls == {"merge": ["scripts.clean_data"], "prepare": ["scripts.stats"]}
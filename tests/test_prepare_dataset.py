@@ -1,18 +1,27 @@
 import json
+from collections import Counter
+from pathlib import Path
 
 import pytest
 
-from scripts.prepare_dataset import prepare_dataset
+from scripts.prepare_dataset import (pack_examples, prepare_dataset,
+                                     tokens_per_step)
 
 
 class DummyDataset:
     column_names = ["question", "answer"]
+    map_calls = []
 
-    def map(self, fn, batched, remove_columns):
+    def map(self, fn, batched, remove_columns, **kwargs):
         # Simulate tokenization mapping
+        DummyDataset.map_calls.append(kwargs)
+
         class Mapped:
-            def save_to_disk(self, output_dir):
-                pass
+            def __len__(self):
+                return 1
+
+            def save_to_disk(self, output_dir, **kwargs):
+                (Path(output_dir) / "state.json").write_text("{}")
 
         return Mapped()
 
@@ -26,6 +35,7 @@ def patch_hf(monkeypatch, tmp_path):
         for rec in data:
             f.write(json.dumps(rec) + "\n")
 
+    DummyDataset.map_calls = []
     monkeypatch.setenv("HF_DATASETS_OFFLINE", "1")
     monkeypatch.setenv("TRANSFORMERS_OFFLINE", "1")
     monkeypatch.setattr(
@@ -56,3 +66,60 @@ def test_prepare_dataset_creates_output_dir(tmp_path, patch_hf):
         max_length=16,
     )
     assert output_dir.exists()
+
+
+def test_prepare_dataset_reuses_matching_fingerprint(tmp_path, patch_hf):
+    kwargs = dict(
+        input_path=str(patch_hf),
+        output_dir=str(tmp_path / "out"),
+        model_name_or_path="dummy-model",
+        max_length=16,
+        num_proc=2,
+        cache_dir=str(tmp_path / "cache"),
+    )
+    first = prepare_dataset(**kwargs)
+    assert not first["reused"] and first["examples"] == 1
+    call = DummyDataset.map_calls[0]
+    assert call["num_proc"] == 2
+    assert call["cache_file_name"].startswith(str(tmp_path / "cache"))
+
+    # same input, tokenizer and max_length: the saved dataset is kept
+    assert prepare_dataset(**kwargs)["reused"]
+    assert len(DummyDataset.map_calls) == 1
+
+    # changed input or settings re-tokenize under a new fingerprint
+    patch_hf.write_text('{"question": "Q2?", "answer": "A2."}\n')
+    second = prepare_dataset(**kwargs)
+    assert not second["reused"]
+    assert second["fingerprint"] != first["fingerprint"]
+    assert not prepare_dataset(**dict(kwargs, max_length=32))["reused"]
+    assert not prepare_dataset(**dict(kwargs, max_length=32), force=True)["reused"]
+    assert len(DummyDataset.map_calls) == 4
+
+
+def test_pack_examples_fits_rows_and_keeps_every_example():
+    inputs = [[i] * n for i, n in enumerate([6, 2, 3, 1, 5, 4], 1)]
+    labels = [[-i] * n for i, n in enumerate([1, 5, 2, 2, 3, 1], 1)]
+    packed = pack_examples(inputs, labels, max_length=8)
+    assert len(packed["input_ids"]) == 3
+    seen = []
+    for row in zip(*(packed[k] for k in packed)):
+        input_ids, segment_ids, row_labels, label_segment_ids = row
+        assert len(input_ids) <= 8 and len(row_labels) <= 8
+        assert len(segment_ids) == len(input_ids)
+        assert len(label_segment_ids) == len(row_labels)
+        for segment in sorted(set(segment_ids)):
+            tokens = [t for t, s in zip(input_ids, segment_ids) if s == segment]
+            targets = [t for t, s in zip(row_labels, label_segment_ids) if s == segment]
+            assert tokens == inputs[tokens[0] - 1]
+            assert targets == labels[tokens[0] - 1]
+            seen.append(tokens[0])
+    assert sorted(seen) == [1, 2, 3, 4, 5, 6]
+
+
+def test_tokens_per_step():
+    report = tokens_per_step(Counter({2: 2, 4: 2}), Counter({1: 4}), batch_size=2)
+    assert report["rows"] == 4 and report["steps_per_epoch"] == 2
+    assert report["effective_tokens_per_step"] == 8.0
+    # inputs pad to an expected max of 3.5 per row, labels are never padded
+    assert report["padded_tokens_per_step"] == pytest.approx(9.0, abs=0.01)
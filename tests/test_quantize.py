@@ -1,8 +1,12 @@
 import json
 
 import pytest
+import torch
 
-from src.quantize import evaluate_baseline, load_prompts
+from src.quantize import (WeightOnlyLinear, _pack_int4, _unpack_int4,
+                          evaluate_baseline, load_prompts, load_quantized,
+                          quantize_model, save_quantized, weights_size,
+                          write_quant_stats)
 
 
 def test_load_prompts(tmp_path):
@@ -45,3 +49,80 @@ def test_evaluate_baseline_empty(monkeypatch, prompts):
     assert isinstance(out, list)
     for r in out:
         assert "prompt" in r and "loss" in r and "response" in r
+
+
+def test_int4_pack_roundtrip():
+    q = torch.randint(-8, 8, (4, 7), dtype=torch.int8)
+    packed = _pack_int4(q)
+    assert packed.shape == (4, 4)
+    assert torch.equal(_unpack_int4(packed, 7), q)
+
+
+@pytest.mark.parametrize("bits,atol", [(8, 0.05), (4, 0.5)])
+def test_weight_only_linear_close_to_float(bits, atol):
+    torch.manual_seed(0)
+    linear = torch.nn.Linear(16, 8)
+    layer = WeightOnlyLinear.from_linear(linear, bits)
+    x = torch.randn(3, 16)
+    assert torch.allclose(layer(x), linear(x), atol=atol)
+    assert layer.weight.shape == linear.weight.shape
+
+
+def test_weight_only_linear_dequantizes_in_row_blocks(monkeypatch):
+    torch.manual_seed(0)
+    layer = WeightOnlyLinear.from_linear(torch.nn.Linear(16, 10), 4)
+    x = torch.randn(3, 16)
+    expected = layer(x)
+    monkeypatch.setattr("src.quantize.DEQUANT_ROWS", 3)
+    assert torch.allclose(layer(x), expected, atol=1e-6)
+
+
+def test_save_and_load_quantized_roundtrip(tmp_path):
+    from transformers import T5Config, T5ForConditionalGeneration
+
+    config = T5Config(
+        vocab_size=32,
+        d_model=16,
+        d_kv=8,
+        d_ff=32,
+        num_layers=1,
+        num_heads=2,
+        decoder_start_token_id=0,
+    )
+    model = quantize_model(T5ForConditionalGeneration(config).eval(), "weight-int4")
+
+    class DummyTok:
+        def save_pretrained(self, path):
+            pass
+
+    save_quantized(model, DummyTok(), str(tmp_path), "weight-int4", "seq2seq")
+    loaded = load_quantized(str(tmp_path))
+    ids = torch.tensor([[1, 2, 3]])
+    with torch.inference_mode():
+        expected = model.generate(input_ids=ids, max_length=5)
+        actual = loaded.generate(input_ids=ids, max_length=5)
+    assert torch.equal(expected, actual)
+
+
+def test_write_quant_stats(tmp_path):
+    out = tmp_path / "eval" / "quant_stats.md"
+    stats = {
+        "size_before": 4 * 2**20,
+        "size_after": 2**20,
+        "rss_before": 300 * 2**20,
+        "rss_after": 200 * 2**20,
+    }
+    write_quant_stats(str(out), "dynamic-int8", stats)
+    text = out.read_text(encoding="utf8")
+    assert "**Reduction ratio**: 4.00x" in text
+    assert "**Peak memory usage (dynamic-int8)**: 200.0 MB" in text
+
+
+def test_weights_size_counts_top_level_weight_files(tmp_path):
+    (tmp_path / "model.safetensors").write_bytes(b"x" * 10)
+    (tmp_path / "pytorch_model-00001-of-00002.bin").write_bytes(b"x" * 5)
+    (tmp_path / "config.json").write_bytes(b"x" * 100)
+    (tmp_path / "checkpoint-500").mkdir()
+    (tmp_path / "checkpoint-500" / "model.safetensors").write_bytes(b"x" * 10)
+    (tmp_path / "checkpoint-500" / "optimizer.pt").write_bytes(b"x" * 20)
+    assert weights_size(str(tmp_path)) == 15
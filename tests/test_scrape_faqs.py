@@ -1,9 +1,17 @@
+import asyncio
+import functools
 import json
+import os
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
+import httpx
 import pytest
 from bs4 import BeautifulSoup
 
-from scripts.scrape_faqs import scrape_faq_page
+from scripts.scrape_faqs import (HostThrottle, parse_faq_html, scrape_all,
+                                 scrape_faq_page)
 
 
 @pytest.mark.skip("placeholder HTML parsing test")
@@ -42,3 +50,161 @@ def test_scrape_faq_page_skip_example(monkeypatch):
     monkeypatch.setattr("scripts.scrape_faqs.requests.get", fake_get)
     result = scrape_faq_page("url")
     assert result == [{"question": "Q?", "answer": "A."}]
+
+
+@pytest.fixture
+def static_site(tmp_path):
+    """Serve ``tmp_path / "site"`` with http.server (Last-Modified support)."""
+    root = tmp_path / "site"
+    root.mkdir()
+    (root / "a.html").write_text("<h2>QA1?</h2><p>AA1.</p><h2>QA2?</h2><p>AA2.</p>")
+    (root / "b.html").write_text("<h3>QB?</h3><p>AB.</p>")
+    statuses = []
+
+    class Handler(SimpleHTTPRequestHandler):
+        def log_request(self, code="-", size="-"):
+            statuses.append((self.path, int(code)))
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(Handler, directory=str(root))
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", root, statuses
+    server.shutdown()
+    server.server_close()
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in open(path)]
+
+
+def test_scrape_all_revalidates_cached_pages(static_site, tmp_path):
+    base, root, statuses = static_site
+    urls = [f"{base}/a.html", f"{base}/b.html", f"{base}/missing.html"]
+    output = tmp_path / "raw" / "faqs.jsonl"
+    cache = str(tmp_path / "cache")
+
+    summary = asyncio.run(scrape_all(urls, str(output), cache, delay=0))
+    assert summary == {"records": 3, "fetched": 2, "not_modified": 0, "errors": 1}
+    first = read_jsonl(output)
+    assert [r["question"] for r in first] == ["QA1?", "QA2?", "QB?"]
+    assert first[2] == {"question": "QB?", "answer": "AB.", "url": urls[1]}
+
+    # unchanged pages cost a 304 and keep their Q&A pairs
+    statuses.clear()
+    summary = asyncio.run(scrape_all(urls[:2], str(output), cache, delay=0))
+    assert summary["not_modified"] == 2
+    assert sorted(statuses) == [("/a.html", 304), ("/b.html", 304)]
+    assert read_jsonl(output) == first
+
+    (root / "b.html").write_text("<h3>QB?</h3><p>AB updated.</p>")
+    later = time.time() + 10
+    os.utime(root / "b.html", (later, later))
+    summary = asyncio.run(scrape_all(urls[:2], str(output), cache, delay=0))
+    assert (summary["fetched"], summary["not_modified"]) == (1, 1)
+    assert read_jsonl(output)[2]["answer"] == "AB updated."
+
+
+def test_scrape_all_sends_etag(tmp_path):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(
+            200, text="<h2>Q?</h2><p>A.</p>", headers={"ETag": '"v1"'}
+        )
+
+    transport = httpx.MockTransport(handler)
+    output, cache = str(tmp_path / "faqs.jsonl"), str(tmp_path / "cache")
+    for _ in range(2):
+        summary = asyncio.run(
+            scrape_all(["http://faq.test/"], output, cache, transport=transport)
+        )
+    assert seen == [None, '"v1"']
+    assert summary["not_modified"] == 1
+    assert read_jsonl(output) == [
+        {"question": "Q?", "answer": "A.", "url": "http://faq.test/"}
+    ]
+
+
+def test_scrape_all_parses_off_the_loop_and_isolates_failures(tmp_path, monkeypatch):
+    import scripts.scrape_faqs as scrape_faqs
+
+    threads = []
+
+    def parse(html, parser="auto"):
+        threads.append(threading.get_ident())
+        if "broken" in html:
+            raise RuntimeError("parser bug")
+        return parse_faq_html(html, parser)
+
+    def handler(request):
+        if request.url.path == "/bad":
+            return httpx.Response(200, text="broken")
+        return httpx.Response(200, text="<h2>Q?</h2><p>A.</p>")
+
+    monkeypatch.setattr(scrape_faqs, "parse_faq_html", parse)
+    urls = ["http://a.test/bad", "http://b.test/ok", "http://c.test/ok"]
+    output = tmp_path / "faqs.jsonl"
+    summary = asyncio.run(
+        scrape_all(
+            urls,
+            str(output),
+            str(tmp_path / "cache"),
+            transport=httpx.MockTransport(handler),
+        )
+    )
+    assert summary == {"records": 2, "fetched": 2, "not_modified": 0, "errors": 1}
+    assert [r["url"] for r in read_jsonl(output)] == urls[1:]
+    assert len(threads) == 3 and threading.get_ident() not in threads
+
+
+def test_host_throttle_spaces_requests_per_host():
+    throttle = HostThrottle(per_host=1, delay=0.05)
+    starts = []
+
+    async def hit(host):
+        async with throttle.slot(host):
+            starts.append((host, asyncio.get_running_loop().time()))
+
+    async def run():
+        await asyncio.gather(*(hit(h) for h in ["a", "a", "a", "b"]))
+
+    asyncio.run(run())
+    a_times = [t for host, t in starts if host == "a"]
+    assert a_times[2] - a_times[0] >= 0.099
+    # another host is not held back
+    assert [t for host, t in starts if host == "b"][0] - a_times[0] < 0.05
+
+
+@pytest.mark.parametrize("parser", ["html.parser", "lxml"])
+def test_parse_faq_html_layouts(parser):
+    html = """
+<h1>FAQ</h1>
+<h2>Q1?</h2><p>A1.</p><div>skipped</div><p>A1b.</p>
+<h3>Q2?</h3><p>A2.</p>
+<h2>Empty?</h2>
+<section><h3>Nested?</h3><p>In section.</p></section>
+<dl><dt>Term?</dt><dd>Def one.</dd><dd>Def two.</dd><dt>No answer</dt></dl>
+<details><summary>Open me?</summary><p>Hidden answer.</p> tail</details>
+"""
+    assert parse_faq_html(html, parser) == [
+        {"question": "Q1?", "answer": "A1. A1b."},
+        {"question": "Q2?", "answer": "A2."},
+        {"question": "Nested?", "answer": "In section."},
+        {"question": "Term?", "answer": "Def one. Def two."},
+        {"question": "Open me?", "answer": "Hidden answer. tail"},
+    ]
+
+
+@pytest.mark.parametrize("parser", ["html.parser", "lxml"])
+def test_parse_faq_html_details_skips_comments(parser):
+    html = (
+        "<details><summary>Why?</summary><!-- editor note -->"
+        "<![CDATA[raw]]><p>Because.</p> more</details>"
+    )
+    assert parse_faq_html(html, parser) == [
+        {"question": "Why?", "answer": "Because. more"}
+    ]
@@ -0,0 +1,112 @@
+import json
+from collections import Counter
+
+import pytest
+
+from scripts.stats import (HyperLogLog, compute_stats, iter_range_records,
+                           iter_ranges, length_summary, padding_waste)
+
+
+def write_jsonl(path, n):
+    records = [
+        {"question": f"how to q{i} " + "x " * (i % 5), "answer": f"use a{i} now"}
+        for i in range(n)
+    ]
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+    return records
+
+
+def test_hyperloglog_estimate_and_merge():
+    a, b = HyperLogLog(), HyperLogLog()
+    a.update(str(i) for i in range(30000))
+    b.update(str(i) for i in range(20000, 50000))
+    assert abs(len(a) - 30000) / 30000 < 0.03
+    a.merge(b)
+    assert abs(len(a) - 50000) / 50000 < 0.03
+    small = HyperLogLog()
+    small.update(["a", "b", "c", "a"])
+    assert len(small) == 3
+
+
+def test_ranges_cover_every_line_once(tmp_path):
+    path = tmp_path / "data.jsonl"
+    records = write_jsonl(path, 200)
+    ranges = list(iter_ranges([str(path)], chunk_bytes=97))
+    assert len(ranges) > 10
+    seen = [rec for r in ranges for rec in iter_range_records(*r)]
+    assert seen == records
+
+
+def test_compute_stats_exact(tmp_path):
+    path = tmp_path / "data.jsonl"
+    write_jsonl(path, 10)
+    stats = compute_stats(str(path))
+    assert stats["num_records"] == 10
+    assert stats["avg_q_tokens"] == pytest.approx(
+        3 + sum(i % 5 for i in range(10)) / 10
+    )
+    assert stats["avg_a_tokens"] == 3
+    # how to use now x + q0..q9 + a0..a9
+    assert stats["vocab_size"] == 25
+    assert "question_tokens" not in stats
+
+
+def test_compute_stats_shards_and_workers_agree(tmp_path):
+    write_jsonl(tmp_path / "combined.jsonl", 300)
+    (tmp_path / "shards").mkdir()
+    lines = (tmp_path / "combined.jsonl").read_text().splitlines(keepends=True)
+    for i in range(3):
+        (tmp_path / "shards" / f"combined-{i:05d}-of-00003.jsonl").write_text(
+            "".join(lines[i::3])
+        )
+    single = compute_stats(str(tmp_path / "combined.jsonl"))
+    sharded = compute_stats(
+        str(tmp_path / "shards" / "combined-*.jsonl"), workers=2, chunk_bytes=512
+    )
+    assert sharded == single
+    estimated = compute_stats(str(tmp_path / "combined.jsonl"), distinct="hll")
+    assert estimated["vocab_estimated"]
+    assert abs(estimated["vocab_size"] - single["vocab_size"]) <= 3
+
+
+def test_length_summary_percentiles():
+    lengths = Counter({i: 1 for i in range(1, 101)})
+    summary = length_summary(lengths, max_length=90)
+    assert summary["mean"] == 50.5
+    assert (summary["p50"], summary["p90"], summary["p99"]) == (50, 90, 99)
+    assert summary["max"] == 100
+    assert summary["truncated_pct"] == 10.0
+
+
+def test_padding_waste():
+    # half the sequences have 2 tokens, half 4 (one truncated from 6)
+    lengths = Counter({2: 2, 4: 1, 6: 1})
+    waste = padding_waste(lengths, max_length=4, batch_size=2)
+    assert waste["max_length"] == pytest.approx(0.25)
+    # P(max=4) = 1 - 0.5**2, so E[max] = 3.5 and mean = 3
+    assert waste["dynamic"] == pytest.approx(1 - 3 / 3.5, abs=1e-4)
+    assert waste["sorted"] == 0
+
+
+def test_compute_stats_with_tokenizer(tmp_path):
+    tokenizers = pytest.importorskip("tokenizers")
+    transformers = pytest.importorskip("transformers")
+    path = tmp_path / "data.jsonl"
+    write_jsonl(path, 20)
+    vocab = {"[UNK]": 0, "[PAD]": 1, "how": 2, "to": 3, "use": 4, "now": 5, "x": 6}
+    model = tokenizers.models.WordLevel(vocab, unk_token="[UNK]")
+    backend = tokenizers.Tokenizer(model)
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tokenizer = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=backend, unk_token="[UNK]", pad_token="[PAD]"
+    )
+    tokenizer.save_pretrained(str(tmp_path / "tok"))
+
+    stats = compute_stats(
+        str(path), tokenizer=str(tmp_path / "tok"), max_length=4, batch_size=4
+    )
+    assert stats["answer_tokens"]["max"] == 3
+    assert stats["question_tokens"]["max"] == 7
+    assert stats["question_tokens"]["truncated_pct"] == 60.0
+    assert stats["padding_waste"]["answer"]["max_length"] == pytest.approx(0.25)
+    assert stats["padding_waste"]["question"]["sorted"] == 0
@@ -1,6 +1,10 @@
+import copy
+
 import pytest
+import torch
 
-from scripts.train_model import train_model
+from scripts.train_model import (PackedSeq2SeqCollator,
+                                 enable_packed_attention, train_model)
 
 
 class DummyModel:
@@ -70,3 +74,120 @@ def test_train_model_flow(monkeypatch, tmp_path):
     )
     assert calls.get("trained") is True
     assert calls.get("saved") == str(out_dir)
+
+
+def test_packed_collator_restarts_decoder_per_segment():
+    collator = PackedSeq2SeqCollator(pad_token_id=0, decoder_start_token_id=0)
+    batch = collator(
+        [
+            {
+                "input_ids": [5, 6, 1, 7, 1],
+                "segment_ids": [1, 1, 1, 2, 2],
+                "labels": [20, 1, 21, 22, 1],
+                "label_segment_ids": [1, 1, 2, 2, 2],
+            },
+            {
+                "input_ids": [8, 1],
+                "segment_ids": [1, 1],
+                "labels": [23, 1],
+                "label_segment_ids": [1, 1],
+            },
+        ]
+    )
+    assert batch["decoder_input_ids"].tolist() == [[0, 20, 0, 21, 22], [0, 23, 0, 0, 0]]
+    assert batch["labels"][1].tolist() == [23, 1, -100, -100, -100]
+    assert batch["attention_mask"].tolist() == [[1] * 5, [1, 1, 0, 0, 0]]
+
+
+def tiny_t5():
+    from transformers import T5Config, T5ForConditionalGeneration
+
+    torch.manual_seed(0)
+    config = T5Config(
+        vocab_size=40,
+        d_model=16,
+        d_ff=32,
+        d_kv=8,
+        num_layers=2,
+        num_heads=2,
+        decoder_start_token_id=0,
+    )
+    return T5ForConditionalGeneration(config).eval()
+
+
+PACKED_INPUTS, PACKED_LABELS = [[5, 6, 7, 1], [8, 9, 1]], [[20, 21, 1], [22, 1]]
+
+
+def packed_batch():
+    return PackedSeq2SeqCollator(0, 0)(
+        [
+            {
+                "input_ids": PACKED_INPUTS[0] + PACKED_INPUTS[1],
+                "segment_ids": [1] * 4 + [2] * 3,
+                "labels": PACKED_LABELS[0] + PACKED_LABELS[1],
+                "label_segment_ids": [1] * 3 + [2] * 2,
+            }
+        ]
+    )
+
+
+def test_packed_attention_matches_unpacked_examples():
+    model = tiny_t5()
+    with torch.no_grad():
+        expected = [
+            model(input_ids=torch.tensor([x]), labels=torch.tensor([y])).logits[0]
+            for x, y in zip(PACKED_INPUTS, PACKED_LABELS)
+        ]
+        logits = enable_packed_attention(model)(**packed_batch()).logits[0]
+    assert torch.allclose(logits[:3], expected[0], atol=1e-5)
+    assert torch.allclose(logits[3:], expected[1], atol=1e-5)
+
+
+def test_packed_attention_works_with_trainer_loss_kwargs():
+    from transformers import Trainer
+
+    model = enable_packed_attention(tiny_t5())
+    assert model.accepts_loss_kwargs is False
+    # what Trainer.compute_loss passes when it thinks the model takes loss kwargs
+    fake_trainer = type("FakeTrainer", (), {})()
+    fake_trainer.label_smoother = fake_trainer.compute_loss_func = None
+    fake_trainer.model_accepts_loss_kwargs = True
+    fake_trainer.args = type("Args", (), {"past_index": -1})()
+    fake_trainer.args.average_tokens_across_devices = False
+    with torch.no_grad():
+        expected = model(**packed_batch()).loss
+        loss = Trainer.compute_loss(
+            fake_trainer, model, packed_batch(), num_items_in_batch=torch.tensor(5)
+        )
+    assert torch.allclose(loss, expected)
+
+
+def test_packed_attention_survives_copies():
+    model = enable_packed_attention(tiny_t5())
+    clone = copy.deepcopy(model)
+    with torch.no_grad():
+        clone.shared.weight.add_(1.0)
+        original = model(**packed_batch()).logits
+        copied = clone(**packed_batch()).logits
+    assert not torch.allclose(original, copied)
+    # DataParallel builds replicas by copying the instance __dict__
+    replica = model._replicate_for_data_parallel()
+    assert replica.forward.__self__ is replica
+    assert type(model).__name__ == "T5ForConditionalGeneration"
+
+
+def test_packed_attention_rejects_other_architectures():
+    from transformers import BartConfig, BartForConditionalGeneration
+
+    config = BartConfig(
+        vocab_size=40,
+        d_model=16,
+        encoder_layers=1,
+        decoder_layers=1,
+        encoder_attention_heads=2,
+        decoder_attention_heads=2,
+        encoder_ffn_dim=32,
+        decoder_ffn_dim=32,
+    )
+    with pytest.raises(ValueError, match="only supported for T5"):
+        enable_packed_attention(BartForConditionalGeneration(config))